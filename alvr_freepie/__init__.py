@@ -0,0 +1,4 @@
+# Shared helpers for the ALVR FreePIE scripts.
+#
+# Copy this folder into FreePIE's "pylib" folder (or any folder on the
+# IronPython search path) so the scripts can import it.
@@ -0,0 +1,241 @@
+# Virtual arm model shared by the ALVR FreePIE scripts.
+#
+# PoseContext holds everything derived from the head pose for one frame so
+# that every controller of that frame reuses it:
+#
+#   if starting:
+#       ctx = PoseContext(2)
+#   ctx.begin_frame(alvr.input_head_orientation, alvr.head_position)
+#   calc_arm_model_into(ctx, orientation, +1, arm_roll, out, 0)
+#   calc_arm_model_into(ctx, other_orientation, -1, arm_roll, out2, 1)
+#
+# ArmModelBatch evaluates the arm model for N controllers in one pass. It uses
+# NumPy when it is available (CPython) and falls back to calc_arm_model_into
+# over preallocated rows otherwise (IronPython inside FreePIE). NumPy's per
+# call overhead only pays off from about NUMPY_MIN_COUNT controllers on.
+#
+# arm_model_rows evaluates it for many frames at once, each row with its own
+# head pose (offline processing, see alvr_freepie.batch).
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMPY_MIN_COUNT = 16
+
+from alvr_freepie.quatmath import (new_quat, new_vec, euler2quaternion_into,
+    q_extract_axis_into, q_rotatevec_into, rotatevec_into, get_normalized_roll_into)
+
+
+class PoseContext(object):
+    __slots__ = ("head_position", "q_head_pitch", "head_computations",
+                 "roll_computations", "_roll_in", "_roll_out", "_roll_q",
+                 "_hand", "_elbow")
+
+    def __init__(self, slots):
+        self.head_position = [0.0, 0.0, 0.0]
+        self.q_head_pitch = new_quat()
+        # number of times the head terms / a normalized roll were computed
+        self.head_computations = 0
+        self.roll_computations = 0
+        # last orientation and normalized roll per controller slot
+        self._roll_in = [[None, None, None] for _ in range(slots)]
+        self._roll_out = [0.0] * slots
+        # scratch quaternions of get_normalized_roll_into
+        self._roll_q = (new_quat(), new_quat(), new_quat())
+        self._hand = new_vec()
+        self._elbow = new_vec()
+
+    # compute the head derived terms once for the current frame
+    def begin_frame(self, head_orientation, head_position):
+        q = euler2quaternion_into(head_orientation, self.q_head_pitch)
+        # extract only pitch out of quaternion
+        q_extract_axis_into(q, 1, q)
+        self.head_position[0] = head_position[0]
+        self.head_position[1] = head_position[1]
+        self.head_position[2] = head_position[2]
+        self.head_computations += 1
+
+    # get_normalized_roll of yaw_pitch_roll, reusing the previous result of
+    # this slot while the orientation is unchanged
+    def normalized_roll(self, yaw_pitch_roll, slot):
+        last = self._roll_in[slot]
+        yaw = yaw_pitch_roll[0]
+        pitch = yaw_pitch_roll[1]
+        roll = yaw_pitch_roll[2]
+        if last[0] == yaw and last[1] == pitch and last[2] == roll:
+            return self._roll_out[slot]
+        last[0] = yaw
+        last[1] = pitch
+        last[2] = roll
+        q, q_axis, q_norm = self._roll_q
+        result = get_normalized_roll_into(yaw_pitch_roll, q, q_axis, q_norm)
+        self._roll_out[slot] = result
+        self.roll_computations += 1
+        return result
+
+
+# calculate virtual arm model with shoulder, elbow, arm forward rotation and hand
+# and write the controller position into out
+def calc_arm_model_into(ctx, controller_orientation, leftright, upper_arm_roll, out, slot):
+
+    # hand stretches when arm is rotated forward to reach further
+    hand = ctx._hand
+    hand[0] = 0.0
+    hand[1] = 0.0
+    hand[2] = -0.25 - 0.25*math.sin(upper_arm_roll)
+    hand = rotatevec_into(controller_orientation, hand, hand)
+
+    # rotate virtual elbow according to arm roll
+    roll = ctx.normalized_roll(controller_orientation, slot)
+    if roll < 0.0:
+        arm_roll = upper_arm_roll + roll # your elbow limits your possible hand rotation
+    else:
+        arm_roll = upper_arm_roll
+    if arm_roll < 0.0:
+        arm_roll = 0.0
+    # [0, -0.25, 0] rotated around the roll axis, attached to the fixed
+    # left/right shoulder [0.2*leftright, -0.10, -0.05]
+    elbow = ctx._elbow
+    elbow[0] = 0.2*leftright
+    elbow[1] = -0.25*math.cos(arm_roll) - 0.10
+    elbow[2] = -0.25*math.sin(arm_roll) - 0.05
+
+    # rotate virtual elbow according to head pitch
+    elbow = q_rotatevec_into(ctx.q_head_pitch, elbow, elbow)
+
+    head = ctx.head_position
+    out[0] = head[0] + elbow[0] + hand[0]
+    out[1] = head[1] + elbow[1] + hand[1]
+    out[2] = head[2] + elbow[2] + hand[2]
+    return out
+
+
+class ArmModelBatch(object):
+    __slots__ = ("count", "use_numpy", "positions", "_orientations",
+                 "_sides", "_arm_rolls")
+
+    # use_numpy: None = use NumPy if it can be imported and count is large
+    # enough for it to be faster
+    def __init__(self, count, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None and count >= NUMPY_MIN_COUNT
+        elif use_numpy and numpy is None:
+            raise ImportError("NumPy is not available")
+        self.count = count
+        self.use_numpy = use_numpy
+        if use_numpy:
+            self.positions = numpy.zeros((count, 3))
+            self._orientations = numpy.zeros((count, 3))
+            self._sides = numpy.zeros(count)
+            self._arm_rolls = numpy.zeros(count)
+        else:
+            self.positions = [[0.0, 0.0, 0.0] for _ in range(count)]
+            self._orientations = None
+            self._sides = None
+            self._arm_rolls = None
+
+    # arm model positions of all controllers; ctx must be prepared with
+    # begin_frame and, for the pure Python path, have at least count slots.
+    # orientations are yaw_pitch_roll triples, sides +1/-1 and arm_rolls the
+    # upper arm roll of each controller. Returns self.positions (count x 3).
+    def solve(self, ctx, orientations, sides, arm_rolls):
+        if not self.use_numpy:
+            positions = self.positions
+            for i in range(self.count):
+                calc_arm_model_into(ctx, orientations[i], sides[i], arm_rolls[i],
+                                    positions[i], i)
+            return positions
+        self._orientations[:] = orientations
+        self._sides[:] = sides
+        self._arm_rolls[:] = arm_rolls
+        _solve_numpy(ctx.q_head_pitch, ctx.head_position, self._orientations,
+                     self._sides, self._arm_rolls, self.positions)
+        return self.positions
+
+
+# arm model positions (n x 3 array out) of n frames with NumPy: row i uses
+# head_orientation[i], head_position[i] and orientations[i] (n x 3 arrays);
+# sides and arm_rolls are scalars or length n arrays
+def arm_model_rows(head_orientation, head_position, orientations, sides, arm_rolls, out):
+    half = head_orientation * 0.5
+    c = numpy.cos(half)
+    s = numpy.sin(half)
+    cy = c[:, 0]; sy = s[:, 0]
+    cp = c[:, 1]; sp = s[:, 1]
+    cr = c[:, 2]; sr = s[:, 2]
+    # extract only pitch out of the head quaternion
+    qy = cy * cr * sp + sy * sr * cp
+    qw = cy * cr * cp + sy * sr * sp
+    mag = numpy.sqrt(qw*qw + qy*qy)
+    q_head_pitch = (0.0, qy / mag, 0.0, qw / mag)
+    head = (head_position[:, 0], head_position[:, 1], head_position[:, 2])
+    return _solve_numpy(q_head_pitch, head, orientations, sides, arm_rolls, out)
+
+
+# quaternions (qx, qy, qz, qw arrays) of the yaw_pitch_roll rows
+def _quaternion_rows(ypr):
+    half = ypr * 0.5
+    c = numpy.cos(half)
+    s = numpy.sin(half)
+    cy = c[:, 0]; sy = s[:, 0]
+    cp = c[:, 1]; sp = s[:, 1]
+    cr = c[:, 2]; sr = s[:, 2]
+    return (cy * sr * cp - sy * cr * sp, cy * cr * sp + sy * sr * cp,
+            sy * cr * cp - cy * sr * sp, cy * cr * cp + sy * sr * sp)
+
+# get_normalized_roll of the rows of quaternion arrays, expanded for the
+# extracted pitch / yaw quaternions: remove pitch, then yaw
+def _normalized_roll_rows(qx, qy, qz, qw):
+    m = numpy.sqrt(qw*qw + qy*qy)
+    a = qy / m; b = qw / m
+    x1 = qx * b - qz * a
+    y1 = qy * b - qw * a
+    z1 = qx * a + qz * b
+    w1 = qy * a + qw * b
+    m = numpy.sqrt(qw*qw + qz*qz)
+    a = qz / m; b = qw / m
+    x2 = x1 * b + y1 * a
+    y2 = y1 * b - x1 * a
+    z2 = z1 * b - w1 * a
+    w2 = z1 * a + w1 * b
+    return numpy.arctan2(2.0 * (w2 * x2 + y2 * z2), 1.0 - 2.0 * (x2 * x2 + y2 * y2))
+
+# vectorized calc_arm_model_into; same formulas. The head pitch quaternion
+# and head position components are scalars or per row arrays.
+def _solve_numpy(q_head_pitch, head, ypr, sides, upper_arm_rolls, out):
+    qx, qy, qz, qw = _quaternion_rows(ypr)
+
+    # hand [0, 0, hz] rotated by the controller orientation
+    hz = -0.25 - 0.25*numpy.sin(upper_arm_rolls)
+    tx = 2.0 * qy * hz
+    ty = -2.0 * qx * hz
+    hand_x = qw * tx - qz * ty
+    hand_y = qw * ty + qz * tx
+    hand_z = hz + (qx * ty - qy * tx)
+
+    roll = _normalized_roll_rows(qx, qy, qz, qw)
+
+    # your elbow limits your possible hand rotation
+    arm_roll = numpy.where(roll < 0.0, upper_arm_rolls + roll, upper_arm_rolls)
+    arm_roll = numpy.maximum(arm_roll, 0.0)
+    ex = 0.2*sides
+    ey = -0.25*numpy.cos(arm_roll) - 0.10
+    ez = -0.25*numpy.sin(arm_roll) - 0.05
+
+    # rotate virtual elbow according to head pitch
+    px, py, pz, pw = q_head_pitch
+    tx = 2.0 * (py * ez - pz * ey)
+    ty = 2.0 * (pz * ex - px * ez)
+    tz = 2.0 * (px * ey - py * ex)
+    elbow_x = ex + pw * tx + (py * tz - pz * ty)
+    elbow_y = ey + pw * ty + (pz * tx - px * tz)
+    elbow_z = ez + pw * tz + (px * ty - py * tx)
+
+    out[:, 0] = head[0] + elbow_x + hand_x
+    out[:, 1] = head[1] + elbow_y + hand_y
+    out[:, 2] = head[2] + elbow_z + hand_z
+    return out
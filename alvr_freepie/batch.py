@@ -0,0 +1,380 @@
+# Offline batch processing of recorded sessions.
+#
+# Runs the pose chain of a profile (see alvr_freepie.pipeline) over every
+# record of a session file (see alvr_freepie.session): PS Move to ALVR euler
+# conversion and calibration rotation, PS Eye scale / calibration matrix and
+# offsets, the calibration lever arm of the head device, head position and
+# virtual arm model. Records are decoded and transformed with NumPy `chunk`
+# records at a time and each output is appended to its own column file, so
+# memory use stays the same for sessions of any length.
+#
+#   python -m alvr_freepie.batch session.afps out/ --profile profiles/dual_psmove_head.json
+#
+# writes out/<column>.npy (load with numpy.load(path, mmap_mode="r")):
+#   time, tick
+#   head_position_x / _y / _z
+#   controller<c>_position_x / _y / _z
+#   controller<c>_orientation_yaw / _pitch / _roll
+#
+# Only the per sample transforms are applied. Filters, prediction, dead
+# reckoning, head fusion and the fly mode offset depend on earlier samples
+# and are left out, the arm model uses a fixed upper arm roll (--arm-roll).
+# As in the scripts, the arm model sees the head position of the previous
+# record when the head follows the ALVR input (the scripts write it after
+# the arm models).
+# BatchPlan.solve_scalar computes the same columns record by record with the
+# functions the scripts run (compared in benchmarks/bench_batch.py).
+
+import argparse
+import math
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from alvr_freepie.armmodel import PoseContext, calc_arm_model_into, arm_model_rows
+from alvr_freepie.calibration import (device_matrix, transform_point_into,
+    rotate_orientation_into, remove_lever_arm_into, load_calibration)
+from alvr_freepie.ik import ArmIKContext, calc_arm_ik_into, arm_ik_rows
+from alvr_freepie.pipeline import load_profile, arm_geometry, INPUT, ARM
+from alvr_freepie.quatmath import HALF_PI, GIMBAL_COS, new_quat, psm_euler2euler_into
+from alvr_freepie.session import SessionReader, RECORD
+
+CHUNK = 65536
+
+# record fields (alvr_freepie.session.RECORD): index of freePieIO[0].x and of
+# the alvr.input_* values in a record tuple, offsets into the inputs
+_IO_START = 3
+_INPUT_START = 27
+_HEAD_ORIENTATION = 0
+_HEAD_POSITION = 3
+_CONTROLLER_ORIENTATION = 6
+
+if numpy is not None:
+    # RECORD as a NumPy structured dtype
+    RECORD_DTYPE = numpy.dtype([("time", "<f8"), ("tick", "<u4"), ("flags", "<u4"),
+                                ("io", "<f8", (4, 6)), ("inputs", "<f8", (12,)),
+                                ("trackpad", "<f8", (2,)), ("buttons", "<u4")])
+    assert RECORD_DTYPE.itemsize == RECORD.size
+else:
+    RECORD_DTYPE = None
+
+
+class BatchPlan(object):
+    __slots__ = ("columns", "dtypes", "arm_roll", "_devices", "_head", "_lever_arm",
+                 "_controllers", "_geometry", "_last_head")
+
+    # profile: profile dict (load_profile); arm_roll: upper arm roll of the
+    # arm model in radians
+    def __init__(self, profile, arm_roll=0.0):
+        self.arm_roll = arm_roll
+        self._geometry = arm_geometry(profile)
+        self._devices = {}
+        self._head = profile.get("head", {}).get("position", INPUT)
+        self._lever_arm = None
+        for name, device in sorted(profile.get("devices", {}).items()):
+            offset = [float(v) for v in device.get("offset", (0.0, 0.0, 0.0))]
+            calibration = load_calibration(device.get("calibration"))
+            self._devices[name] = (device["io"], device_matrix(calibration, offset),
+                                   calibration["rotation"] if calibration else None,
+                                   device.get("position", True))
+            if name == self._head and calibration and device.get("position", True):
+                self._lever_arm = calibration.get("lever_arm")
+        self._check_device(self._head, "head")
+        self._controllers = []
+        for c, controller in enumerate(profile.get("controllers", [])):
+            where = "controller %d" % c
+            orientation = controller.get("orientation", INPUT)
+            position = controller.get("position", ARM)
+            self._check_device(orientation, where)
+            if position != ARM:
+                self._check_device(position, where)
+            self._controllers.append((orientation, position, controller.get("side", 1)))
+        if not 1 <= len(self._controllers) <= 2:
+            raise ValueError("a profile needs 1 or 2 controllers")
+        self.columns = ["time", "tick", "head_position_x", "head_position_y",
+                        "head_position_z"]
+        for c in range(len(self._controllers)):
+            for name in ("position_x", "position_y", "position_z",
+                         "orientation_yaw", "orientation_pitch", "orientation_roll"):
+                self.columns.append("controller%d_%s" % (c, name))
+        self.dtypes = ["<u4" if name == "tick" else "<f8" for name in self.columns]
+        self._last_head = [0.0, 0.0, 0.0]
+
+    # start over at the first record of a session
+    def reset(self):
+        self._last_head = [0.0, 0.0, 0.0]
+
+    def _check_device(self, name, where):
+        if name != INPUT and name not in self._devices:
+            raise ValueError("%s: unknown device %r" % (where, name))
+
+    # columns (arrays, in the order of self.columns) of the records of a
+    # RECORD_DTYPE array
+    def solve(self, records):
+        count = len(records)
+        io = records["io"]
+        inputs = records["inputs"]
+        poses = {}
+        head_orientation = inputs[:, _HEAD_ORIENTATION:_HEAD_ORIENTATION + 3]
+        for name, (slot, m, rotation, has_position) in self._devices.items():
+            raw = io[:, slot]
+            position = numpy.zeros((count, 3))
+            if has_position:
+                x = raw[:, 0]; y = raw[:, 1]; z = raw[:, 2]
+                position[:, 0] = m[0] * x + m[1] * y + m[2] * z + m[3]
+                position[:, 1] = m[4] * x + m[5] * y + m[6] * z + m[7]
+                position[:, 2] = m[8] * x + m[9] * y + m[10] * z + m[11]
+                if name == self._head and self._lever_arm:
+                    position -= _rotate_vector(head_orientation, self._lever_arm)
+            orientation = _psm_euler2euler(raw[:, 3:6])
+            if rotation:
+                orientation = _rotate_orientations(rotation, orientation)
+            poses[name] = (position, orientation)
+
+        if self._head == INPUT:
+            head = inputs[:, _HEAD_POSITION:_HEAD_POSITION + 3]
+            arm_head = numpy.empty((count, 3))
+            if count:
+                arm_head[0] = self._last_head
+                arm_head[1:] = head[:-1]
+                self._last_head = head[-1].tolist()
+        else:
+            head = arm_head = poses[self._head][0]
+        columns = [records["time"], records["tick"], head[:, 0], head[:, 1], head[:, 2]]
+        for orientation_source, position_source, side in self._controllers:
+            if orientation_source == INPUT:
+                orientation = inputs[:, _CONTROLLER_ORIENTATION:_CONTROLLER_ORIENTATION + 3]
+            else:
+                orientation = poses[orientation_source][1]
+            if position_source == ARM and self._geometry is not None:
+                position = arm_ik_rows(self._geometry, head_orientation, arm_head, orientation,
+                                       side, self.arm_roll, numpy.empty((count, 3)))
+            elif position_source == ARM:
+                position = arm_model_rows(head_orientation, arm_head, orientation, side,
+                                          self.arm_roll, numpy.empty((count, 3)))
+            else:
+                position = poses[position_source][0]
+            columns.extend((position[:, 0], position[:, 1], position[:, 2],
+                            orientation[:, 0], orientation[:, 1], orientation[:, 2]))
+        return columns
+
+    # the same columns (lists) computed one record tuple at a time with the
+    # functions of the scripts
+    def solve_scalar(self, records):
+        columns = [[] for _ in self.columns]
+        devices = [(name, slot, m, rotation, has_position, [0.0, 0.0, 0.0], [0.0, 0.0, 0.0])
+                   for name, (slot, m, rotation, has_position) in sorted(self._devices.items())]
+        poses = dict((device[0], device) for device in devices)
+        if self._geometry is None:
+            ctx = PoseContext(len(self._controllers))
+            arm_model = calc_arm_model_into
+        else:
+            ctx = ArmIKContext(len(self._controllers), self._geometry)
+            arm_model = calc_arm_ik_into
+        head_orientation = [0.0, 0.0, 0.0]
+        q = new_quat()
+        input_head = [0.0, 0.0, 0.0]
+        last_head = self._last_head
+        input_orientation = [0.0, 0.0, 0.0]
+        arm_position = [0.0, 0.0, 0.0]
+        h = _INPUT_START + _HEAD_ORIENTATION
+        p = _INPUT_START + _HEAD_POSITION
+        o = _INPUT_START + _CONTROLLER_ORIENTATION
+        for record in records:
+            for name, slot, m, rotation, has_position, position, ypr in devices:
+                i = _IO_START + 6 * slot
+                if has_position:
+                    transform_point_into(m, record[i], record[i + 1], record[i + 2], position)
+                    if name == self._head and self._lever_arm:
+                        head_orientation[0] = record[h]; head_orientation[1] = record[h + 1]
+                        head_orientation[2] = record[h + 2]
+                        remove_lever_arm_into(self._lever_arm, head_orientation, position,
+                                              position)
+                ypr[0] = record[i + 3]; ypr[1] = record[i + 4]; ypr[2] = record[i + 5]
+                psm_euler2euler_into(ypr, ypr)
+                if rotation:
+                    rotate_orientation_into(rotation, ypr, ypr, q)
+            head_orientation[0] = record[h]; head_orientation[1] = record[h + 1]
+            head_orientation[2] = record[h + 2]
+            if self._head == INPUT:
+                input_head[0] = record[p]; input_head[1] = record[p + 1]
+                input_head[2] = record[p + 2]
+                head = input_head
+                ctx.begin_frame(head_orientation, last_head)
+                last_head[0] = head[0]; last_head[1] = head[1]; last_head[2] = head[2]
+            else:
+                head = poses[self._head][5]
+                ctx.begin_frame(head_orientation, head)
+            input_orientation[0] = record[o]; input_orientation[1] = record[o + 1]
+            input_orientation[2] = record[o + 2]
+            row = [record[0], record[1], head[0], head[1], head[2]]
+            for c, (orientation_source, position_source, side) in enumerate(self._controllers):
+                if orientation_source == INPUT:
+                    orientation = input_orientation
+                else:
+                    orientation = poses[orientation_source][6]
+                if position_source == ARM:
+                    position = arm_model(ctx, orientation, side, self.arm_roll,
+                                         arm_position, c)
+                else:
+                    position = poses[position_source][5]
+                row.extend((position[0], position[1], position[2],
+                            orientation[0], orientation[1], orientation[2]))
+            for column, value in zip(columns, row):
+                column.append(value)
+        return columns
+
+
+# quaternion2euler_into for arrays of quaternion components
+def _quaternion2euler(x, y, z, w):
+    out = numpy.empty((len(x), 3))
+    sinp = 2.0 * (w * y - z * x)
+    out[:, 0] = numpy.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    out[:, 1] = numpy.where(numpy.abs(sinp) >= 1.0, numpy.copysign(HALF_PI, sinp),
+                            numpy.arcsin(numpy.clip(sinp, -1.0, 1.0)))
+    out[:, 2] = numpy.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    return out
+
+# psm_euler2euler_into for an n x 3 array of PS Move euler angles
+def _psm_euler2euler(ypr):
+    c = numpy.cos(ypr)
+    s = numpy.sin(ypr)
+    cy = c[:, 0]; sy = s[:, 0]
+    cp = c[:, 1]; sp = s[:, 1]
+    cr = c[:, 2]; sr = s[:, 2]
+    out = numpy.empty((len(ypr), 3))
+    sinp = sy * cr
+    sysr = sy * sr
+    out[:, 0] = numpy.arctan2(sr, cy * cr)
+    out[:, 1] = numpy.arcsin(numpy.clip(sinp, -1.0, 1.0))
+    out[:, 2] = numpy.arctan2(sysr * cp + cy * sp, cy * cp - sysr * sp)
+    # the two-step path near gimbal lock, as psm_euler2euler_into
+    near = 1.0 - sinp * sinp < GIMBAL_COS * GIMBAL_COS
+    if near.any():
+        half = ypr[near] * 0.5
+        c = numpy.cos(half)
+        s = numpy.sin(half)
+        cy = c[:, 0]; sy = s[:, 0]
+        cp = c[:, 1]; sp = s[:, 1]
+        cr = c[:, 2]; sr = s[:, 2]
+        out[near] = _quaternion2euler(cy * cr * sp + sy * sr * cp,
+                                      sy * cr * cp + cy * sr * sp,
+                                      cy * sr * cp - sy * cr * sp,
+                                      cy * cr * cp - sy * sr * sp)
+    return out
+
+# the vector rotated by each row of an n x 3 array of euler angles
+# (rotatevec_into per row)
+def _rotate_vector(ypr, vector):
+    half = ypr * 0.5
+    c = numpy.cos(half)
+    s = numpy.sin(half)
+    cy = c[:, 0]; sy = s[:, 0]
+    cp = c[:, 1]; sp = s[:, 1]
+    cr = c[:, 2]; sr = s[:, 2]
+    qx = cy * sr * cp - sy * cr * sp
+    qy = cy * cr * sp + sy * sr * cp
+    qz = sy * cr * cp - cy * sr * sp
+    qw = cy * cr * cp + sy * sr * sp
+    vx, vy, vz = vector
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    out = numpy.empty((len(ypr), 3))
+    out[:, 0] = vx + qw * tx + (qy * tz - qz * ty)
+    out[:, 1] = vy + qw * ty + (qz * tx - qx * tz)
+    out[:, 2] = vz + qw * tz + (qx * ty - qy * tx)
+    return out
+
+# rotate_orientation_into for an n x 3 array of euler angles
+def _rotate_orientations(rotation, ypr):
+    half = ypr * 0.5
+    c = numpy.cos(half)
+    s = numpy.sin(half)
+    cy = c[:, 0]; sy = s[:, 0]
+    cp = c[:, 1]; sp = s[:, 1]
+    cr = c[:, 2]; sr = s[:, 2]
+    x1 = cy * sr * cp - sy * cr * sp
+    y1 = cy * cr * sp + sy * sr * cp
+    z1 = sy * cr * cp - cy * sr * sp
+    w1 = cy * cr * cp + sy * sr * sp
+    x0, y0, z0, w0 = rotation
+    return _quaternion2euler(x1 * w0 - y1 * z0 + z1 * y0 + w1 * x0,
+                             x1 * z0 + y1 * w0 - z1 * x0 + w1 * y0,
+                             -x1 * y0 + y1 * x0 + z1 * w0 + w1 * z0,
+                             -x1 * x0 - y1 * y0 - z1 * z0 + w1 * w0)
+
+
+class ColumnWriter(object):
+    __slots__ = ("_files", "_dtypes")
+
+    # one .npy file per column name in directory, each with count rows
+    # written in pieces by write()
+    def __init__(self, directory, names, dtypes, count):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._files = []
+        self._dtypes = [numpy.dtype(dtype) for dtype in dtypes]
+        for name, dtype in zip(names, self._dtypes):
+            f = open(os.path.join(directory, name + ".npy"), "wb")
+            numpy.lib.format.write_array_header_1_0(
+                f, {"descr": dtype.str, "fortran_order": False, "shape": (count,)})
+            self._files.append(f)
+
+    # append the next rows, one sequence per column
+    def write(self, columns):
+        for f, dtype, values in zip(self._files, self._dtypes, columns):
+            f.write(numpy.asarray(values, dtype=dtype).tobytes())
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+
+# run plan over the session file at path and write the columns to
+# directory; scalar: use BatchPlan.solve_scalar. Returns the record count.
+def process(path, directory, plan, chunk=CHUNK, scalar=False):
+    if numpy is None:
+        raise ImportError("alvr_freepie.batch needs NumPy")
+    reader = SessionReader(path)
+    plan.reset()
+    try:
+        count = len(reader)
+        writer = ColumnWriter(directory, plan.columns, plan.dtypes, count)
+        try:
+            for start in range(0, count, chunk):
+                if scalar:
+                    end = min(start + chunk, count)
+                    columns = plan.solve_scalar([reader[i] for i in range(start, end)])
+                else:
+                    records = numpy.frombuffer(reader.block(start, chunk), dtype=RECORD_DTYPE)
+                    columns = plan.solve(records)
+                writer.write(columns)
+        finally:
+            writer.close()
+    finally:
+        reader.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the pose chain of a profile over a recorded session.")
+    parser.add_argument("session")
+    parser.add_argument("output", help="directory for the column files")
+    parser.add_argument("--profile", default="profiles/single_psmove.json")
+    parser.add_argument("--arm-roll", type=float, default=0.0,
+                        help="upper arm roll of the arm model in degrees")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="records per NumPy chunk")
+    parser.add_argument("--scalar", action="store_true",
+                        help="process record by record with the scripts' functions")
+    args = parser.parse_args(argv)
+    plan = BatchPlan(load_profile(args.profile), math.radians(args.arm_roll))
+    count = process(args.session, args.output, plan, args.chunk, args.scalar)
+    print("%d records -> %d columns in %s" % (count, len(plan.columns), args.output))
+
+if __name__ == "__main__":
+    main()
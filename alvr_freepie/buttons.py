@@ -0,0 +1,78 @@
+# Table driven PS Move button mapping.
+#
+# PSMoveService packs the buttons of a PS Move into one bitmask
+# (freePieIO[3].x / .y). A ButtonMap maps bits to ALVR buttons through a
+# table whose alvr.Id() lookups are resolved once, compares each new mask
+# with the previous one and only writes the buttons that changed. Press and
+# release callbacks run on the edges of a bit:
+#
+#   PSM_BUTTONS = [(PSM_SQUARE, "application_menu"), (PSM_CROSS, "grip")]
+#   if starting:
+#       g_buttons = ButtonMap(alvr, 1, PSM_BUTTONS)
+#       g_buttons.on_press(PSM_SELECT, next_mode)
+#   g_buttons.update(int(freePieIO[3].x))
+#
+# The ALVR button array keeps the written values between ticks, so unchanged
+# buttons need no write. All buttons start released.
+
+PSM_SQUARE   = 0b00000001
+PSM_TRIANGLE = 0b00000010
+PSM_CROSS    = 0b00000100
+PSM_CIRCLE   = 0b00001000
+PSM_MOVE     = 0b00010000
+PSM_PS       = 0b00100000
+PSM_START    = 0b01000000
+PSM_SELECT   = 0b10000000
+PSM_BUTTON_BITS = {"square": PSM_SQUARE, "triangle": PSM_TRIANGLE,
+                   "cross": PSM_CROSS, "circle": PSM_CIRCLE, "move": PSM_MOVE,
+                   "ps": PSM_PS, "start": PSM_START, "select": PSM_SELECT}
+
+
+class ButtonMap(object):
+    __slots__ = ("state", "writes", "_alvr", "_controller", "_table",
+                 "_mask", "_press", "_release")
+
+    # controller: index into alvr.buttons; mapping: [(bit, alvr button name)]
+    def __init__(self, alvr, controller, mapping):
+        self._alvr = alvr
+        self._controller = controller
+        self._table = tuple([(bit, alvr.Id(name)) for bit, name in mapping])
+        mask = 0
+        for bit, name in mapping:
+            mask |= bit
+        # bits that are written to ALVR
+        self._mask = mask
+        self._press = ()
+        self._release = ()
+        # last bitmask passed to update
+        self.state = 0
+        # number of ALVR button writes (diagnostics)
+        self.writes = 0
+
+    # call callback() whenever bit goes from released to pressed
+    def on_press(self, bit, callback):
+        self._press += ((bit, callback),)
+
+    # call callback() whenever bit goes from pressed to released
+    def on_release(self, bit, callback):
+        self._release += ((bit, callback),)
+
+    # apply a new bitmask; returns the bits that changed
+    def update(self, buttons):
+        changed = buttons ^ self.state
+        if not changed:
+            return 0
+        self.state = buttons
+        if changed & self._mask:
+            row = self._alvr.buttons[self._controller]
+            for bit, index in self._table:
+                if changed & bit:
+                    row[index] = buttons & bit != 0
+                    self.writes += 1
+        for bit, callback in self._press:
+            if changed & buttons & bit:
+                callback()
+        for bit, callback in self._release:
+            if changed & bit and not buttons & bit:
+                callback()
+        return changed
@@ -0,0 +1,390 @@
+# PS Eye to HMD coordinate calibration.
+#
+# PSMoveService reports PS Move positions in centimeters in the frame of the
+# PS Eye. Uncalibrated, the scripts divide by 100 and add hand tuned offsets.
+# A calibration pairs positions of the head mounted PS Move with the
+# positions the HMD reports for itself while the user moves the head around,
+# and solves for the similarity transform (rotation, uniform scale,
+# translation) that maps the first onto the second in the least squares
+# sense: Horn's closed form quaternion method, with Umeyama's scale.
+#
+# The head PS Move is not where the HMD reports its position: it sits at a
+# fixed lever arm in the head frame, so its path differs from the HMD's
+# whenever the head turns. solve_head_calibration() takes the HMD
+# orientation of every sample and solves for the lever arm along with the
+# transform; remove_lever_arm_into() then turns the calibrated head PS Move
+# position into the HMD position.
+#
+#   samples = CalibrationSamples(2000)
+#   samples.add(io.x, io.y, io.z, hmd[0], hmd[1], hmd[2], hmd_orientation)  # per update
+#   calibration = solve_head_calibration(samples.source, samples.target,
+#                                        samples.rotations)   # not in the update event
+#   save_calibration("psmove_calibration.json", calibration)
+#
+# A calibration is a dict: "matrix" (4x4, row major, flat), "rotation"
+# (quaternion [x, y, z, w] of the rotation part), "scale", "rms" (residual,
+# meters), "samples" and, from solve_head_calibration, "lever_arm" ([x, y,
+# z] in the head frame, meters). device_matrix() turns it into the one 4x4
+# matrix per device that is applied to every sample with
+# transform_point_into().
+#
+# NumPy is optional: with it the sums over the samples are vectorized
+# (CPython); without it, e.g. on IronPython in FreePIE, plain loops are used.
+
+import json
+import math
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from alvr_freepie.quatmath import euler2quaternion_into, multiply_into, quaternion2euler_into
+
+# PS Eye centimeters to meters
+PSEYE_SCALE = 0.01
+# Jacobi sweeps of the 4x4 eigen solver (converges in < 10)
+_SWEEPS = 30
+# lever arm solve: at most this many rounds, done when the lever arm moves
+# less than the tolerance (meters); the ridge (per sample) keeps directions
+# the head never turned about at 0 instead of fitting noise
+_LEVER_ARM_ROUNDS = 50
+_LEVER_ARM_TOLERANCE = 1e-7
+_LEVER_ARM_RIDGE = 1e-6
+
+
+# matrix of an uncalibrated device: centimeters to meters plus offset,
+# or of a calibrated one: calibration plus offset (the offset applies on top
+# of a calibration as well)
+def device_matrix(calibration, offset):
+    if calibration is None:
+        m = [PSEYE_SCALE, 0.0, 0.0, 0.0,
+             0.0, PSEYE_SCALE, 0.0, 0.0,
+             0.0, 0.0, PSEYE_SCALE, 0.0,
+             0.0, 0.0, 0.0, 1.0]
+    else:
+        m = [float(v) for v in calibration["matrix"]]
+    m[3] += offset[0]
+    m[7] += offset[1]
+    m[11] += offset[2]
+    return m
+
+# out[0..2] = m * (x, y, z, 1)
+def transform_point_into(m, x, y, z, out):
+    out[0] = m[0] * x + m[1] * y + m[2] * z + m[3]
+    out[1] = m[4] * x + m[5] * y + m[6] * z + m[7]
+    out[2] = m[8] * x + m[9] * y + m[10] * z + m[11]
+    return out
+
+# rotate the orientation yaw_pitch_roll by the quaternion rotation (the
+# calibration "rotation"); out may be yaw_pitch_roll, q is a quaternion
+# scratch buffer owned by the caller
+def rotate_orientation_into(rotation, yaw_pitch_roll, out, q):
+    euler2quaternion_into(yaw_pitch_roll, q)
+    multiply_into(rotation, q, q)
+    return quaternion2euler_into(q, out)
+
+
+# out = position - R(yaw_pitch_roll) * lever_arm: the HMD position from the
+# calibrated position of the head PS Move; out may be position
+def remove_lever_arm_into(lever_arm, yaw_pitch_roll, position, out):
+    hy = yaw_pitch_roll[0] * 0.5
+    hp = yaw_pitch_roll[1] * 0.5
+    hr = yaw_pitch_roll[2] * 0.5
+    cy = math.cos(hy); sy = math.sin(hy)
+    cp = math.cos(hp); sp = math.sin(hp)
+    cr = math.cos(hr); sr = math.sin(hr)
+    qx = cy * sr * cp - sy * cr * sp
+    qy = cy * cr * sp + sy * sr * cp
+    qz = sy * cr * cp - cy * sr * sp
+    qw = cy * cr * cp + sy * sr * sp
+    vx = lever_arm[0]; vy = lever_arm[1]; vz = lever_arm[2]
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    out[0] = position[0] - (vx + qw * tx + (qy * tz - qz * ty))
+    out[1] = position[1] - (vy + qw * ty + (qz * tx - qx * tz))
+    out[2] = position[2] - (vz + qw * tz + (qx * ty - qy * tx))
+    return out
+
+# row major 3x3 rotation matrix of the unit quaternion (x, y, z, w)
+def _quaternion_matrix(x, y, z, w):
+    return (1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - w * z), 2.0 * (x * z + w * y),
+            2.0 * (x * y + w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - w * x),
+            2.0 * (x * z - w * y), 2.0 * (y * z + w * x), 1.0 - 2.0 * (x * x + y * y))
+
+
+class CalibrationSamples(object):
+    __slots__ = ("capacity", "min_distance", "min_angle", "source", "target", "rotations",
+                 "_last", "_last_q", "_q")
+
+    # keep at most capacity pairs; a pair is only taken when the target moved
+    # min_distance (meters) or turned min_angle (radians) since the last
+    # one, so standing still does not fill the buffer with the same pose
+    def __init__(self, capacity, min_distance=0.01, min_angle=0.05):
+        self.capacity = capacity
+        self.min_distance = min_distance
+        self.min_angle = min_angle
+        self.source = []
+        self.target = []
+        self.rotations = []
+        self._last = None
+        self._last_q = None
+        self._q = [0.0, 0.0, 0.0, 1.0]
+
+    def clear(self):
+        del self.source[:]
+        del self.target[:]
+        del self.rotations[:]
+        self._last = None
+        self._last_q = None
+
+    def full(self):
+        return len(self.source) >= self.capacity
+
+    # add a PS Eye (sx, sy, sz) / HMD (tx, ty, tz) pair with the HMD
+    # orientation (ALVR yaw, pitch, roll; None: position only); returns True
+    # if taken
+    def add(self, sx, sy, sz, tx, ty, tz, orientation=None):
+        if len(self.source) >= self.capacity:
+            return False
+        q = None
+        if orientation is not None:
+            q = euler2quaternion_into(orientation, self._q)
+        last = self._last
+        if last is not None:
+            dx = tx - last[0]; dy = ty - last[1]; dz = tz - last[2]
+            if dx * dx + dy * dy + dz * dz < self.min_distance * self.min_distance:
+                last_q = self._last_q
+                if q is None or last_q is None:
+                    return False
+                dot = abs(q[0] * last_q[0] + q[1] * last_q[1] + q[2] * last_q[2]
+                          + q[3] * last_q[3])
+                if dot > math.cos(0.5 * self.min_angle):
+                    return False
+        self._last = (tx, ty, tz)
+        self.source.append((sx, sy, sz))
+        self.target.append((tx, ty, tz))
+        if q is not None:
+            self._last_q = (q[0], q[1], q[2], q[3])
+            self.rotations.append(_quaternion_matrix(q[0], q[1], q[2], q[3]))
+        return True
+
+
+# means, cross covariance S[i][j] = sum(a_i * b_j) of the centered points and
+# the summed squared norms of both centered point sets
+def _moments(source, target):
+    if numpy is not None:
+        a = numpy.asarray(source, dtype=float)
+        b = numpy.asarray(target, dtype=float)
+        mean_a = a.mean(axis=0)
+        mean_b = b.mean(axis=0)
+        a = a - mean_a
+        b = b - mean_b
+        cov = numpy.dot(a.T, b)
+        return (mean_a.tolist(), mean_b.tolist(), cov.tolist(),
+                float((a * a).sum()), float((b * b).sum()))
+    n = float(len(source))
+    mean_a = [sum(p[i] for p in source) / n for i in (0, 1, 2)]
+    mean_b = [sum(p[i] for p in target) / n for i in (0, 1, 2)]
+    cov = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    var_a = 0.0
+    var_b = 0.0
+    ax0, ay0, az0 = mean_a
+    bx0, by0, bz0 = mean_b
+    c0 = cov[0]; c1 = cov[1]; c2 = cov[2]
+    for (ax, ay, az), (bx, by, bz) in zip(source, target):
+        ax -= ax0; ay -= ay0; az -= az0
+        bx -= bx0; by -= by0; bz -= bz0
+        c0[0] += ax * bx; c0[1] += ax * by; c0[2] += ax * bz
+        c1[0] += ay * bx; c1[1] += ay * by; c1[2] += ay * bz
+        c2[0] += az * bx; c2[1] += az * by; c2[2] += az * bz
+        var_a += ax * ax + ay * ay + az * az
+        var_b += bx * bx + by * by + bz * bz
+    return mean_a, mean_b, cov, var_a, var_b
+
+# eigenvalues and eigenvectors (columns of v) of a symmetric matrix
+# (cyclic Jacobi rotations)
+def _jacobi_eigen(a):
+    size = len(a)
+    a = [list(row) for row in a]
+    v = [[1.0 if i == j else 0.0 for j in range(size)] for i in range(size)]
+    for _ in range(_SWEEPS):
+        off = sum(a[i][j] * a[i][j] for i in range(size) for j in range(size) if i != j)
+        if off < 1e-30:
+            break
+        for p in range(size - 1):
+            for q in range(p + 1, size):
+                if a[p][q] == 0.0:
+                    continue
+                theta = (a[q][q] - a[p][p]) / (2.0 * a[p][q])
+                t = math.copysign(1.0, theta) / (abs(theta) + math.sqrt(theta * theta + 1.0))
+                c = 1.0 / math.sqrt(t * t + 1.0)
+                s = t * c
+                for k in range(size):
+                    akp = a[k][p]
+                    akq = a[k][q]
+                    a[k][p] = c * akp - s * akq
+                    a[k][q] = s * akp + c * akq
+                for k in range(size):
+                    apk = a[p][k]
+                    aqk = a[q][k]
+                    a[p][k] = c * apk - s * aqk
+                    a[q][k] = s * apk + c * aqk
+                for k in range(size):
+                    vkp = v[k][p]
+                    vkq = v[k][q]
+                    v[k][p] = c * vkp - s * vkq
+                    v[k][q] = s * vkp + c * vkq
+    return [a[i][i] for i in range(size)], v
+
+# least squares similarity transform with target ~ scale * R * source + t
+# for paired point lists [(x, y, z)]; returns a calibration dict (see top).
+# Raises ValueError for too few or degenerate (collinear) samples.
+def solve_similarity(source, target, with_scale=True):
+    n = len(source)
+    if n != len(target):
+        raise ValueError("calibration: %d source but %d target samples" % (n, len(target)))
+    if n < 3:
+        raise ValueError("calibration: needs at least 3 samples, got %d" % n)
+    mean_a, mean_b, s, var_a, var_b = _moments(source, target)
+    if var_a <= 0.0:
+        raise ValueError("calibration: the samples do not move")
+    sxx, sxy, sxz = s[0]
+    syx, syy, syz = s[1]
+    szx, szy, szz = s[2]
+    # Horn's symmetric matrix; its top eigenvector is the rotation
+    # quaternion (w, x, y, z), its top eigenvalue sum(b . R a)
+    horn = [[sxx + syy + szz, syz - szy, szx - sxz, sxy - syx],
+            [syz - szy, sxx - syy - szz, sxy + syx, szx + sxz],
+            [szx - sxz, sxy + syx, -sxx + syy - szz, syz + szy],
+            [sxy - syx, szx + sxz, syz + szy, -sxx - syy + szz]]
+    values, vectors = _jacobi_eigen(horn)
+    order = sorted(range(4), key=lambda i: values[i], reverse=True)
+    top = values[order[0]]
+    if top - values[order[1]] <= 1e-12 * max(abs(top), 1e-300):
+        raise ValueError("calibration: degenerate samples, move the head in all directions")
+    w, x, y, z = [vectors[k][order[0]] for k in range(4)]
+    norm = math.sqrt(w * w + x * x + y * y + z * z)
+    if w < 0.0:
+        norm = -norm
+    w /= norm; x /= norm; y /= norm; z /= norm
+    scale = top / var_a if with_scale else 1.0
+    r = _quaternion_matrix(x, y, z, w)
+    m = [0.0] * 16
+    for i in (0, 1, 2):
+        t = mean_b[i]
+        for j in (0, 1, 2):
+            m[4 * i + j] = scale * r[3 * i + j]
+            t -= scale * r[3 * i + j] * mean_a[j]
+        m[4 * i + 3] = t
+    m[15] = 1.0
+    # sum |scale R a - b|^2 over the centered samples, from the moments
+    residual = scale * scale * var_a - 2.0 * scale * top + var_b
+    return {"matrix": m, "rotation": [x, y, z, w], "scale": scale,
+            "rms": math.sqrt(max(residual, 0.0) / n), "samples": n}
+
+# normal equations of the lever arm d for the fixed similarity transform m:
+# minimizes sum |rotation_i d + t - u_i|^2 over d and t with
+# u_i = scale R source_i - target_i, t eliminated by centering; returns
+# (3x3 matrix, right hand side)
+def _lever_arm_equations(m, source, target, rotations):
+    if numpy is not None:
+        a = numpy.asarray(source, dtype=float)
+        b = numpy.asarray(target, dtype=float)
+        r = numpy.asarray(rotations, dtype=float).reshape(-1, 3, 3)
+        sr = numpy.array(m, dtype=float).reshape(4, 4)[:3, :3]
+        u = numpy.dot(a, sr.T) - b
+        u -= u.mean(axis=0)
+        r = r - r.mean(axis=0)
+        normal = numpy.einsum("nki,nkj->ij", r, r)
+        rhs = numpy.einsum("nki,nk->i", r, u)
+        return normal.tolist(), rhs.tolist()
+    n = float(len(source))
+    mean_u = [0.0, 0.0, 0.0]
+    mean_r = [0.0] * 9
+    u = []
+    for (ax, ay, az), (bx, by, bz), rot in zip(source, target, rotations):
+        ux = m[0] * ax + m[1] * ay + m[2] * az - bx
+        uy = m[4] * ax + m[5] * ay + m[6] * az - by
+        uz = m[8] * ax + m[9] * ay + m[10] * az - bz
+        u.append((ux, uy, uz))
+        mean_u[0] += ux; mean_u[1] += uy; mean_u[2] += uz
+        for k in range(9):
+            mean_r[k] += rot[k]
+    mean_u = [v / n for v in mean_u]
+    mean_r = [v / n for v in mean_r]
+    normal = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+    rhs = [0.0, 0.0, 0.0]
+    for (ux, uy, uz), rot in zip(u, rotations):
+        e = [rot[k] - mean_r[k] for k in range(9)]
+        vx = ux - mean_u[0]; vy = uy - mean_u[1]; vz = uz - mean_u[2]
+        for i in (0, 1, 2):
+            ei0 = e[i]; ei1 = e[3 + i]; ei2 = e[6 + i]
+            row = normal[i]
+            for j in (0, 1, 2):
+                row[j] += ei0 * e[j] + ei1 * e[3 + j] + ei2 * e[6 + j]
+            rhs[i] += ei0 * vx + ei1 * vy + ei2 * vz
+    return normal, rhs
+
+# solution of the 3x3 system a x = b (Cramer's rule)
+def _solve3(a, b):
+    (a00, a01, a02), (a10, a11, a12), (a20, a21, a22) = a
+    c0 = a11 * a22 - a12 * a21
+    c1 = a12 * a20 - a10 * a22
+    c2 = a10 * a21 - a11 * a20
+    det = a00 * c0 + a01 * c1 + a02 * c2
+    b0, b1, b2 = b
+    return [(b0 * c0 + b1 * (a02 * a21 - a01 * a22) + b2 * (a01 * a12 - a02 * a11)) / det,
+            (b0 * c1 + b1 * (a00 * a22 - a02 * a20) + b2 * (a02 * a10 - a00 * a12)) / det,
+            (b0 * c2 + b1 * (a01 * a20 - a00 * a21) + b2 * (a00 * a11 - a01 * a10)) / det]
+
+# solve_similarity for the head PS Move: target and rotations (row major
+# 3x3, CalibrationSamples.rotations) are the HMD's own positions and
+# orientations, and the PS Move sits at an unknown lever arm d in the head
+# frame, scale * R * source + t ~ target + rotation * d. Alternates
+# solve_similarity with d fixed and the least squares d with the transform
+# fixed (each round lowers the residual) until d settles. Returns a
+# calibration dict with "lever_arm"; the matrix maps the PS Eye onto the
+# PS Move position, the "rms" is that of the full model.
+def solve_head_calibration(source, target, rotations, with_scale=True):
+    n = len(source)
+    if len(rotations) != n:
+        raise ValueError("calibration: %d source samples but %d orientations"
+                         % (n, len(rotations)))
+    lever_arm = [0.0, 0.0, 0.0]
+    moved = target
+    for _ in range(_LEVER_ARM_ROUNDS):
+        calibration = solve_similarity(source, moved, with_scale)
+        normal, rhs = _lever_arm_equations(calibration["matrix"], source, target, rotations)
+        for i in (0, 1, 2):
+            normal[i][i] += _LEVER_ARM_RIDGE * n
+        solved = _solve3(normal, rhs)
+        change = max(abs(solved[i] - lever_arm[i]) for i in (0, 1, 2))
+        lever_arm = solved
+        dx, dy, dz = lever_arm
+        moved = [(p[0] + r[0] * dx + r[1] * dy + r[2] * dz,
+                  p[1] + r[3] * dx + r[4] * dy + r[5] * dz,
+                  p[2] + r[6] * dx + r[7] * dy + r[8] * dz)
+                 for p, r in zip(target, rotations)]
+        if change < _LEVER_ARM_TOLERANCE:
+            break
+    calibration = solve_similarity(source, moved, with_scale)
+    calibration["lever_arm"] = lever_arm
+    return calibration
+
+def save_calibration(path, calibration):
+    with open(path, "w") as f:
+        json.dump(calibration, f, indent=1)
+
+# the calibration stored at path, or None if there is none yet
+def load_calibration(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        calibration = json.load(f)
+    if (len(calibration.get("matrix", ())) != 16 or len(calibration.get("rotation", ())) != 4
+            or len(calibration.get("lever_arm", (0.0, 0.0, 0.0))) != 3):
+        raise ValueError("%s: not a calibration file" % path)
+    return calibration
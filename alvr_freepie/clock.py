@@ -0,0 +1,38 @@
+# Monotonic high resolution clock in seconds.
+#
+# CPython 3 has time.perf_counter; IronPython 2.7 (FreePIE) does not, but its
+# time.clock is backed by a .NET Stopwatch and is monotonic there.
+#
+# The headless runtime (alvr_freepie.sim) replaces the source with simulated
+# or recorded time via set_source so that runs are reproducible; a simulated
+# clock replaces sleep via set_sleep as well.
+
+import time
+
+try:
+    from time import perf_counter as _system_clock
+except ImportError:
+    from time import clock as _system_clock
+
+_source = _system_clock
+_sleep = time.sleep
+
+# the system clock, unaffected by set_source; for measuring real durations
+system_clock = _system_clock
+
+
+def monotonic():
+    return _source()
+
+# use source() as time base; None restores the system clock
+def set_source(source):
+    global _source
+    _source = source if source is not None else _system_clock
+
+def sleep(seconds):
+    _sleep(seconds)
+
+# use sleep(seconds) to wait; None restores time.sleep
+def set_sleep(sleep):
+    global _sleep
+    _sleep = sleep if sleep is not None else time.sleep
@@ -0,0 +1,184 @@
+# Dead reckoning of a PS Move position while the PS Eye cannot see the bulb.
+#
+# PSMoveService keeps sending samples when the camera loses the bulb: the
+# orientation still comes from the IMU, the position stays at the last
+# optical fix. check_sample sorts each sample into STATUS_LOST when the
+# tracker status says so (tracker transport FLAG_TRACKED), STATUS_REPEATED
+# when its raw position repeats the previous one exactly and
+# STATUS_TRACKED otherwise. A repeated position is no new optical fix but
+# no loss either: update events come faster than the 60 Hz camera frames
+# (IMU rate) and repeat the position in between. The device counts as lost
+# only when it had no optical fix for stale_time seconds, a few camera
+# frame periods.
+#
+# While lost, the position moves on from the last tracked one with the last
+# velocity estimate, slowing down with the time constant decay:
+#   p + v * decay * (1 - exp(-dt / decay))
+# for at most horizon seconds, then it holds. When tracking returns, the
+# output starts at the dead reckoned position and eases onto the tracked
+# one within blend_time seconds. The smoothstep moves at most 1.5 * gap /
+# blend_time beyond the true motion, about 12 mm per 120 Hz tick for a
+# 0.2 m gap. blend_share closes part of the gap at once; that part is a
+# visible snap, so it is 0 by default.
+#
+#   if starting:
+#       g_reckoner = DeadReckoning()
+#   status = g_reckoner.check_sample(io.x, io.y, io.z, tracked)    # update event
+#   g_reckoner.add_sample(t, pose, status)                        # new sample
+#   if g_reckoner.active(now):                                    # every tick
+#       g_reckoner.output_into(now, pose)
+#
+# Only the position ([x, y, z] of pose) is touched. All state is
+# preallocated; nothing is allocated per sample.
+
+import math
+
+_AXES = (0, 1, 2)
+
+# check_sample results
+STATUS_TRACKED = 1
+STATUS_REPEATED = 0
+STATUS_LOST = -1
+
+
+# smoothstep weight of the blend offset, 1 at s = 0 down to 0 at s = 1
+def _ease_out(s):
+    return 1.0 - s * s * (3.0 - 2.0 * s)
+
+
+class DeadReckoning(object):
+    __slots__ = ("stale_time", "decay", "horizon", "blend_time", "blend_share",
+                 "velocity_gain", "lost",
+                 "losses", "_raw", "_position", "_time", "_velocity", "_samples", "_anchor",
+                 "_offset", "_blend_start", "_blending")
+
+    # stale_time: seconds without an optical fix before the device counts
+    # as lost; decay: time constant (s) of the velocity while lost; horizon:
+    # seconds after which the position holds; blend_time: seconds to ease
+    # back onto the tracked position; blend_share: share of the gap closed
+    # at once when tracking returns; velocity_gain: share of a new velocity
+    # measurement in the estimate
+    def __init__(self, stale_time=0.05, decay=0.15, horizon=0.5, blend_time=0.2,
+                 blend_share=0.0, velocity_gain=0.3):
+        self.stale_time = stale_time
+        self.decay = decay
+        self.horizon = horizon
+        self.blend_time = blend_time
+        self.blend_share = blend_share
+        self.velocity_gain = velocity_gain
+        # currently dead reckoning / number of tracking losses (diagnostics)
+        self.lost = False
+        self.losses = 0
+        # previous raw position, for the repeat check
+        self._raw = [None, None, None]
+        # last tracked position, its time and the velocity estimate (m/s)
+        self._position = [0.0, 0.0, 0.0]
+        self._time = 0.0
+        self._velocity = [0.0, 0.0, 0.0]
+        self._samples = 0
+        # where dead reckoning starts from
+        self._anchor = [0.0, 0.0, 0.0]
+        # dead reckoned - tracked position when tracking returned
+        self._offset = [0.0, 0.0, 0.0]
+        self._blend_start = 0.0
+        self._blending = False
+
+    # raw position (any unit) and tracker status of a new sample; returns
+    # its STATUS_*
+    def check_sample(self, x, y, z, tracked=True):
+        raw = self._raw
+        repeated = raw[0] == x and raw[1] == y and raw[2] == z
+        raw[0] = x; raw[1] = y; raw[2] = z
+        if not tracked:
+            return STATUS_LOST
+        return STATUS_REPEATED if repeated else STATUS_TRACKED
+
+    # new sample taken at time t with position pose[0..2] (meters); status
+    # as returned by check_sample. Returns True when the sample ends a loss.
+    def add_sample(self, t, pose, status):
+        if status != STATUS_TRACKED:
+            if status == STATUS_LOST and not self.lost and self._samples:
+                self._lose()
+            return False
+        position = self._position
+        velocity = self._velocity
+        reacquired = self.lost
+        if reacquired:
+            offset = self._offset
+            self._reckon_into(t, offset)
+            keep = 1.0 - self.blend_share
+            for k in _AXES:
+                offset[k] = (offset[k] - pose[k]) * keep
+                # the speed before the loss is stale, measure it again
+                velocity[k] = 0.0
+            self._blend_start = t
+            self._blending = True
+            self.lost = False
+        elif self._samples:
+            dt = t - self._time
+            if dt > 0.0:
+                gain = self.velocity_gain
+                for k in _AXES:
+                    velocity[k] += gain * ((pose[k] - position[k]) / dt - velocity[k])
+        for k in _AXES:
+            position[k] = pose[k]
+        self._time = t
+        self._samples += 1
+        return reacquired
+
+    # whether output_into changes the pose at time now (lost or blending
+    # back); a device without an optical fix for stale_time becomes lost
+    # here
+    def active(self, now):
+        if not self.lost and self._samples and now - self._time > self.stale_time:
+            self._lose()
+        return self.lost or self._blending
+
+    # replace / correct the position of pose ([x, y, z, ...]) for time now
+    def output_into(self, now, pose):
+        if self.lost:
+            self._reckon_into(now, pose)
+        elif self._blending:
+            s = (now - self._blend_start) / self.blend_time
+            if s >= 1.0:
+                self._blending = False
+                return pose
+            w = _ease_out(s) if s > 0.0 else 1.0
+            offset = self._offset
+            pose[0] += offset[0] * w
+            pose[1] += offset[1] * w
+            pose[2] += offset[2] * w
+        return pose
+
+    # start dead reckoning from the last tracked position, or from where the
+    # blend of the previous loss was at that moment
+    def _lose(self):
+        self.lost = True
+        self.losses += 1
+        anchor = self._anchor
+        position = self._position
+        w = 0.0
+        if self._blending:
+            self._blending = False
+            s = (self._time - self._blend_start) / self.blend_time
+            if s < 1.0:
+                w = _ease_out(s) if s > 0.0 else 1.0
+        offset = self._offset
+        for k in _AXES:
+            anchor[k] = position[k] + offset[k] * w
+
+    # dead reckoned position at time t into out[0..2]
+    def _reckon_into(self, t, out):
+        dt = t - self._time
+        if dt > self.horizon:
+            dt = self.horizon
+        elif dt < 0.0:
+            dt = 0.0
+        decay = self.decay
+        travel = decay * (1.0 - math.exp(-dt / decay))
+        anchor = self._anchor
+        velocity = self._velocity
+        out[0] = anchor[0] + velocity[0] * travel
+        out[1] = anchor[1] + velocity[1] * travel
+        out[2] = anchor[2] + velocity[2] * travel
+        return out
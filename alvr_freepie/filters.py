@@ -0,0 +1,103 @@
+# Low latency jitter filters for tracker poses.
+#
+# OneEuroFilter is the 1-euro filter (Casiez et al., CHI 2012) applied to a
+# pose [x, y, z, yaw, pitch, roll]: a low-pass filter whose cutoff rises with
+# the filtered speed, so slow motion (jitter at rest) is smoothed strongly
+# and fast motion gets little lag.
+#   cutoff = min_cutoff + beta * |speed|
+# Positions and angles have their own min_cutoff/beta since their speeds
+# have different units (m/s, rad/s). Angles are filtered on wrapped
+# differences so they do not jump at +-pi.
+#
+#   if starting:
+#       g_filter = OneEuroFilter(min_cutoff=1.0, beta=0.5)
+#   g_filter.filter_into(monotonic(), pose, pose)   # on every new sample
+#
+# State is a fixed number of floats; nothing is allocated per update.
+
+import math
+
+_TWO_PI = 2.0 * math.pi
+# tuples so loops allocate nothing on IronPython, where range() builds a list
+_POSITION = (0, 1, 2)
+_ANGLES = (3, 4, 5)
+
+
+def _wrap(angle):
+    if angle > math.pi:
+        return angle - _TWO_PI
+    if angle < -math.pi:
+        return angle + _TWO_PI
+    return angle
+
+# smoothing factor of an exponential low-pass with cutoff (Hz) at step dt
+def _alpha(cutoff, dt):
+    tau = 1.0 / (_TWO_PI * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter(object):
+    __slots__ = ("min_cutoff", "beta", "angle_min_cutoff", "angle_beta",
+                 "d_cutoff", "_value", "_speed", "_last_t", "_primed")
+
+    # min_cutoff (Hz) / beta (s/m): position parameters
+    # angle_min_cutoff (Hz) / angle_beta (s/rad): orientation parameters,
+    #     default to the position ones
+    # d_cutoff (Hz): cutoff of the speed estimate
+    def __init__(self, min_cutoff=1.0, beta=0.5, angle_min_cutoff=None,
+                 angle_beta=None, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.angle_min_cutoff = min_cutoff if angle_min_cutoff is None else angle_min_cutoff
+        self.angle_beta = beta if angle_beta is None else angle_beta
+        self.d_cutoff = d_cutoff
+        self._value = [0.0] * 6
+        self._speed = [0.0] * 6
+        self._last_t = 0.0
+        self._primed = False
+
+    def reset(self):
+        self._primed = False
+
+    # filter the pose sampled at time t (seconds) into out; pose and out may
+    # be the same list
+    def filter_into(self, t, pose, out):
+        value = self._value
+        speed = self._speed
+        dt = t - self._last_t
+        if not self._primed or dt <= 0.0:
+            if not self._primed:
+                for k in _POSITION:
+                    value[k] = pose[k]
+                    speed[k] = 0.0
+                for k in _ANGLES:
+                    value[k] = pose[k]
+                    speed[k] = 0.0
+                self._primed = True
+                self._last_t = t
+            for k in _POSITION:
+                out[k] = value[k]
+            for k in _ANGLES:
+                out[k] = value[k]
+            return out
+        self._last_t = t
+        a_d = _alpha(self.d_cutoff, dt)
+
+        min_cutoff = self.min_cutoff
+        beta = self.beta
+        for k in _POSITION:
+            delta = pose[k] - value[k]
+            s = speed[k] + a_d * (delta / dt - speed[k])
+            speed[k] = s
+            value[k] += _alpha(min_cutoff + beta * abs(s), dt) * delta
+            out[k] = value[k]
+
+        min_cutoff = self.angle_min_cutoff
+        beta = self.angle_beta
+        for k in _ANGLES:
+            delta = _wrap(pose[k] - value[k])
+            s = speed[k] + a_d * (delta / dt - speed[k])
+            speed[k] = s
+            value[k] = _wrap(value[k] + _alpha(min_cutoff + beta * abs(s), dt) * delta)
+            out[k] = value[k]
+        return out
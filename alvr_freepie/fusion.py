@@ -0,0 +1,120 @@
+# Head position fusion of the HMD's own position with PS Eye positions.
+#
+# The HMD reports its position at the headset frame rate with no camera
+# latency, but it drifts (or only follows a neck model); the PS Eye head
+# PS Move is absolute but arrives at 60 Hz, some milliseconds late and with
+# more noise. HeadFusion is a complementary filter between the two: the
+# output is the newest HMD position plus a bias (optical - HMD) that is
+# low-pass filtered with time_constant, so fast motion comes from the HMD
+# and the PS Eye removes its drift.
+#
+# An optical sample shows the head `latency` seconds before its timestamp,
+# so it is compared with the HMD position of that moment, interpolated from
+# a ring buffer of recent HMD samples. Both must be in the same frame (see
+# alvr_freepie.calibration); a constant offset between the frames ends up in
+# the bias.
+#
+#   if starting:
+#       g_fusion = HeadFusion(time_constant=0.1, latency=0.03)
+#   g_fusion.add_hmd(now, alvr.input_head_position)      # new HMD position
+#   g_fusion.add_optical(stamp, optical_position)        # new PS Eye sample
+#   g_fusion.output_into(alvr.head_position)
+#
+# All state is preallocated; nothing is allocated per sample.
+
+import math
+
+_AXES = (0, 1, 2)
+
+
+class HeadFusion(object):
+    __slots__ = ("time_constant", "latency", "bias", "_times", "_positions", "_size",
+                 "_newest", "_count", "_last_optical", "_current", "_then")
+
+    # time_constant: seconds for the bias to follow the PS Eye (larger:
+    # smoother, slower drift correction); latency: PS Eye delay in seconds;
+    # history: HMD samples kept (must cover latency at the HMD rate)
+    def __init__(self, time_constant=0.1, latency=0.03, history=64):
+        self.time_constant = time_constant
+        self.latency = latency
+        # optical - HMD position, meters
+        self.bias = [0.0, 0.0, 0.0]
+        self._size = history
+        self._times = [0.0] * history
+        self._positions = [0.0] * (3 * history)
+        self._newest = -1
+        self._count = 0
+        self._last_optical = None
+        self._current = [0.0, 0.0, 0.0]
+        self._then = [0.0, 0.0, 0.0]
+
+    # new HMD position at time now
+    def add_hmd(self, now, position):
+        i = self._newest + 1
+        if i == self._size:
+            i = 0
+        self._newest = i
+        if self._count < self._size:
+            self._count += 1
+        self._times[i] = now
+        positions = self._positions
+        current = self._current
+        for k in _AXES:
+            positions[3 * i + k] = position[k]
+            current[k] = position[k]
+
+    # HMD position at time t into out, interpolated between the samples
+    # around t (clamped to the oldest / newest sample)
+    def _hmd_at(self, t, out):
+        times = self._times
+        positions = self._positions
+        size = self._size
+        i = self._newest
+        newer = -1
+        remaining = self._count
+        while remaining and times[i] > t:
+            newer = i
+            i = i - 1 if i > 0 else size - 1
+            remaining -= 1
+        if not remaining:
+            # older than the whole history: the oldest sample
+            i = newer
+            newer = -1
+        if newer < 0 or times[newer] == times[i]:
+            for k in _AXES:
+                out[k] = positions[3 * i + k]
+            return out
+        f = (t - times[i]) / (times[newer] - times[i])
+        for k in _AXES:
+            a = positions[3 * i + k]
+            out[k] = a + (positions[3 * newer + k] - a) * f
+        return out
+
+    # new PS Eye position with the timestamp of its sample
+    def add_optical(self, t, position):
+        bias = self.bias
+        if self._count == 0:
+            # no HMD position yet: output the optical position as it is
+            for k in _AXES:
+                bias[k] = position[k]
+            return
+        then = self._hmd_at(t - self.latency, self._then)
+        last = self._last_optical
+        self._last_optical = t
+        if last is None:
+            # first sample: take its offset as it is
+            gain = 1.0
+        else:
+            dt = t - last
+            gain = 1.0 - math.exp(-dt / self.time_constant) if dt > 0.0 else 0.0
+        for k in _AXES:
+            bias[k] += gain * (position[k] - then[k] - bias[k])
+
+    # fused head position: newest HMD position + bias
+    def output_into(self, out):
+        current = self._current
+        bias = self.bias
+        out[0] = current[0] + bias[0]
+        out[1] = current[1] + bias[1]
+        out[2] = current[2] + bias[2]
+        return out
@@ -0,0 +1,343 @@
+# Two-bone (shoulder, elbow, hand) arm model, replacing the fixed offsets of
+# calc_arm_model_into.
+#
+# ArmGeometry holds the body measures: the neck pivot relative to the eyes
+# (head frame), the shoulders relative to the neck, the upper arm and
+# forearm (elbow to controller) lengths, and the smallest elbow angle. The
+# neck follows the whole head pose; the shoulders only follow its heading,
+# the rotation about the vertical axis (index 1, "pitch", of the ALVR euler
+# angles), so nodding or tilting the head does not move them.
+#
+# 3DOF controllers (calc_arm_ik_into): the upper arm hangs from the shoulder
+# and swings forward by the upper arm roll (arm mode), reduced when the
+# wrist rolls inward as in calc_arm_model_into. The forearm points along the
+# controller. When that would fold the elbow tighter than min_elbow, the
+# upper arm turns toward the forearm by the missing angle.
+#
+# Tracked hands (reach_into / solve_two_bone_into): the elbow of a hand at
+# a known position, bent toward a pole direction. A target out of reach, or
+# closer than min_elbow allows, is moved along the shoulder-to-target line.
+#
+# Everything is closed form; ArmIKContext works like PoseContext and keeps
+# the elbow of every slot:
+#
+#   if starting:
+#       ctx = ArmIKContext(2, ArmGeometry())
+#   ctx.begin_frame(alvr.input_head_orientation, alvr.head_position)
+#   calc_arm_ik_into(ctx, orientation, +1, arm_roll, out, 0)
+#   ctx.elbows[0]                          # elbow of slot 0
+#
+# arm_ik_rows and two_bone_rows evaluate many rows at once with NumPy.
+# ArmGeometry(**LEGACY_GEOMETRY) reproduces calc_arm_model_into.
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from alvr_freepie.armmodel import PoseContext, _quaternion_rows, _normalized_roll_rows
+from alvr_freepie.quatmath import (new_quat, new_vec, euler2quaternion_into,
+    q_extract_axis_into, q_rotatevec_into, rotatevec_into)
+
+# the fixed offsets of calc_arm_model_into as an ArmGeometry
+LEGACY_GEOMETRY = {"neck": (0.0, 0.0, 0.0), "shoulder": (0.2, -0.10, -0.05),
+                   "upper": 0.25, "fore": 0.25, "stretch": 0.25, "min_elbow": 0.0}
+
+_EPSILON = 1e-9
+
+
+class ArmGeometry(object):
+    __slots__ = ("neck", "shoulder", "upper", "fore", "stretch", "min_elbow", "pole")
+
+    # meters and radians; x right, y up, z back. shoulder: right shoulder
+    # (mirrored for the left one); stretch: forearm extension at full upper
+    # arm roll; pole: direction the elbow of a tracked hand bends toward,
+    # right arm, heading frame
+    def __init__(self, neck=(0.0, -0.10, 0.08), shoulder=(0.18, -0.12, 0.0), upper=0.30,
+                 fore=0.32, stretch=0.0, min_elbow=math.radians(30.0), pole=(0.3, -1.0, 0.4)):
+        if upper <= 0.0 or fore <= 0.0:
+            raise ValueError("limb lengths must be positive")
+        if not 0.0 <= min_elbow < math.pi:
+            raise ValueError("min_elbow must be in [0, pi)")
+        self.neck = tuple(neck)
+        self.shoulder = tuple(shoulder)
+        self.upper = upper
+        self.fore = fore
+        self.stretch = stretch
+        self.min_elbow = min_elbow
+        self.pole = tuple(pole)
+
+    # shortest shoulder to hand distance the elbow limit allows
+    def near(self):
+        u = self.upper
+        f = self.fore
+        return math.sqrt(max(u*u + f*f - 2.0*u*f*math.cos(self.min_elbow), 0.0))
+
+
+class ArmIKContext(PoseContext):
+    __slots__ = ("geometry", "q_head", "neck_position", "shoulders", "poles", "forward",
+                 "elbows", "_vec")
+
+    def __init__(self, slots, geometry=None):
+        PoseContext.__init__(self, slots)
+        self.geometry = geometry if geometry is not None else ArmGeometry()
+        self.q_head = new_quat()
+        self.neck_position = [0.0, 0.0, 0.0]
+        # right / left shoulder and elbow pole, the heading's forward axis
+        self.shoulders = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]
+        self.poles = [[0.0, -1.0, 0.0], [0.0, -1.0, 0.0]]
+        self.forward = [0.0, 0.0, -1.0]
+        # elbow of each slot from the last solve
+        self.elbows = [[0.0, 0.0, 0.0] for _ in range(slots)]
+        self._vec = new_vec()
+
+    # compute the head derived terms once for the current frame
+    def begin_frame(self, head_orientation, head_position):
+        q = euler2quaternion_into(head_orientation, self.q_head)
+        q_extract_axis_into(q, 1, self.q_head_pitch)
+        self.head_position[0] = head_position[0]
+        self.head_position[1] = head_position[1]
+        self.head_position[2] = head_position[2]
+        g = self.geometry
+        v = self._vec
+        v[0] = g.neck[0]; v[1] = g.neck[1]; v[2] = g.neck[2]
+        q_rotatevec_into(q, v, v)
+        neck = self.neck_position
+        neck[0] = head_position[0] + v[0]
+        neck[1] = head_position[1] + v[1]
+        neck[2] = head_position[2] + v[2]
+        # the heading turns about y only: x' = c*x + s*z, z' = c*z - s*x
+        qy = self.q_head_pitch[1]
+        qw = self.q_head_pitch[3]
+        c = qw*qw - qy*qy
+        s = 2.0*qw*qy
+        sx, sy, sz = g.shoulder
+        px, py, pz = g.pole
+        right = self.shoulders[0]
+        right[0] = neck[0] + c*sx + s*sz
+        right[1] = neck[1] + sy
+        right[2] = neck[2] + c*sz - s*sx
+        left = self.shoulders[1]
+        left[0] = neck[0] - c*sx + s*sz
+        left[1] = right[1]
+        left[2] = neck[2] + c*sz + s*sx
+        pole = self.poles[0]
+        pole[0] = c*px + s*pz; pole[1] = py; pole[2] = c*pz - s*px
+        pole = self.poles[1]
+        pole[0] = -c*px + s*pz; pole[1] = py; pole[2] = c*pz + s*px
+        forward = self.forward
+        forward[0] = -s; forward[1] = 0.0; forward[2] = -c
+        self.head_computations += 1
+
+    # elbow and hand of a hand tracked at target (side +1 right / -1 left);
+    # stores the elbow of slot and returns hand
+    def reach_into(self, target, side, slot, hand):
+        i = 0 if side > 0 else 1
+        g = self.geometry
+        return solve_two_bone_into(self.shoulders[i], target, self.poles[i], g.upper, g.fore,
+                                   g.min_elbow, self.elbows[slot], hand)
+
+
+# two-bone arm model for a 3DOF controller with the geometry of ctx (an
+# ArmIKContext prepared with begin_frame); writes the controller position
+# into out and the elbow into ctx.elbows[slot]. Same arguments as
+# calc_arm_model_into.
+def calc_arm_ik_into(ctx, controller_orientation, leftright, upper_arm_roll, out, slot):
+    g = ctx.geometry
+
+    # forearm direction
+    v = ctx._hand
+    v[0] = 0.0; v[1] = 0.0; v[2] = -1.0
+    rotatevec_into(controller_orientation, v, v)
+    dx = v[0]; dy = v[1]; dz = v[2]
+
+    # upper arm hanging, swung forward by the arm roll
+    roll = ctx.normalized_roll(controller_orientation, slot)
+    if roll < 0.0:
+        swing = upper_arm_roll + roll # your elbow limits your possible hand rotation
+    else:
+        swing = upper_arm_roll
+    if swing < 0.0:
+        swing = 0.0
+    a = ctx._elbow
+    a[0] = 0.0; a[1] = -math.cos(swing); a[2] = -math.sin(swing)
+    q_rotatevec_into(ctx.q_head_pitch, a, a)
+    ax = a[0]; ay = a[1]; az = a[2]
+
+    # elbow limit: the angle between upper arm and forearm is acos(-a.d)
+    limit = math.cos(g.min_elbow)
+    ad = ax*dx + ay*dy + az*dz
+    if ad < -limit:
+        # turn the upper arm toward the forearm in their common plane
+        px = ax - ad*dx; py = ay - ad*dy; pz = az - ad*dz
+        n = math.sqrt(px*px + py*py + pz*pz)
+        if n < _EPSILON:
+            # arms in line: bend the elbow forward
+            f = ctx.forward
+            fd = f[0]*dx + f[1]*dy + f[2]*dz
+            px = f[0] - fd*dx; py = f[1] - fd*dy; pz = f[2] - fd*dz
+            n = math.sqrt(px*px + py*py + pz*pz)
+        s = math.sqrt(1.0 - limit*limit) / n
+        ax = s*px - limit*dx; ay = s*py - limit*dy; az = s*pz - limit*dz
+
+    shoulder = ctx.shoulders[0 if leftright > 0 else 1]
+    upper = g.upper
+    elbow = ctx.elbows[slot]
+    elbow[0] = shoulder[0] + upper*ax
+    elbow[1] = shoulder[1] + upper*ay
+    elbow[2] = shoulder[2] + upper*az
+    fore = g.fore + g.stretch*math.sin(upper_arm_roll)
+    out[0] = elbow[0] + fore*dx
+    out[1] = elbow[1] + fore*dy
+    out[2] = elbow[2] + fore*dz
+    return out
+
+# two-bone IK: elbow (into elbow) of an arm from shoulder with limb lengths
+# upper and fore whose hand is at target, bent toward pole; the angle at the
+# elbow stays at or above min_elbow. Writes the reachable hand position
+# nearest to target into hand and returns it.
+def solve_two_bone_into(shoulder, target, pole, upper, fore, min_elbow, elbow, hand):
+    sx = shoulder[0]; sy = shoulder[1]; sz = shoulder[2]
+    vx = target[0] - sx; vy = target[1] - sy; vz = target[2] - sz
+    d = math.sqrt(vx*vx + vy*vy + vz*vz)
+    if d < _EPSILON:
+        # no direction to reach in: along the pole
+        vx = pole[0]; vy = pole[1]; vz = pole[2]
+        d = math.sqrt(vx*vx + vy*vy + vz*vz)
+    vx /= d; vy /= d; vz /= d
+    near = math.sqrt(max(upper*upper + fore*fore - 2.0*upper*fore*math.cos(min_elbow), 0.0))
+    if d > upper + fore:
+        d = upper + fore
+    elif d < near:
+        d = near
+    # angle at the shoulder between the target line and the upper arm
+    c = (upper*upper + d*d - fore*fore) / (2.0*upper*d)
+    if c > 1.0:
+        c = 1.0
+    elif c < -1.0:
+        c = -1.0
+    s = math.sqrt(1.0 - c*c)
+    # bend direction: the pole without its part along the target line
+    pv = pole[0]*vx + pole[1]*vy + pole[2]*vz
+    bx = pole[0] - pv*vx; by = pole[1] - pv*vy; bz = pole[2] - pv*vz
+    n = math.sqrt(bx*bx + by*by + bz*bz)
+    if n < _EPSILON:
+        # pole along the target line: any perpendicular
+        if abs(vx) < 0.9:
+            bx = 0.0; by = vz; bz = -vy
+        else:
+            bx = -vz; by = 0.0; bz = vx
+        n = math.sqrt(bx*bx + by*by + bz*bz)
+    bx /= n; by /= n; bz /= n
+    elbow[0] = sx + upper*(c*vx + s*bx)
+    elbow[1] = sy + upper*(c*vy + s*by)
+    elbow[2] = sz + upper*(c*vz + s*bz)
+    hand[0] = sx + d*vx
+    hand[1] = sy + d*vy
+    hand[2] = sz + d*vz
+    return hand
+
+
+# v rotated by the rows of quaternion arrays
+def _rotate_rows(qx, qy, qz, qw, vx, vy, vz):
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    return (vx + qw * tx + (qy * tz - qz * ty),
+            vy + qw * ty + (qz * tx - qx * tz),
+            vz + qw * tz + (qx * ty - qy * tx))
+
+# calc_arm_ik_into for n rows with NumPy: row i uses head_orientation[i],
+# head_position[i] and orientations[i] (n x 3 arrays); sides and arm_rolls
+# are scalars or length n arrays. Writes the positions into out and, if
+# given, the elbows into elbows (n x 3 arrays); returns out.
+def arm_ik_rows(geometry, head_orientation, head_position, orientations, sides, arm_rolls,
+                out, elbows=None):
+    g = geometry
+    sides = numpy.asarray(sides, dtype=float)
+    hx, hy, hz, hw = _quaternion_rows(head_orientation)
+    # heading only
+    m = numpy.sqrt(hw*hw + hy*hy)
+    py = hy / m; pw = hw / m
+    zero = numpy.zeros_like(py)
+    nx, ny, nz = _rotate_rows(hx, hy, hz, hw, g.neck[0], g.neck[1], g.neck[2])
+    ox, oy, oz = _rotate_rows(zero, py, zero, pw, g.shoulder[0] * sides, g.shoulder[1],
+                              g.shoulder[2])
+    sx = head_position[:, 0] + nx + ox
+    sy = head_position[:, 1] + ny + oy
+    sz = head_position[:, 2] + nz + oz
+
+    qx, qy, qz, qw = _quaternion_rows(orientations)
+    dx, dy, dz = _rotate_rows(qx, qy, qz, qw, 0.0, 0.0, -1.0)
+
+    roll = _normalized_roll_rows(qx, qy, qz, qw)
+    swing = numpy.where(roll < 0.0, arm_rolls + roll, arm_rolls)
+    swing = numpy.maximum(swing, 0.0)
+    ax, ay, az = _rotate_rows(zero, py, zero, pw, 0.0, -numpy.cos(swing), -numpy.sin(swing))
+
+    limit = math.cos(g.min_elbow)
+    ad = ax*dx + ay*dy + az*dz
+    fold = ad < -limit
+    if fold.any():
+        px = ax - ad*dx; py2 = ay - ad*dy; pz = az - ad*dz
+        n = numpy.sqrt(px*px + py2*py2 + pz*pz)
+        line = n < _EPSILON
+        if line.any():
+            fx, fy, fz = _rotate_rows(zero, py, zero, pw, 0.0, 0.0, -1.0)
+            fd = fx*dx + fy*dy + fz*dz
+            px = numpy.where(line, fx - fd*dx, px)
+            py2 = numpy.where(line, fy - fd*dy, py2)
+            pz = numpy.where(line, fz - fd*dz, pz)
+            n = numpy.sqrt(px*px + py2*py2 + pz*pz)
+        s = math.sqrt(1.0 - limit*limit) / numpy.where(fold, n, 1.0)
+        ax = numpy.where(fold, s*px - limit*dx, ax)
+        ay = numpy.where(fold, s*py2 - limit*dy, ay)
+        az = numpy.where(fold, s*pz - limit*dz, az)
+
+    ex = sx + g.upper*ax
+    ey = sy + g.upper*ay
+    ez = sz + g.upper*az
+    if elbows is not None:
+        elbows[:, 0] = ex
+        elbows[:, 1] = ey
+        elbows[:, 2] = ez
+    fore = g.fore + g.stretch*numpy.sin(arm_rolls)
+    out[:, 0] = ex + fore*dx
+    out[:, 1] = ey + fore*dy
+    out[:, 2] = ez + fore*dz
+    return out
+
+# solve_two_bone_into for n rows with NumPy: shoulders, targets and poles
+# are n x 3 arrays (poles may be one row for all); writes elbows and hands
+# (n x 3 arrays) and returns hands
+def two_bone_rows(shoulders, targets, poles, upper, fore, min_elbow, elbows, hands):
+    poles = numpy.broadcast_to(numpy.asarray(poles, dtype=float), targets.shape)
+    v = targets - shoulders
+    d = numpy.sqrt((v*v).sum(axis=1))
+    flat = d < _EPSILON
+    if flat.any():
+        v = numpy.where(flat[:, None], poles, v)
+        d = numpy.sqrt((v*v).sum(axis=1))
+    v = v / d[:, None]
+    near = math.sqrt(max(upper*upper + fore*fore - 2.0*upper*fore*math.cos(min_elbow), 0.0))
+    d = numpy.clip(d, near, upper + fore)
+    c = numpy.clip((upper*upper + d*d - fore*fore) / (2.0*upper*d), -1.0, 1.0)
+    s = numpy.sqrt(1.0 - c*c)
+    b = poles - (poles*v).sum(axis=1)[:, None]*v
+    n = numpy.sqrt((b*b).sum(axis=1))
+    line = n < _EPSILON
+    if line.any():
+        vx = v[:, 0]; vy = v[:, 1]; vz = v[:, 2]
+        zero = numpy.zeros_like(vx)
+        small = numpy.abs(vx) < 0.9
+        perpendicular = numpy.stack([numpy.where(small, zero, -vz),
+                                     numpy.where(small, vz, zero),
+                                     numpy.where(small, -vy, vx)], axis=1)
+        b = numpy.where(line[:, None], perpendicular, b)
+        n = numpy.sqrt((b*b).sum(axis=1))
+    b = b / n[:, None]
+    elbows[:] = shoulders + upper*(c[:, None]*v + s[:, None]*b)
+    hands[:] = shoulders + d[:, None]*v
+    return hands
@@ -0,0 +1,145 @@
+# Per-stage latency instrumentation for the ALVR scripts.
+#
+# Instrumentation times named spans of a tick with the system clock (real
+# time, also in the headless runtime) and counts the durations in
+# preallocated log-scale histograms:
+#
+#   if starting:
+#       g_inst = Instrumentation(INSTRUMENT, sink=diagnostics.debug)
+#   t = g_inst.start()
+#   ... arm model ...
+#   g_inst.stop(SPAN_ARM_MODEL, t)
+#   g_inst.tick()      # once per script tick, emits the periodic summary
+#
+# When disabled start() returns 0.0 and stop() / tick() return at once, so
+# the spans can stay in the scripts. When enabled the p50 / p99 / max of
+# every span since the previous report go to sink every report_every
+# seconds, then the histograms are cleared. Spans may nest.
+#
+# Sampler thins out debug output such as diagnostics.watch:
+#   if g_watch.due():
+#       diagnostics.watch(...)
+
+from bisect import bisect_left
+
+from alvr_freepie.clock import system_clock
+
+SPAN_INGEST = 0
+SPAN_CONVERT = 1
+SPAN_ARM_MODEL = 2
+SPAN_BUTTON_MAP = 3
+SPAN_OUTPUT = 4
+SPAN_NAMES = ("ingest", "convert", "arm model", "button map", "output")
+
+# bucket upper edges in seconds, 4 per octave from 0.25 us to about 1 s;
+# a last bucket holds everything slower
+EDGES = tuple([0.25e-6 * 2.0 ** (i / 4.0) for i in range(89)])
+_ZEROS = (0,) * (len(EDGES) + 1)
+
+
+class Histogram(object):
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = list(_ZEROS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect_left(EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def clear(self):
+        self.counts[:] = _ZEROS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    # duration below which the fraction q of the samples lies, to bucket
+    # resolution (about 19%) and never above the maximum
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                if i < len(EDGES) and EDGES[i] < self.max:
+                    return EDGES[i]
+                return self.max
+        return self.max
+
+
+class Instrumentation(object):
+    __slots__ = ("enabled", "report_every", "sink", "names", "histograms",
+                 "_next_report")
+
+    # sink(text) receives one line per span with samples, e.g.
+    # diagnostics.debug; None keeps the histograms for summary() only
+    def __init__(self, enabled=True, report_every=5.0, sink=None, names=SPAN_NAMES):
+        self.enabled = enabled
+        self.report_every = report_every
+        self.sink = sink
+        self.names = names
+        self.histograms = [Histogram() for _ in names]
+        self._next_report = system_clock() + report_every
+
+    # start time of a span (0.0 while disabled)
+    def start(self):
+        if self.enabled:
+            return system_clock()
+        return 0.0
+
+    # end the span started at started
+    def stop(self, span, started):
+        if started:
+            self.histograms[span].add(system_clock() - started)
+
+    # report and clear the histograms when report_every has passed
+    def tick(self):
+        if not self.enabled or self.sink is None:
+            return
+        now = system_clock()
+        if now < self._next_report:
+            return
+        self._next_report = now + self.report_every
+        self.report()
+
+    def report(self):
+        for line in self.summary():
+            self.sink(line)
+        for histogram in self.histograms:
+            histogram.clear()
+
+    # one line per span with samples: count, p50, p99 and max in microseconds
+    def summary(self):
+        lines = []
+        for name, histogram in zip(self.names, self.histograms):
+            if histogram.count:
+                lines.append("%-10s n %6d  p50 %7.1f us  p99 %7.1f us  max %7.1f us" % (
+                    name, histogram.count, histogram.percentile(0.5) * 1e6,
+                    histogram.percentile(0.99) * 1e6, histogram.max * 1e6))
+        return lines
+
+
+class Sampler(object):
+    __slots__ = ("every", "_count")
+
+    def __init__(self, every):
+        self.every = every
+        self._count = 0
+
+    # True on every every-th call; never when every is 0
+    def due(self):
+        if not self.every:
+            return False
+        self._count += 1
+        if self._count < self.every:
+            return False
+        self._count = 0
+        return True
@@ -0,0 +1,179 @@
+# Late latching: run the pose work just before ALVR takes the poses for the
+# next headset frame, instead of whenever FreePIE happens to run the script.
+#
+# ALVR passes the overridden poses on when a tracking packet of the headset
+# arrives, which is also when alvr.input_head_orientation changes.
+# FrameCadence learns the period and phase of these changes. LateLatch is
+# called at the start of every tick: when the next tick would come after
+# `margin` seconds before the predicted frame, it sleeps until then, so that
+# this tick publishes right before the frame. It only waits while the
+# script loop is faster than the frames; a slower loop runs free. Samples that arrive in the
+# tracker transport (TRACKER_TRANSPORT) during the wait are polled after it.
+# freePieIO samples arrive with the update events between ticks.
+#
+# A frame is only seen at the next look at the head input, so each frame is
+# known to lie in the interval (previous look, look]. FrameCadence moves its
+# prediction by the least amount that puts it into the interval and
+# corrects the period by that error spread over the frames since the last
+# one seen. A tick that waited publishes right before the frame, so the next
+# look would come a whole loop period later and tell little about where the
+# frame was; LateLatch.probe at the end of that tick looks again
+# probe_delay seconds after the predicted frame instead. The head input must
+# be live: a new frame is visible whenever the input is read after it
+# arrived, also in the middle of a tick.
+#
+#   if starting:
+#       g_latch = LateLatch(margin=0.002)
+#   g_latch.wait(monotonic(), alvr.input_head_orientation)
+#   # poll the transport, arm models and outputs as usual
+#   g_latch.probe(monotonic(), alvr.input_head_orientation)
+#
+# The wait uses clock.sleep (time.sleep), which needs a 1 ms timer
+# resolution on Windows; LateLatch.late counts waits that overslept a frame.
+
+import math
+
+from alvr_freepie import clock
+
+# frames observed before the period comes from the phase errors instead of
+# the mean interval
+WARMUP_FRAMES = 16
+# frames observed before LateLatch waits
+LOCK_FRAMES = 64
+# LateLatch.probe looks this many seconds after the predicted frame
+PROBE_DELAY = 0.001
+# no wait once no frame was seen for this many periods (headset paused)
+LOST_PERIODS = 10
+# smoothing of the time from one tick to the next
+GAP_GAIN = 0.1
+
+
+class FrameCadence(object):
+    __slots__ = ("period", "phase", "frames", "period_gain", "_first")
+
+    # period: initial frame period in seconds (Oculus Go: 72 Hz);
+    # period_gain: share of a phase error that goes into the period
+    def __init__(self, period=1.0 / 72.0, period_gain=0.05):
+        self.period = period
+        self.period_gain = period_gain
+        # time of the last frame and frames observed
+        self.phase = 0.0
+        self.frames = 0
+        self._first = 0.0
+
+    # a frame arrived after lo and at or before hi
+    def observe(self, lo, hi):
+        frames = self.frames
+        self.frames = frames + 1
+        if frames < WARMUP_FRAMES:
+            # mean interval of the first frames, assuming none was missed
+            t = 0.5 * (lo + hi)
+            if frames == 0:
+                self._first = t
+            else:
+                self.period = (t - self._first) / frames
+            self.phase = t
+            return
+        period = self.period
+        if hi - lo > period:
+            # the script stalled, the interval does not tell which frame
+            self.phase += math.floor((hi - self.phase) / period) * period
+            return
+        k = max(1, int(math.floor((0.5 * (lo + hi) - self.phase) / period + 0.5)))
+        predicted = self.phase + k * period
+        if predicted <= lo:
+            error = lo - predicted
+        elif predicted > hi:
+            error = hi - predicted
+        else:
+            error = 0.0
+        self.phase = predicted + error
+        self.period = period + self.period_gain * error / k
+
+    # predicted time of the first frame after t
+    def next_frame(self, t):
+        period = self.period
+        return self.phase + (math.floor((t - self.phase) / period) + 1.0) * period
+
+
+class LateLatch(object):
+    __slots__ = ("cadence", "margin", "lock", "probe_delay", "waits", "late", "_head",
+                 "_looked", "_seen", "_frame", "_gap", "_end")
+
+    # margin: seconds before the predicted frame to publish at, covering the
+    # script's own work and the sleep overshoot; lock: frames to observe
+    # before waiting
+    def __init__(self, margin=0.002, lock=LOCK_FRAMES, period=1.0 / 72.0,
+                 probe_delay=PROBE_DELAY):
+        self.cadence = FrameCadence(period)
+        self.margin = margin
+        self.lock = lock
+        self.probe_delay = probe_delay
+        # ticks that waited / waits after which the frame had already arrived
+        self.waits = 0
+        self.late = 0
+        self._head = [None, None, None]
+        # time of the last look at the head input / of the last frame seen
+        self._looked = None
+        self._seen = 0.0
+        # predicted frame the last wait published for, until probed
+        self._frame = None
+        # smoothed time from the end of one tick to the start of the next
+        self._gap = 0.0
+        self._end = None
+
+    # call at the start of every tick with the current time and the ALVR
+    # head input; returns the time the tick continues at
+    def wait(self, now, head):
+        if self._end is not None:
+            if self._gap:
+                self._gap += GAP_GAIN * (now - self._end - self._gap)
+            else:
+                self._gap = now - self._end
+        self._look(now, head)
+        cadence = self.cadence
+        period = cadence.period
+        # a loop slower than the frames cannot serve every frame, and a wait
+        # would push the next tick past the following frame
+        if (cadence.frames >= self.lock and now - self._seen < LOST_PERIODS * period and
+                self._gap + self.margin + self.probe_delay < period):
+            target = cadence.next_frame(now) - self.margin
+            # wait only when the next tick would come after the target
+            if now < target <= now + self._gap:
+                clock.sleep(target - now)
+                now = clock.monotonic()
+                self.waits += 1
+                if self._look(now, head):
+                    self.late += 1
+                else:
+                    self._frame = target + self.margin
+        self._end = now
+        return now
+
+    # call at the end of every tick; after a wait, sleeps until probe_delay
+    # past the frame it published for and looks at the head input
+    def probe(self, now, head):
+        frame = self._frame
+        if frame is not None:
+            self._frame = None
+            t = frame + self.probe_delay
+            if now < t:
+                clock.sleep(t - now)
+                now = clock.monotonic()
+            self._look(now, head)
+        self._end = now
+        return now
+
+    # compare the head input with the last look; a change is a frame in
+    # (last look, t]. Returns whether there was one.
+    def _look(self, t, head):
+        last = self._head
+        if head[0] == last[0] and head[1] == last[1] and head[2] == last[2]:
+            self._looked = t
+            return False
+        last[0] = head[0]; last[1] = head[1]; last[2] = head[2]
+        if self._looked is not None:
+            self.cadence.observe(self._looked, t)
+            self._seen = t
+        self._looked = t
+        return True
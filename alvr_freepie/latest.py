@@ -0,0 +1,69 @@
+# Single-writer / multi-reader "latest sample" buffer for one tracked device.
+#
+# FreePIE runs the freePieIO update event and the script body separately, so
+# a reader can otherwise see the position of one sample next to the
+# orientation of another. LatestPose is a seqlock: the writer makes the
+# version odd, writes the timestamped pose and makes it even again; a reader
+# copies the pose and retries if the version was odd or changed meanwhile.
+# Readers never block the writer and nothing is allocated.
+#
+#   if starting:
+#       g_latest = LatestPose()
+#       g_pose = [0.0] * 6
+#       g_stamp = [0.0, 0]
+#   g_latest.publish(monotonic(), pose)       # update event (writer)
+#   if g_latest.read_into(g_pose, g_stamp):   # script body (readers)
+#       ... g_pose is one consistent sample taken at g_stamp[0]
+
+
+class LatestPose(object):
+    __slots__ = ("_version", "_data", "retries")
+
+    def __init__(self):
+        self._version = 0
+        # timestamp, x, y, z, yaw, pitch, roll
+        self._data = [0.0] * 7
+        # number of reads that had to be repeated (diagnostics)
+        self.retries = 0
+
+    # store pose ([x, y, z, yaw, pitch, roll]) sampled at time t; only one
+    # thread may publish
+    def publish(self, t, pose):
+        data = self._data
+        version = self._version + 1
+        self._version = version
+        data[0] = t
+        data[1] = pose[0]
+        data[2] = pose[1]
+        data[3] = pose[2]
+        data[4] = pose[3]
+        data[5] = pose[4]
+        data[6] = pose[5]
+        self._version = version + 1
+
+    # copy the latest pose into out and [timestamp, sequence] into stamp;
+    # returns the sequence number of the sample (0 = nothing published yet)
+    def read_into(self, out, stamp):
+        data = self._data
+        while True:
+            version = self._version
+            if version & 1:
+                self.retries += 1
+                continue
+            t = data[0]
+            out[0] = data[1]
+            out[1] = data[2]
+            out[2] = data[3]
+            out[3] = data[4]
+            out[4] = data[5]
+            out[5] = data[6]
+            if self._version == version:
+                sequence = version >> 1
+                stamp[0] = t
+                stamp[1] = sequence
+                return sequence
+            self.retries += 1
+
+    # sequence number of the latest published sample
+    def sequence(self):
+        return self._version >> 1
@@ -0,0 +1,151 @@
+# Frame rate independent fly mode locomotion.
+#
+# The Go trackpad y axis sets the target speed along the Go controller
+# direction: outside a dead zone the deflection is rescaled to 0..1, shaped
+# by an exponent (fine control near the center) and scaled to max_speed
+# (m/s). The current speed approaches the target with limited acceleration
+# (speeding up) and deceleration (slowing down, trackpad released). Speed
+# and distance are integrated over the measured time between ticks, so the
+# distance travelled does not depend on the script rate. The trackpad value
+# read at a tick holds until the next tick; over such an interval the
+# integration is exact (the speed is piecewise linear).
+#
+# fixed_step > 0 integrates in fixed steps instead: the time since the last
+# tick is accumulated and consumed in steps of fixed_step, and the offset is
+# interpolated between the last two steps, so irregular tick timing still
+# gives evenly spaced motion (at one step of latency).
+#
+#   if starting:
+#       g_fly = Locomotion(max_speed=0.12, acceleration=2.0, deceleration=4.0)
+#   g_fly.update(monotonic(), alvr.input_trackpad[1], direction, offset)
+#   g_fly.stop()           # not flying
+#   g_fly.reset(offset)    # back to the origin
+#
+# dt is clamped to max_dt so a stalled script does not jump on resume.
+
+_AXES = (0, 1, 2)
+
+
+class Locomotion(object):
+    __slots__ = ("max_speed", "acceleration", "deceleration", "dead_zone", "exponent",
+                 "fixed_step", "max_dt", "speed", "_target", "_last", "_accumulator",
+                 "_position", "_previous")
+
+    # max_speed m/s; acceleration / deceleration m/s^2, 0 = immediate;
+    # dead_zone and exponent shape the trackpad axis; fixed_step seconds,
+    # 0 = integrate over the measured dt
+    def __init__(self, max_speed=0.12, acceleration=2.0, deceleration=4.0, dead_zone=0.2,
+                 exponent=1.5, fixed_step=0.0, max_dt=0.1):
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.deceleration = deceleration
+        self.dead_zone = dead_zone
+        self.exponent = exponent
+        self.fixed_step = fixed_step
+        self.max_dt = max_dt
+        # current signed speed along the direction, m/s
+        self.speed = 0.0
+        # target speed of the trackpad value read at the last tick
+        self._target = 0.0
+        self._last = None
+        self._accumulator = 0.0
+        # offset at the last / previous fixed step
+        self._position = [0.0, 0.0, 0.0]
+        self._previous = [0.0, 0.0, 0.0]
+
+    # target speed for a trackpad axis value in -1..1
+    def target_speed(self, axis):
+        magnitude = abs(axis)
+        dead_zone = self.dead_zone
+        if magnitude <= dead_zone:
+            return 0.0
+        if magnitude >= 1.0:
+            speed = self.max_speed
+        else:
+            speed = self.max_speed * ((magnitude - dead_zone) / (1.0 - dead_zone)) ** self.exponent
+        return speed if axis > 0.0 else -speed
+
+    # move the speed towards target for dt seconds; returns the distance
+    def _advance(self, target, dt):
+        speed = self.speed
+        distance = 0.0
+        # at most two segments: slow down to 0, speed up in the other direction
+        while dt > 0.0 and speed != target:
+            if speed == 0.0 or (speed > 0.0 and target > speed) or (speed < 0.0 and target < speed):
+                rate = self.acceleration
+                goal = target
+            else:
+                rate = self.deceleration
+                goal = target if target * speed >= 0.0 else 0.0
+            change = goal - speed
+            if rate > 0.0 and abs(change) > rate * dt:
+                end = speed + (rate * dt if change > 0.0 else -rate * dt)
+                distance += 0.5 * (speed + end) * dt
+                speed = end
+                dt = 0.0
+            else:
+                used = abs(change) / rate if rate > 0.0 else 0.0
+                distance += 0.5 * (speed + goal) * used
+                speed = goal
+                dt -= used
+        self.speed = speed
+        return distance + speed * dt
+
+    # one tick in fly mode: axis is the trackpad y axis (0 when untouched),
+    # direction the unit flight direction; moves offset in place
+    def update(self, now, axis, direction, offset):
+        last = self._last
+        self._last = now
+        # the time since the last tick moves towards the target read then
+        target = self._target
+        self._target = self.target_speed(axis)
+        if last is None:
+            # first tick after stop(): no time has passed yet
+            dt = 0.0
+            position = self._position
+            previous = self._previous
+            for i in _AXES:
+                position[i] = offset[i]
+                previous[i] = offset[i]
+            self._accumulator = 0.0
+        else:
+            dt = now - last
+            if dt < 0.0:
+                dt = 0.0
+            elif dt > self.max_dt:
+                dt = self.max_dt
+        step = self.fixed_step
+        if step <= 0.0:
+            distance = self._advance(target, dt)
+            if distance != 0.0:
+                for i in _AXES:
+                    offset[i] += distance * direction[i]
+            return
+        position = self._position
+        previous = self._previous
+        accumulator = self._accumulator + dt
+        while accumulator >= step:
+            distance = self._advance(target, step)
+            for i in _AXES:
+                previous[i] = position[i]
+                position[i] += distance * direction[i]
+            accumulator -= step
+        self._accumulator = accumulator
+        alpha = accumulator / step
+        for i in _AXES:
+            offset[i] = previous[i] + (position[i] - previous[i]) * alpha
+
+    # left fly mode: stand still, the next update starts a new interval
+    def stop(self):
+        self.speed = 0.0
+        # target speed of the trackpad value read at the last tick
+        self._target = 0.0
+        self._last = None
+
+    # zero offset in place and stand still
+    def reset(self, offset):
+        self.speed = 0.0
+        for i in _AXES:
+            offset[i] = 0.0
+            self._position[i] = 0.0
+            self._previous[i] = 0.0
@@ -0,0 +1,131 @@
+# Default / fly / arm modes of the PS Move + Go controller layout.
+#
+# The select button cycles through the configured modes; holding the
+# activate button (move btn) enables the selected one:
+#   MODE_DEFAULT  the activate button is a "trackpad_click" and the Go
+#                 trackpad is passed through
+#   MODE_FLY      Go trackpad up/down flies into / against the Go controller
+#                 direction (alvr_freepie.locomotion), clicking the trackpad
+#                 resets the offset
+#   MODE_ARM      rolling the PS Move up/down rotates the virtual upper arm
+#
+#   if starting:
+#       g_modes = Modes(alvr, ctx, [(MODE_DEFAULT, "Default"), ...], 1, PSM_MOVE)
+#       g_buttons.on_press(PSM_SELECT, g_modes.next_mode)
+#       g_buttons.on_release(PSM_SELECT, g_modes.clear_message)
+#   g_modes.update(buttons, ps_move_yaw_pitch_roll)   # update event
+#   g_modes.tick(g_buttons.state, monotonic())        # script tick
+#
+# arm_roll feeds the arm model, offset moves the head.
+
+import math
+
+from alvr_freepie.locomotion import Locomotion
+from alvr_freepie.quatmath import new_quat, new_vec, rotatevec_into, get_normalized_roll_into
+
+MODE_DEFAULT = 0
+MODE_FLY  = 1
+MODE_ARM  = 2
+MODE_IDS = {"default": MODE_DEFAULT, "fly": MODE_FLY, "arm": MODE_ARM}
+
+
+class Modes(object):
+    __slots__ = ("alvr", "ctx", "modes", "controller", "activate",
+                 "trackpad_controller", "selected", "active", "origin_roll",
+                 "arm_roll", "arm_roll_old", "offset", "locomotion", "_fly_dir",
+                 "_roll_q", "_id_click", "_id_trackpad_touch", "_input_trackpad_touch",
+                 "_input_trackpad_click")
+
+    # modes: [(mode, name)]; controller: ALVR controller driven by the
+    # PS Move (arm mode, "trackpad_click"); activate: button bit enabling the
+    # selected mode; trackpad_controller: ALVR controller of the Go trackpad;
+    # locomotion: fly mode Locomotion (default settings if None)
+    def __init__(self, alvr, ctx, modes, controller, activate, trackpad_controller=0,
+                 locomotion=None):
+        self.alvr = alvr
+        self.ctx = ctx
+        self.modes = modes
+        self.controller = controller
+        self.activate = activate
+        self.trackpad_controller = trackpad_controller
+        self.selected = 0
+        self.active = MODE_DEFAULT
+        self.origin_roll = 0.0
+        self.arm_roll = 0.0
+        self.arm_roll_old = 0.0
+        self.offset = [0.0, 0.0, 0.0]
+        self.locomotion = locomotion if locomotion is not None else Locomotion()
+        self._fly_dir = new_vec()
+        # scratch quaternions of update(); it runs in the update event, so
+        # it does not share the ones of ctx with the script body
+        self._roll_q = (new_quat(), new_quat(), new_quat())
+        self._id_click = alvr.Id("trackpad_click")
+        self._id_trackpad_touch = alvr.Id("trackpad_touch")
+        self._input_trackpad_touch = alvr.InputId("trackpad_touch")
+        self._input_trackpad_click = alvr.InputId("trackpad_click")
+
+    # select btn pressed: switch to the next mode
+    def next_mode(self):
+        self.selected += 1
+        if self.selected >= len(self.modes):
+            self.selected = 0
+        self.alvr.message = "-> " + self.modes[self.selected][1]
+
+    # select btn released
+    def clear_message(self):
+        self.alvr.message = ""
+
+    # new PS Move sample: buttons is its packed mask, ypr its orientation
+    def update(self, buttons, ypr):
+        if buttons & self.activate:
+            if self.active == MODE_DEFAULT:
+                if self.modes[self.selected][0] == MODE_ARM:
+                    # fetch current controller orientation and normalize to roll axis
+                    q, q_axis, q_norm = self._roll_q
+                    self.origin_roll = get_normalized_roll_into(ypr, q, q_axis, q_norm)
+                    self.arm_roll_old = self.arm_roll
+            self.active = self.modes[self.selected][0]
+        else:
+            self.active = MODE_DEFAULT
+        if self.active == MODE_DEFAULT:
+            self.alvr.buttons[self.controller][self._id_click] = buttons & self.activate > 0
+
+    # per script tick; buttons is the last PS Move mask, now the monotonic time
+    def tick(self, buttons, now):
+        alvr = self.alvr
+        active = self.active
+        if active != MODE_FLY:
+            self.locomotion.stop()
+        if active == MODE_FLY:
+            alvr.message = "Fly Mode"
+            # touch upper half of trackpad to fly forward into controller direction, bottom half to fly backward
+            direction = self._fly_dir
+            direction[0] = 0.0; direction[1] = 0.0; direction[2] = -1.0
+            rotatevec_into(alvr.input_controller_orientation, direction, direction)
+            axis = alvr.input_trackpad[1] if alvr.input_buttons[self._input_trackpad_touch] else 0.0
+            self.locomotion.update(now, axis, direction, self.offset)
+            # reset movement by pressing trackpad in the center
+            if alvr.input_buttons[self._input_trackpad_click]:
+                self.locomotion.reset(self.offset)
+
+        elif active == MODE_ARM:
+            # fetch current controller orientation and normalize to roll axis
+            c_roll = self.ctx.normalized_roll(alvr.controller_orientation[self.controller],
+                                              self.controller)
+            arm_roll = self.arm_roll_old + (c_roll - self.origin_roll)
+            if arm_roll > math.pi/2:
+                arm_roll = math.pi/2
+            elif arm_roll < 0.0:
+                arm_roll = 0.0
+            self.arm_roll = arm_roll
+            alvr.message = "Arm " + "%.0f deg" % math.degrees(arm_roll)
+
+        else:
+            # map trackpad to controller
+            c = self.trackpad_controller
+            alvr.buttons[c][self._id_trackpad_touch] = alvr.input_buttons[self._input_trackpad_touch]
+            alvr.buttons[c][self._id_click] = alvr.input_buttons[self._input_trackpad_click]
+            alvr.trackpad[c][0] = alvr.input_trackpad[0]
+            alvr.trackpad[c][1] = alvr.input_trackpad[1]
+            if buttons == 0:
+                alvr.message = ""
@@ -0,0 +1,950 @@
+# Profile driven pipeline: one script for every controller layout.
+#
+# A profile describes the tracked devices, their offsets, the button
+# mappings and the modes of a layout. compile_profile turns it into flat
+# lists of prebound operations once, so a tick only runs
+# `for op in ops: op(now)` and never looks at the configuration again.
+#
+#   if starting:
+#       g_pipeline = compile_profile(load_profile(PROFILE), alvr, freePieIO, diagnostics)
+#       freePieIO[0].update += g_pipeline.update
+#   g_pipeline.tick()
+#
+# With the tracker transport, pass stamps=reader.samples and the poses are
+# stamped with the producer's capture time instead of the update event's.
+#
+# Profiles are JSON files (see profiles/) or INI files with one section per
+# object ([profile], [head], [arm], [modes], [device <name>], [controller <n>])
+# whose values are JSON literals or bare strings. Keys:
+#
+#   name           free text
+#   predict_model  "velocity" or "acceleration"
+#   override       ALVR values to override, default head_position,
+#                  controller_position and controller_orientation
+#   devices        {name: device}, tracked PS Moves:
+#       io         freePieIO slot
+#       offset     [x, y, z] added to the position, meters
+#       calibration  PS Eye to HMD calibration file (alvr_freepie.calibration)
+#                  replacing the centimeter to meter scale, if it exists;
+#                  the head device also has its lever arm removed
+#       position   false: orientation only (default true)
+#       filter     [min_cutoff, beta, angle_min_cutoff, angle_beta] (1-euro)
+#       predict    prediction lead time in seconds
+#       dead_reckoning  {stale_time, decay, horizon, blend_time, blend_share}:
+#                  move on with the last velocity while the PS Eye loses
+#                  the device (alvr_freepie.deadreckon), {} for defaults
+#   head
+#       position   device name, or "input": the ALVR head position plus the
+#                  fly mode offset
+#       fusion     {time_constant, latency}: fuse the device position with
+#                  the ALVR head position (alvr_freepie.fusion)
+#   controllers    list, the index is the ALVR controller:
+#       orientation     device name, or "input" (Go / Gear VR controller)
+#       position        device name, or "arm" (virtual arm model)
+#       side            +1 right / -1 left arm of the arm model
+#       trigger         "io3.yaw" / "io3.pitch" (PS Move trigger), or
+#                       "input" (Go trigger button)
+#       trigger_button  also write the PS Move trigger to "trigger"
+#       buttons         "io3.x" / "io3.y" (packed PS Move buttons)
+#       button_map      {PS Move button: ALVR button}
+#       input_buttons   {ALVR button: Go input button}, copied every tick
+#   modes          default / fly / arm modes (alvr_freepie.modes):
+#       controller           controller whose PS Move switches the modes
+#       list                 [[mode, message], ...]
+#       select / activate    PS Move buttons cycling / enabling the mode
+#       trackpad_controller  controller of the Go trackpad
+#       fly                  {max_speed, acceleration, deceleration, dead_zone,
+#                            exponent, fixed_step}, fly mode locomotion
+#                            (alvr_freepie.locomotion)
+#   arm            two-bone arm model (alvr_freepie.ik) for the "arm"
+#                  positions instead of the fixed elbow offsets: {upper,
+#                  fore, neck, shoulder, stretch, pole, min_elbow (degrees)}
+#   calibrate      PS Eye to HMD calibration mode, needs a head device:
+#       file       calibration file of every device (instead of their
+#                  "calibration"), loaded if it exists and written by the
+#                  solve
+#       samples    head samples after which the solve starts (default 2000)
+#       controller / button  PS Move button starting the sampling and
+#                  stopping it early (default controller 0, "select")
+#
+# The ALVR plugin allocates its arrays once, so operations keep references
+# to them.
+
+import json
+import math
+import operator
+
+try:
+    from ConfigParser import RawConfigParser
+except ImportError:
+    from configparser import RawConfigParser
+
+from alvr_freepie.armmodel import PoseContext, calc_arm_model_into
+from alvr_freepie.ik import ArmGeometry, ArmIKContext, calc_arm_ik_into
+from alvr_freepie.buttons import ButtonMap, PSM_BUTTON_BITS
+from alvr_freepie.calibration import (CalibrationSamples, device_matrix,
+    transform_point_into, rotate_orientation_into, remove_lever_arm_into,
+    solve_head_calibration, save_calibration, load_calibration)
+from alvr_freepie.clock import monotonic
+from alvr_freepie.deadreckon import DeadReckoning, STATUS_TRACKED
+from alvr_freepie.filters import OneEuroFilter
+from alvr_freepie.fusion import HeadFusion
+from alvr_freepie.instrument import (Instrumentation, Sampler, SPAN_INGEST,
+    SPAN_CONVERT, SPAN_ARM_MODEL, SPAN_BUTTON_MAP, SPAN_OUTPUT)
+from alvr_freepie.latest import LatestPose
+from alvr_freepie.locomotion import Locomotion
+from alvr_freepie.modes import Modes, MODE_IDS
+from alvr_freepie.predict import PosePredictor, MODEL_VELOCITY, MODEL_ACCELERATION
+from alvr_freepie.quatmath import new_quat, psm_euler2euler_into
+from alvr_freepie.session import SessionRecorder
+from alvr_freepie.transport import TIMESTAMP, FLAGS, FLAG_TRACKED
+
+PROFILE_KEYS = ("name", "predict_model", "override", "devices", "head",
+                "controllers", "modes", "arm", "calibrate")
+DEVICE_KEYS = ("io", "offset", "calibration", "position", "filter", "predict",
+               "dead_reckoning")
+DEAD_RECKONING_KEYS = ("stale_time", "decay", "horizon", "blend_time", "blend_share")
+HEAD_KEYS = ("position", "fusion")
+FUSION_KEYS = ("time_constant", "latency")
+CONTROLLER_KEYS = ("orientation", "position", "side", "trigger", "trigger_button",
+                   "buttons", "button_map", "input_buttons")
+ARM_KEYS = ("upper", "fore", "neck", "shoulder", "stretch", "pole", "min_elbow")
+CALIBRATE_KEYS = ("file", "samples", "controller", "button")
+MODES_KEYS = ("controller", "list", "select", "activate", "trackpad_controller", "fly")
+FLY_KEYS = ("max_speed", "acceleration", "deceleration", "dead_zone", "exponent",
+            "fixed_step")
+PREDICT_MODELS = {"velocity": MODEL_VELOCITY, "acceleration": MODEL_ACCELERATION}
+INPUT = "input"
+ARM = "arm"
+
+
+# read a profile from a .json or .ini file
+def load_profile(path):
+    if path.lower().endswith(".ini"):
+        return _load_ini(path)
+    with open(path) as f:
+        return json.load(f)
+
+def _load_ini(path):
+    parser = RawConfigParser()
+    parser.optionxform = str
+    if not parser.read(path):
+        raise IOError("cannot read profile %s" % path)
+    profile = {}
+    devices = {}
+    controllers = {}
+    for section in parser.sections():
+        values = dict((key, _ini_value(value)) for key, value in parser.items(section))
+        kind, _, name = section.partition(" ")
+        if kind == "profile":
+            profile.update(values)
+        elif kind in ("head", "modes", "arm"):
+            profile[kind] = values
+        elif kind == "device" and name:
+            devices[name.strip()] = values
+        elif kind == "controller" and name.strip().isdigit():
+            controllers[int(name)] = values
+        else:
+            raise ValueError("%s: unknown section [%s]" % (path, section))
+    if devices:
+        profile["devices"] = devices
+    if controllers:
+        if sorted(controllers) != list(range(len(controllers))):
+            raise ValueError("%s: controllers must be numbered 0, 1, ..." % path)
+        profile["controllers"] = [controllers[i] for i in range(len(controllers))]
+    return profile
+
+def _ini_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text.strip()
+
+def _check_keys(values, allowed, where):
+    for key in values:
+        if key not in allowed:
+            raise ValueError("unknown key %r in %s" % (key, where))
+
+# ArmGeometry of the profile's "arm" object, None without one
+def arm_geometry(profile):
+    arm = profile.get("arm")
+    if arm is None:
+        return None
+    _check_keys(arm, ARM_KEYS, "arm")
+    values = dict(arm)
+    if "min_elbow" in values:
+        values["min_elbow"] = math.radians(values["min_elbow"])
+    return ArmGeometry(**values)
+
+# "io3.yaw" -> (3, attrgetter("yaw"))
+def _io_source(text, where):
+    slot, _, attr = text.partition(".")
+    if not slot.startswith("io") or not slot[2:].isdigit() or not attr:
+        raise ValueError("%s: expected a source like 'io3.x', got %r" % (where, text))
+    return int(slot[2:]), operator.attrgetter(attr)
+
+def _button_bit(name, where):
+    if name not in PSM_BUTTON_BITS:
+        raise ValueError("%s: unknown PS Move button %r" % (where, name))
+    return PSM_BUTTON_BITS[name]
+
+
+# --- update event operations ------------------------------------------------
+
+# read position (meters, device matrix) and orientation (ALVR convention,
+# rotated by the calibration rotation if any) of one PS Move into pose;
+# time: the capture time, the producer's timestamp in sample (the device's
+# TrackerReader sample) if given, otherwise now
+class CapturePose(object):
+    __slots__ = ("io", "matrix", "rotation", "inst", "sample", "pose", "ypr", "q", "time")
+
+    def __init__(self, io, matrix, rotation, inst, sample=None):
+        self.io = io
+        self.matrix = matrix
+        self.rotation = rotation
+        self.inst = inst
+        self.sample = sample
+        self.pose = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.ypr = [0.0, 0.0, 0.0]
+        self.q = new_quat()
+        self.time = 0.0
+
+    def run(self, now):
+        io = self.io
+        self._stamp(now)
+        transform_point_into(self.matrix, io.x, io.y, io.z, self.pose)
+        self._orientation(io, self.pose)
+
+    def _stamp(self, now):
+        sample = self.sample
+        self.time = (sample[TIMESTAMP] or now) if sample else now
+
+    def _orientation(self, io, pose):
+        t = self.inst.start()
+        ypr = self.ypr
+        ypr[0] = io.yaw; ypr[1] = io.pitch; ypr[2] = io.roll
+        psm_euler2euler_into(ypr, ypr)
+        if self.rotation:
+            rotate_orientation_into(self.rotation, ypr, ypr, self.q)
+        pose[3] = ypr[0]; pose[4] = ypr[1]; pose[5] = ypr[2]
+        self.inst.stop(SPAN_CONVERT, t)
+
+
+# CapturePose of the head device with a calibration lever arm: the HMD
+# position instead of the head PS Move position (lever_arm None: the head
+# PS Move position, until a calibration mode solve sets one)
+class CaptureHeadPose(CapturePose):
+    __slots__ = ("lever_arm", "head_orientation")
+
+    def __init__(self, io, matrix, rotation, inst, lever_arm, head_orientation, sample=None):
+        CapturePose.__init__(self, io, matrix, rotation, inst, sample)
+        self.lever_arm = lever_arm
+        self.head_orientation = head_orientation
+
+    def run(self, now):
+        io = self.io
+        pose = self.pose
+        self._stamp(now)
+        transform_point_into(self.matrix, io.x, io.y, io.z, pose)
+        if self.lever_arm:
+            remove_lever_arm_into(self.lever_arm, self.head_orientation, pose, pose)
+        self._orientation(io, pose)
+
+
+# CapturePose for devices without position tracking; the position stays 0
+class CaptureOrientation(CapturePose):
+    __slots__ = ()
+
+    def run(self, now):
+        self._stamp(now)
+        self._orientation(self.io, self.pose)
+
+
+# DeadReckoning.check_sample status of the newest sample of one PS Move,
+# with the tracker status of sample (TrackerReader sample) if given
+class CheckSample(object):
+    __slots__ = ("io", "sample", "reckoner", "status")
+
+    def __init__(self, io, sample, reckoner):
+        self.io = io
+        self.sample = sample
+        self.reckoner = reckoner
+        self.status = STATUS_TRACKED
+
+    def run(self, now):
+        io = self.io
+        sample = self.sample
+        tracked = sample[FLAGS] & FLAG_TRACKED != 0 if sample else True
+        self.status = self.reckoner.check_sample(io.x, io.y, io.z, tracked)
+
+
+# filter / publish the pose of capture at its capture time
+class FilterPose(object):
+    __slots__ = ("capture", "pose", "pose_filter")
+
+    def __init__(self, capture, pose_filter):
+        self.capture = capture
+        self.pose = capture.pose
+        self.pose_filter = pose_filter
+
+    def run(self, now):
+        self.pose_filter.filter_into(self.capture.time, self.pose, self.pose)
+
+
+class PublishPose(object):
+    __slots__ = ("capture", "pose", "latest")
+
+    def __init__(self, capture, latest):
+        self.capture = capture
+        self.pose = capture.pose
+        self.latest = latest
+
+    def run(self, now):
+        self.latest.publish(self.capture.time, self.pose)
+
+
+class PsmTrigger(object):
+    __slots__ = ("io", "trigger", "triggers", "controller")
+
+    def __init__(self, io, trigger, alvr, controller):
+        self.io = io
+        self.trigger = trigger
+        self.triggers = alvr.trigger
+        self.controller = controller
+
+    def run(self, now):
+        self.triggers[self.controller] = self.trigger(self.io)
+
+
+# packed PS Move buttons of one controller
+class PsmButtons(object):
+    __slots__ = ("io", "mask", "buttons")
+
+    def __init__(self, io, mask, buttons):
+        self.io = io
+        self.mask = mask
+        self.buttons = buttons
+
+    def run(self, now):
+        self.buttons.update(int(self.mask(self.io)))
+
+
+# the PS Move trigger as ALVR "trigger" button
+class PsmTriggerButton(object):
+    __slots__ = ("io", "trigger", "row", "index")
+
+    def __init__(self, io, trigger, alvr, controller):
+        self.io = io
+        self.trigger = trigger
+        self.row = alvr.buttons[controller]
+        self.index = alvr.Id("trigger")
+
+    def run(self, now):
+        self.row[self.index] = self.trigger(self.io)
+
+
+# PS Eye to HMD calibration mode: toggle (the PS Move button) starts
+# collecting pairs of the raw head PS Move position and the HMD pose in the
+# update event (sample); toggle again or a full buffer leaves the solve to
+# the next tick (solve, the first read operation), which saves the result
+# and applies it to the captures
+class CalibrationMode(object):
+    __slots__ = ("alvr", "path", "head_io", "samples", "captures", "calibrating",
+                 "solve_pending")
+
+    # captures: [(CapturePose, offset)] of every device
+    def __init__(self, alvr, path, head_io, samples, captures):
+        self.alvr = alvr
+        self.path = path
+        self.head_io = head_io
+        self.samples = samples
+        self.captures = captures
+        self.calibrating = False
+        self.solve_pending = False
+
+    # use calibration (None: uncalibrated) for the device transforms
+    def apply(self, calibration):
+        for capture, offset in self.captures:
+            capture.matrix = device_matrix(calibration, offset)
+            capture.rotation = calibration["rotation"] if calibration else None
+            if isinstance(capture, CaptureHeadPose):
+                capture.lever_arm = calibration.get("lever_arm") if calibration else None
+
+    def toggle(self):
+        alvr = self.alvr
+        if not self.calibrating:
+            self.samples.clear()
+            self.calibrating = True
+            alvr.message = "Calibration: move and turn your head around"
+            return
+        self.calibrating = False
+        self.solve_pending = True
+        alvr.message = "Calibration: solving"
+
+    def sample(self, now):
+        if not self.calibrating:
+            return
+        alvr = self.alvr
+        head = self.head_io
+        hmd = alvr.input_head_position
+        samples = self.samples
+        if samples.add(head.x, head.y, head.z, hmd[0], hmd[1], hmd[2],
+                       alvr.input_head_orientation):
+            alvr.message = "Calibration: %d samples" % len(samples.source)
+        if samples.full():
+            self.toggle()
+
+    # the solve takes too long for the update event
+    def solve(self, now):
+        if not self.solve_pending:
+            return
+        self.solve_pending = False
+        alvr = self.alvr
+        samples = self.samples
+        try:
+            calibration = solve_head_calibration(samples.source, samples.target,
+                                                 samples.rotations)
+        except ValueError as e:
+            alvr.message = "Calibration failed: %s" % e
+            return
+        save_calibration(self.path, calibration)
+        self.apply(calibration)
+        alvr.message = "Calibrated, error %.0f mm" % (calibration["rms"] * 1000)
+
+
+class ModesUpdate(object):
+    __slots__ = ("io", "mask", "ypr", "modes")
+
+    def __init__(self, io, mask, ypr, modes):
+        self.io = io
+        self.mask = mask
+        self.ypr = ypr
+        self.modes = modes
+
+    def run(self, now):
+        self.modes.update(int(self.mask(self.io)), self.ypr)
+
+
+# --- script tick operations -------------------------------------------------
+
+class ReadPose(object):
+    __slots__ = ("latest", "pose", "stamp")
+
+    def __init__(self, latest):
+        self.latest = latest
+        self.pose = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.stamp = [0.0, 0]
+
+    def run(self, now):
+        self.latest.read_into(self.pose, self.stamp)
+
+
+# feed new samples of a ReadPose to a predictor and extrapolate its pose
+class PredictPose(object):
+    __slots__ = ("read", "predictor", "last_sequence")
+
+    def __init__(self, read, predictor):
+        self.read = read
+        self.predictor = predictor
+        self.last_sequence = 0
+
+    def run(self, now):
+        pose = self.read.pose
+        stamp = self.read.stamp
+        if stamp[1] != self.last_sequence:
+            self.last_sequence = stamp[1]
+            self.predictor.add_sample(stamp[0], pose[0], pose[1], pose[2],
+                                      pose[3], pose[4], pose[5])
+        self.predictor.predict_into(now, pose)
+
+
+# dead reckoning of a ReadPose (alvr_freepie.deadreckon): add feeds it the
+# new samples before the prediction, run replaces / corrects the position
+# after it; the predictor restarts when tracking returns
+class ReckonPose(object):
+    __slots__ = ("read", "reckoner", "check", "predictor", "last_sequence")
+
+    def __init__(self, read, reckoner, check, predictor):
+        self.read = read
+        self.reckoner = reckoner
+        self.check = check
+        self.predictor = predictor
+        self.last_sequence = 0
+
+    def add(self, now):
+        stamp = self.read.stamp
+        if stamp[1] != self.last_sequence:
+            self.last_sequence = stamp[1]
+            if (self.reckoner.add_sample(stamp[0], self.read.pose, self.check.status)
+                    and self.predictor):
+                self.predictor.reset()
+
+    def run(self, now):
+        if self.reckoner.active(now):
+            self.reckoner.output_into(now, self.read.pose)
+
+
+# head position from HeadFusion of the ALVR head position and a device;
+# with check (CheckSample) only its optical fixes correct the HMD
+class FuseHead(object):
+    __slots__ = ("read", "fusion", "hmd", "out", "hmd_last", "check", "sequence")
+
+    def __init__(self, read, fusion, hmd, out, check=None):
+        self.read = read
+        self.fusion = fusion
+        self.hmd = hmd
+        self.out = out
+        # the HMD position given to fusion last; ALVR updates it once per
+        # headset frame, fusion wants each frame once
+        self.hmd_last = None
+        self.check = check
+        # sequence of the last sample given to fusion
+        self.sequence = 0
+
+    def run(self, now):
+        hmd = self.hmd
+        current = (hmd[0], hmd[1], hmd[2])
+        if current != self.hmd_last:
+            self.hmd_last = current
+            self.fusion.add_hmd(now, hmd)
+        read = self.read
+        if read.stamp[1] != self.sequence:
+            self.sequence = read.stamp[1]
+            if self.check is None or self.check.status == STATUS_TRACKED:
+                self.fusion.add_optical(read.stamp[0], read.pose)
+        self.fusion.output_into(self.out)
+
+
+# dst[0..2] = src[start..start+2]
+class Copy3(object):
+    __slots__ = ("src", "start", "dst")
+
+    def __init__(self, src, start, dst):
+        self.src = src
+        self.start = start
+        self.dst = dst
+
+    def run(self, now):
+        src = self.src
+        dst = self.dst
+        i = self.start
+        dst[0] = src[i]
+        dst[1] = src[i + 1]
+        dst[2] = src[i + 2]
+
+
+# dst = src + offset
+class AddOffset(object):
+    __slots__ = ("src", "offset", "dst")
+
+    def __init__(self, src, offset, dst):
+        self.src = src
+        self.offset = offset
+        self.dst = dst
+
+    def run(self, now):
+        src = self.src
+        offset = self.offset
+        dst = self.dst
+        dst[0] = src[0] + offset[0]
+        dst[1] = src[1] + offset[1]
+        dst[2] = src[2] + offset[2]
+
+
+class BeginFrame(object):
+    __slots__ = ("ctx", "head_orientation", "head_position")
+
+    def __init__(self, ctx, head_orientation, head_position):
+        self.ctx = ctx
+        self.head_orientation = head_orientation
+        self.head_position = head_position
+
+    def run(self, now):
+        self.ctx.begin_frame(self.head_orientation, self.head_position)
+
+
+class ArmModel(object):
+    __slots__ = ("ctx", "frame", "orientation", "side", "state", "out", "slot", "solve")
+
+    # frame: the BeginFrame of ctx (the rig scheduler runs it);
+    # state: object whose arm_roll is the upper arm roll (Modes)
+    def __init__(self, ctx, frame, orientation, side, state, out, slot):
+        # an ArmIKContext selects the two-bone arm model
+        self.solve = calc_arm_ik_into if isinstance(ctx, ArmIKContext) else calc_arm_model_into
+        self.ctx = ctx
+        self.frame = frame
+        self.orientation = orientation
+        self.side = side
+        self.state = state
+        self.out = out
+        self.slot = slot
+
+    def run(self, now):
+        self.solve(self.ctx, self.orientation, self.side, self.state.arm_roll,
+                   self.out, self.slot)
+
+
+# ALVR buttons from Go input buttons
+class InputButtons(object):
+    __slots__ = ("row", "inputs", "pairs")
+
+    def __init__(self, alvr, controller, pairs):
+        self.row = alvr.buttons[controller]
+        self.inputs = alvr.input_buttons
+        self.pairs = tuple(pairs)
+
+    def run(self, now):
+        row = self.row
+        inputs = self.inputs
+        for index, input_index in self.pairs:
+            row[index] = inputs[input_index]
+
+
+# analog trigger from the ALVR "trigger" button
+class InputTrigger(object):
+    __slots__ = ("row", "index", "triggers", "controller")
+
+    def __init__(self, alvr, controller):
+        self.row = alvr.buttons[controller]
+        self.index = alvr.Id("trigger")
+        self.triggers = alvr.trigger
+        self.controller = controller
+
+    def run(self, now):
+        self.triggers[self.controller] = 1.0 if self.row[self.index] else 0.0
+
+
+class ModesTick(object):
+    __slots__ = ("modes", "buttons")
+
+    def __init__(self, modes, buttons):
+        self.modes = modes
+        self.buttons = buttons
+
+    def run(self, now):
+        self.modes.tick(self.buttons.state, now)
+
+
+# upper arm roll when there are no modes
+class _FixedArm(object):
+    arm_roll = 0.0
+
+
+class Pipeline(object):
+    __slots__ = ("name", "alvr", "freepie_io", "diagnostics", "ingest_ops",
+                 "button_ops", "read_ops", "arm_ops", "output_ops", "watch_values",
+                 "recorder", "inst", "watch", "modes", "arm_models")
+
+    def __init__(self, name, alvr, freepie_io, diagnostics):
+        self.name = name
+        self.alvr = alvr
+        self.freepie_io = freepie_io
+        self.diagnostics = diagnostics
+        self.ingest_ops = []
+        self.button_ops = []
+        self.read_ops = []
+        self.arm_ops = []
+        self.output_ops = []
+        # (array, index) pairs shown in the watch panel
+        self.watch_values = []
+        self.recorder = None
+        self.inst = Instrumentation(False)
+        self.watch = Sampler(0)
+        self.modes = None
+        # the ArmModel operations of arm_ops (batched by alvr_freepie.rigs)
+        self.arm_models = []
+
+    # freePieIO update event
+    def update(self):
+        now = monotonic()
+        inst = self.inst
+        t = inst.start()
+        for op in self.ingest_ops:
+            op(now)
+        inst.stop(SPAN_INGEST, t)
+        t = inst.start()
+        for op in self.button_ops:
+            op(now)
+        inst.stop(SPAN_BUTTON_MAP, t)
+
+    # script tick
+    def tick(self):
+        now = self.begin_tick()
+        inst = self.inst
+        t = inst.start()
+        for op in self.read_ops:
+            op(now)
+        for op in self.arm_ops:
+            op(now)
+        inst.stop(SPAN_ARM_MODEL, t)
+        self.end_tick(now)
+
+    # the parts of tick() around the read and arm model operations, for
+    # callers that run those themselves (alvr_freepie.rigs); returns now
+    def begin_tick(self):
+        if self.recorder:
+            self.recorder.record(self.alvr, self.freepie_io)
+        return monotonic()
+
+    # last tick of the script (FreePIE's `stopping`): close the recorder
+    def stop(self):
+        if self.recorder:
+            self.recorder.close()
+
+    def end_tick(self, now):
+        inst = self.inst
+        t = inst.start()
+        for op in self.output_ops:
+            op(now)
+        inst.stop(SPAN_OUTPUT, t)
+        if self.watch.due():
+            watch = self.diagnostics.watch
+            for array, index in self.watch_values:
+                watch(array[index])
+        inst.tick()
+
+
+# build the Pipeline of profile; record_session, instrument,
+# instrument_report and watch_every work like the script constants;
+# stamps: TrackerReader.samples when the PS Moves come over the transport,
+# so that poses are stamped with the producer's capture time
+def compile_profile(profile, alvr, freepie_io, diagnostics, record_session="",
+                    instrument=False, instrument_report=5.0, watch_every=0, stamps=None):
+    _check_keys(profile, PROFILE_KEYS, "profile")
+    pipeline = Pipeline(profile.get("name", ""), alvr, freepie_io, diagnostics)
+    inst = Instrumentation(instrument, instrument_report, diagnostics.debug)
+    pipeline.inst = inst
+    pipeline.watch = Sampler(watch_every)
+    model = PREDICT_MODELS.get(profile.get("predict_model", "velocity"))
+    if model is None:
+        raise ValueError("unknown predict_model %r" % profile["predict_model"])
+
+    # devices: capture in the update event, read in the tick
+    captures = {}
+    offsets = {}
+    reads = {}
+    checks = {}
+    head_device = profile.get("head", {}).get("position", INPUT)
+    calibrate = profile.get("calibrate")
+    if calibrate is not None:
+        _check_keys(calibrate, CALIBRATE_KEYS, "calibrate")
+        if not calibrate.get("file"):
+            raise ValueError("calibrate: file is required")
+        if head_device == INPUT:
+            raise ValueError("calibrate: needs a head device")
+        shared_calibration = load_calibration(calibrate["file"])
+    for name, device in sorted(profile.get("devices", {}).items()):
+        where = "device %r" % name
+        _check_keys(device, DEVICE_KEYS, where)
+        io = freepie_io[device["io"]]
+        sample = stamps[device["io"]] if stamps and device["io"] < len(stamps) else None
+        offset = [float(v) for v in device.get("offset", (0.0, 0.0, 0.0))]
+        if calibrate is None:
+            calibration = load_calibration(device.get("calibration"))
+        elif "calibration" in device:
+            raise ValueError("%s: calibration comes from calibrate" % where)
+        else:
+            calibration = shared_calibration
+        matrix = device_matrix(calibration, offset)
+        rotation = calibration["rotation"] if calibration else None
+        lever_arm = calibration.get("lever_arm") if calibration else None
+        if not device.get("position", True):
+            capture = CaptureOrientation(io, matrix, rotation, inst, sample)
+        elif name == head_device and (lever_arm or calibrate is not None):
+            capture = CaptureHeadPose(io, matrix, rotation, inst, lever_arm,
+                                      alvr.input_head_orientation, sample)
+        else:
+            capture = CapturePose(io, matrix, rotation, inst, sample)
+        pipeline.ingest_ops.append(capture.run)
+        reckoning = device.get("dead_reckoning")
+        if reckoning is not None:
+            _check_keys(reckoning, DEAD_RECKONING_KEYS, where + " dead_reckoning")
+            if not device.get("position", True):
+                raise ValueError("%s: dead_reckoning needs a position" % where)
+            check = CheckSample(io, sample, DeadReckoning(**reckoning))
+            pipeline.ingest_ops.append(check.run)
+            checks[name] = check
+        if device.get("filter"):
+            min_cutoff, beta, angle_min_cutoff, angle_beta = device["filter"]
+            pose_filter = OneEuroFilter(min_cutoff, beta, angle_min_cutoff, angle_beta)
+            pipeline.ingest_ops.append(FilterPose(capture, pose_filter).run)
+        latest = LatestPose()
+        pipeline.ingest_ops.append(PublishPose(capture, latest).run)
+        captures[name] = capture
+        offsets[name] = offset
+
+        read = ReadPose(latest)
+        pipeline.read_ops.append(read.run)
+        predictor = None
+        if device.get("predict", 0.0) > 0.0:
+            predictor = PosePredictor(device["predict"], model)
+        reckon = None
+        if reckoning is not None:
+            reckon = ReckonPose(read, check.reckoner, check, predictor)
+            pipeline.read_ops.append(reckon.add)
+        if predictor:
+            pipeline.read_ops.append(PredictPose(read, predictor).run)
+        if reckon:
+            pipeline.read_ops.append(reckon.run)
+        reads[name] = read
+
+    def device_read(name, where):
+        if name not in reads:
+            raise ValueError("%s: unknown device %r" % (where, name))
+        return reads[name]
+
+    calibration_mode = None
+    if calibrate is not None:
+        if head_device not in captures:
+            raise ValueError("calibrate: unknown head device %r" % head_device)
+        calibration_mode = CalibrationMode(
+            alvr, calibrate["file"], freepie_io[profile["devices"][head_device]["io"]],
+            CalibrationSamples(calibrate.get("samples", 2000)),
+            [(captures[name], offsets[name]) for name in sorted(captures)])
+        pipeline.ingest_ops.append(calibration_mode.sample)
+        pipeline.read_ops.insert(0, calibration_mode.solve)
+
+    controllers = profile.get("controllers", [])
+    for c, controller in enumerate(controllers):
+        _check_keys(controller, CONTROLLER_KEYS, "controller %d" % c)
+    if not 1 <= len(controllers) <= 2:
+        raise ValueError("a profile needs 1 or 2 controllers")
+
+    geometry = arm_geometry(profile)
+    if geometry is None:
+        ctx = PoseContext(len(controllers))
+    else:
+        ctx = ArmIKContext(len(controllers), geometry)
+
+    # modes
+    frame = BeginFrame(ctx, alvr.input_head_orientation, alvr.head_position)
+    arm_state = _FixedArm()
+    modes = None
+    modes_config = profile.get("modes")
+    if modes_config:
+        _check_keys(modes_config, MODES_KEYS, "modes")
+        if "controller" not in modes_config or "list" not in modes_config:
+            raise ValueError("modes: controller and list are required")
+        c = modes_config["controller"]
+        mode_list = []
+        for mode, message in modes_config["list"]:
+            if mode not in MODE_IDS:
+                raise ValueError("modes: unknown mode %r" % mode)
+            mode_list.append((MODE_IDS[mode], message))
+        fly = modes_config.get("fly", {})
+        _check_keys(fly, FLY_KEYS, "modes fly")
+        modes = Modes(alvr, ctx, mode_list, c,
+                      _button_bit(modes_config.get("activate", "move"), "modes"),
+                      modes_config.get("trackpad_controller", 0), Locomotion(**fly))
+        arm_state = modes
+        pipeline.modes = modes
+
+    head = profile.get("head", {})
+    _check_keys(head, HEAD_KEYS, "head")
+    head_source = head.get("position", INPUT)
+    if head_source == INPUT and "fusion" in head:
+        raise ValueError("head: fusion needs a device position")
+    if head_source != INPUT:
+        read = device_read(head_source, "head")
+        fusion = head.get("fusion")
+        if fusion is not None:
+            _check_keys(fusion, FUSION_KEYS, "head fusion")
+            if profile["devices"][head_source].get("predict", 0.0) > 0.0:
+                raise ValueError("head: fusion needs device %r without predict" % head_source)
+            pipeline.output_ops.append(FuseHead(read, HeadFusion(**fusion),
+                                                alvr.input_head_position,
+                                                alvr.head_position,
+                                                checks.get(head_source)).run)
+        else:
+            pipeline.output_ops.append(Copy3(read.pose, 0, alvr.head_position).run)
+        pipeline.watch_values.append((alvr.head_position, 0))
+
+    # controllers
+    mode_ops = []
+    calibration_button = False
+    arm_used = False
+    for c, controller in enumerate(controllers):
+        where = "controller %d" % c
+        orientation_source = controller.get("orientation", INPUT)
+        if orientation_source == INPUT:
+            orientation = alvr.input_controller_orientation
+            orientation_ypr = None
+        else:
+            read = device_read(orientation_source, where)
+            orientation = [0.0, 0.0, 0.0]
+            pipeline.read_ops.append(Copy3(read.pose, 3, orientation).run)
+            orientation_ypr = captures[orientation_source].ypr
+
+        position_source = controller.get("position", ARM)
+        if position_source == ARM:
+            arm_used = True
+            arm = ArmModel(ctx, frame, orientation, controller.get("side", 1),
+                           arm_state, alvr.controller_position[c], c)
+            pipeline.arm_ops.append(arm.run)
+            pipeline.arm_models.append(arm)
+        else:
+            read = device_read(position_source, where)
+            pipeline.output_ops.append(Copy3(read.pose, 0, alvr.controller_position[c]).run)
+        pipeline.output_ops.append(Copy3(orientation, 0, alvr.controller_orientation[c]).run)
+
+        input_pairs = [(alvr.Id(name), alvr.InputId(input_name))
+                       for name, input_name in sorted(controller.get("input_buttons", {}).items())]
+        if input_pairs:
+            pipeline.output_ops.append(InputButtons(alvr, c, input_pairs).run)
+        trigger = controller.get("trigger")
+        if trigger == INPUT:
+            pipeline.output_ops.append(InputTrigger(alvr, c).run)
+        elif trigger:
+            slot, trigger = _io_source(trigger, where)
+            pipeline.button_ops.append(PsmTrigger(freepie_io[slot], trigger, alvr, c).run)
+            if controller.get("trigger_button"):
+                pipeline.button_ops.append(
+                    PsmTriggerButton(freepie_io[slot], trigger, alvr, c).run)
+
+        if controller.get("buttons"):
+            slot, mask = _io_source(controller["buttons"], where)
+            mapping = [(_button_bit(button, where), name)
+                       for button, name in sorted(controller.get("button_map", {}).items())]
+            buttons = ButtonMap(alvr, c, mapping)
+            if calibration_mode and calibrate.get("controller", 0) == c:
+                buttons.on_press(_button_bit(calibrate.get("button", "select"), "calibrate"),
+                                 calibration_mode.toggle)
+                calibration_button = True
+            if modes and modes.controller == c:
+                if orientation_ypr is None:
+                    raise ValueError("%s: modes need a PS Move orientation" % where)
+                select = _button_bit(modes_config.get("select", "select"), "modes")
+                buttons.on_press(select, modes.next_mode)
+                buttons.on_release(select, modes.clear_message)
+                # the mode switch sees the mask before the select callbacks
+                pipeline.button_ops.append(
+                    ModesUpdate(freepie_io[slot], mask, orientation_ypr, modes).run)
+                mode_ops.append(ModesTick(modes, buttons).run)
+            pipeline.button_ops.append(PsmButtons(freepie_io[slot], mask, buttons).run)
+
+        pipeline.watch_values.append((alvr.controller_position[c], 0))
+        pipeline.watch_values.append((alvr.controller_orientation[c], 0))
+        pipeline.watch_values.append((alvr.trigger, c))
+
+    if modes and not mode_ops:
+        raise ValueError("modes: controller %d has no PS Move buttons" % modes.controller)
+    if calibration_mode and not calibration_button:
+        raise ValueError("calibrate: controller %d has no PS Move buttons"
+                         % calibrate.get("controller", 0))
+    if arm_used:
+        pipeline.arm_ops.insert(0, frame.run)
+    pipeline.output_ops.extend(mode_ops)
+    if head_source == INPUT:
+        offset = modes.offset if modes else [0.0, 0.0, 0.0]
+        pipeline.output_ops.append(AddOffset(alvr.input_head_position, offset,
+                                             alvr.head_position).run)
+        pipeline.watch_values.insert(0, (alvr.head_position, 0))
+
+    # ALVR setup
+    alvr.two_controllers = len(controllers) == 2
+    for name in profile.get("override", ("head_position", "controller_position",
+                                         "controller_orientation")):
+        setattr(alvr, "override_" + name, True)
+    if record_session:
+        pipeline.recorder = SessionRecorder(record_session, freepie_io)
+    return pipeline
@@ -0,0 +1,135 @@
+# Pose prediction to hide the PSMoveService / PS Eye pipeline delay.
+#
+# A PosePredictor keeps the last few tracker samples of one device in a fixed
+# size ring buffer and extrapolates position and euler angles by lead_time
+# seconds past the requested time:
+#   MODEL_VELOCITY      p + v*dt
+#   MODEL_ACCELERATION  p + v*dt + a*dt*dt/2
+# Velocity is estimated over the whole history window, acceleration from its
+# first, middle and last sample. Angle differences are wrapped to [-pi, pi].
+#
+#   if starting:
+#       g_predictor = PosePredictor(lead_time=0.03)
+#   g_predictor.add_sample(monotonic(), x, y, z, yaw, pitch, roll)   # new sample
+#   g_predictor.predict_into(monotonic(), g_pose)                   # every tick
+#
+# No lists are created after construction.
+
+import math
+
+MODEL_VELOCITY = 0
+MODEL_ACCELERATION = 1
+
+_TWO_PI = 2.0 * math.pi
+# time, x, y, z, yaw, pitch, roll
+_STRIDE = 7
+# pose fields after the time stamp; tuples so loops allocate nothing on
+# IronPython, where range() builds a list
+_FIELDS = (1, 2, 3, 4, 5, 6)
+
+
+def _wrap(angle):
+    if angle > math.pi:
+        return angle - _TWO_PI
+    if angle < -math.pi:
+        return angle + _TWO_PI
+    return angle
+
+
+class PosePredictor(object):
+    __slots__ = ("lead_time", "model", "max_dt", "_history", "_size",
+                 "_count", "_head")
+
+    # lead_time: seconds to extrapolate past the requested time
+    # history: samples used for the estimate (>= 2, >= 3 for acceleration)
+    # max_dt: never extrapolate further than this (e.g. after tracking loss)
+    def __init__(self, lead_time=0.0, model=MODEL_VELOCITY, history=4, max_dt=0.1):
+        if history < (3 if model == MODEL_ACCELERATION else 2):
+            raise ValueError("history too short for the prediction model")
+        self.lead_time = lead_time
+        self.model = model
+        self.max_dt = max_dt
+        self._history = [0.0] * (history * _STRIDE)
+        self._size = history
+        self._count = 0
+        self._head = 0
+
+    def reset(self):
+        self._count = 0
+        self._head = 0
+
+    # store a new tracker sample taken at time t (seconds)
+    def add_sample(self, t, x, y, z, yaw, pitch, roll):
+        h = self._history
+        i = self._head * _STRIDE
+        h[i] = t
+        h[i + 1] = x
+        h[i + 2] = y
+        h[i + 3] = z
+        h[i + 4] = yaw
+        h[i + 5] = pitch
+        h[i + 6] = roll
+        self._head = (self._head + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    # offset (in _history) of the n-th oldest stored sample
+    def _offset(self, n):
+        return ((self._head - self._count + n) % self._size) * _STRIDE
+
+    # write the pose predicted for time t + lead_time into out
+    # ([x, y, z, yaw, pitch, roll]); returns out unchanged if nothing is known
+    def predict_into(self, t, out):
+        count = self._count
+        if count == 0:
+            return out
+        h = self._history
+        last = self._offset(count - 1)
+        dt = t + self.lead_time - h[last]
+        if dt > self.max_dt:
+            dt = self.max_dt
+        elif dt < 0.0:
+            dt = 0.0
+        if count < 2 or dt == 0.0:
+            return self._latest_into(last, out)
+
+        first = self._offset(0)
+        span = h[last] - h[first]
+        if span <= 0.0:
+            return self._latest_into(last, out)
+        acceleration = self.model == MODEL_ACCELERATION and count >= 3
+        if acceleration:
+            mid = self._offset(count // 2)
+            span0 = h[mid] - h[first]
+            span1 = h[last] - h[mid]
+            if span0 <= 0.0 or span1 <= 0.0:
+                acceleration = False
+        for k in _FIELDS:
+            value = h[last + k]
+            delta = value - h[first + k]
+            if k > 3:
+                delta = _wrap(delta)
+            v = delta / span
+            if acceleration:
+                d0 = h[mid + k] - h[first + k]
+                d1 = value - h[mid + k]
+                if k > 3:
+                    d0 = _wrap(d0)
+                    d1 = _wrap(d1)
+                v1 = d1 / span1
+                a = (v1 - d0 / span0) / (0.5 * span)
+                # velocity at the last sample
+                v = v1 + a * 0.5 * span1
+                value += v * dt + 0.5 * a * dt * dt
+            else:
+                value += v * dt
+            if k > 3:
+                value = _wrap(value)
+            out[k - 1] = value
+        return out
+
+    def _latest_into(self, last, out):
+        h = self._history
+        for k in _FIELDS:
+            out[k - 1] = h[last + k]
+        return out
@@ -0,0 +1,253 @@
+# Quaternion / euler math shared by the ALVR FreePIE scripts.
+#
+# Quaternions are [x, y, z, w], euler angles are [yaw, pitch, roll] in radians.
+#
+# Every operation comes in two flavours:
+#  - the classic list returning functions (multiply, conj, rotatevec, ...)
+#    which the scripts used to carry around as copies
+#  - "_into" variants that write into a caller supplied output buffer instead
+#    of building new lists. Use these in per-tick code with buffers created
+#    once at startup (see new_quat / new_vec). CPython still allocates the
+#    float objects of the intermediate results, so they are not free of
+#    allocations, only of list allocations.
+#
+# Input and output buffers of the "_into" variants may be the same list.
+# No function keeps module level scratch buffers, so all of them may be
+# called from the FreePIE update event and the script body at once.
+
+import math
+
+HALF_PI = math.pi / 2
+# cos(pitch) of the ALVR euler angles below which psm_euler2euler_into takes
+# the two-step path, so poses at or near gimbal lock split between yaw and
+# roll exactly as in the original scripts
+GIMBAL_COS = 1e-4
+_GIMBAL_COS2 = GIMBAL_COS * GIMBAL_COS
+
+
+def sign(x): return 1 if x >= 0 else -1
+
+# allocate a quaternion buffer (identity)
+def new_quat():
+    return [0.0, 0.0, 0.0, 1.0]
+
+# allocate a vector buffer; 4 elements so it can be used as a pure quaternion
+def new_vec():
+    return [0.0, 0.0, 0.0, 0.0]
+
+
+# conjugate quaternion
+def conj_into(q, out):
+    out[0] = -q[0]
+    out[1] = -q[1]
+    out[2] = -q[2]
+    out[3] = q[3]
+    return out
+
+def conj(q):
+    return conj_into(q, [0.0, 0.0, 0.0, 0.0])
+
+# multiplication of quaternion (a * b)
+def multiply_into(a, b, out):
+    x0, y0, z0, w0 = a
+    x1, y1, z1, w1 = b
+    out[0] = x1 * w0 - y1 * z0 + z1 * y0 + w1 * x0
+    out[1] = x1 * z0 + y1 * w0 - z1 * x0 + w1 * y0
+    out[2] = -x1 * y0 + y1 * x0 + z1 * w0 + w1 * z0
+    out[3] = -x1 * x0 - y1 * y0 - z1 * z0 + w1 * w0
+    return out
+
+def multiply(a, b):
+    return multiply_into(a, b, [0.0, 0.0, 0.0, 0.0])
+
+# convert quaternion to euler
+def quaternion2euler_into(q, out):
+    x = q[0]; y = q[1]; z = q[2]; w = q[3]
+    # roll (x-axis rotation)
+    sinr = 2.0 * (w * x + y * z)
+    cosr = 1.0 - 2.0 * (x * x + y * y)
+    roll = math.atan2(sinr, cosr)
+
+    # pitch (y-axis rotation)
+    sinp = 2.0 * (w * y - z * x)
+    if math.fabs(sinp) >= 1:
+        pitch = math.copysign(HALF_PI, sinp)
+    else:
+        pitch = math.asin(sinp)
+
+    # yaw (z-axis rotation)
+    siny = 2.0 * (w * z + x * y)
+    cosy = 1.0 - 2.0 * (y * y + z * z)
+
+    out[0] = math.atan2(siny, cosy)
+    out[1] = pitch
+    out[2] = roll
+    return out
+
+def quaternion2euler(q):
+    return quaternion2euler_into(q, [0.0, 0.0, 0.0])
+
+# convert euler to quaternion
+def euler2quaternion_into(yaw_pitch_roll, out):
+    hy = yaw_pitch_roll[0] * 0.5
+    hp = yaw_pitch_roll[1] * 0.5
+    hr = yaw_pitch_roll[2] * 0.5
+    cy = math.cos(hy); sy = math.sin(hy)
+    cp = math.cos(hp); sp = math.sin(hp)
+    cr = math.cos(hr); sr = math.sin(hr)
+    out[0] = cy * sr * cp - sy * cr * sp
+    out[1] = cy * cr * sp + sy * sr * cp
+    out[2] = sy * cr * cp - cy * sr * sp
+    out[3] = cy * cr * cp + sy * sr * sp
+    return out
+
+def euler2quaternion(yaw_pitch_roll):
+    return euler2quaternion_into(yaw_pitch_roll, [0.0, 0.0, 0.0, 0.0])
+
+# convert PS Move euler angles to quaternion
+def psm_euler2quaternion_into(yaw_pitch_roll, out):
+    hy = yaw_pitch_roll[0] * 0.5
+    hp = yaw_pitch_roll[1] * 0.5
+    hr = yaw_pitch_roll[2] * 0.5
+    cy = math.cos(hy); sy = math.sin(hy)
+    cp = math.cos(hp); sp = math.sin(hp)
+    cr = math.cos(hr); sr = math.sin(hr)
+    out[0] = cy * cr * sp + sy * sr * cp
+    out[1] = sy * cr * cp + cy * sr * sp
+    out[2] = cy * sr * cp - sy * cr * sp
+    out[3] = cy * cr * cp - sy * sr * sp
+    return out
+
+def psm_euler2quaternion(yaw_pitch_roll):
+    return psm_euler2quaternion_into(yaw_pitch_roll, [0.0, 0.0, 0.0, 0.0])
+
+# extract the rotation of a given axis from a quaternion
+def q_extract_axis_into(q, axis, out):
+    # q[0] = x; q[1] = y; q[2] = z; q[3] = w
+    if axis < 0 or axis > 2:
+        out[0] = q[0]; out[1] = q[1]; out[2] = q[2]; out[3] = q[3]
+        return out
+    a = q[axis]
+    w = q[3]
+    mag = math.sqrt(w*w + a*a)
+    out[0] = 0.0
+    out[1] = 0.0
+    out[2] = 0.0
+    out[axis] = a / mag
+    out[3] = w / mag
+    return out
+
+def q_extract_axis(q, axis):
+    return q_extract_axis_into(q, axis, [0.0, 0.0, 0.0, 0.0])
+
+# rotate specified vector using a unit quaternion
+# fused form of multiply(multiply(q, vec), conj(q)) without the intermediate
+# products: v' = v + w*t + q_xyz x t  with  t = 2 * (q_xyz x v)
+def q_rotatevec_into(q, vec, out):
+    qx = q[0]; qy = q[1]; qz = q[2]; qw = q[3]
+    vx = vec[0]; vy = vec[1]; vz = vec[2]
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    out[0] = vx + qw * tx + (qy * tz - qz * ty)
+    out[1] = vy + qw * ty + (qz * tx - qx * tz)
+    out[2] = vz + qw * tz + (qx * ty - qy * tx)
+    out[3] = vec[3] if len(vec) > 3 else 0.0
+    return out
+
+def q_rotatevec(q, vec):
+    return q_rotatevec_into(q, vec, [0.0, 0.0, 0.0, 0.0])
+
+# rotate specified vector using yaw_pitch_roll
+def rotatevec_into(yaw_pitch_roll, vec, out):
+    hy = yaw_pitch_roll[0] * 0.5
+    hp = yaw_pitch_roll[1] * 0.5
+    hr = yaw_pitch_roll[2] * 0.5
+    cy = math.cos(hy); sy = math.sin(hy)
+    cp = math.cos(hp); sp = math.sin(hp)
+    cr = math.cos(hr); sr = math.sin(hr)
+    qx = cy * sr * cp - sy * cr * sp
+    qy = cy * cr * sp + sy * sr * cp
+    qz = sy * cr * cp - cy * sr * sp
+    qw = cy * cr * cp + sy * sr * sp
+    vx = vec[0]; vy = vec[1]; vz = vec[2]
+    tx = 2.0 * (qy * vz - qz * vy)
+    ty = 2.0 * (qz * vx - qx * vz)
+    tz = 2.0 * (qx * vy - qy * vx)
+    out[0] = vx + qw * tx + (qy * tz - qz * ty)
+    out[1] = vy + qw * ty + (qz * tx - qx * tz)
+    out[2] = vz + qw * tz + (qx * ty - qy * tx)
+    out[3] = vec[3] if len(vec) > 3 else 0.0
+    return out
+
+def rotatevec(yaw_pitch_roll, vec):
+    return rotatevec_into(yaw_pitch_roll, vec, [0.0, 0.0, 0.0, 0.0])
+
+# convert PS Move euler angles directly to ALVR euler angles
+# closed form of quaternion2euler(psm_euler2quaternion(yaw_pitch_roll)): the
+# PS Move rotation is Ry(yaw) * Rz(roll) * Rx(pitch), so the matrix entries
+# quaternion2euler reads are
+#   m10 = sin(roll)             m00 = cos(yaw) cos(roll)
+#   m20 = -sin(yaw) cos(roll)
+#   m21 = sin(yaw) sin(roll) cos(pitch) + cos(yaw) sin(pitch)
+#   m22 = cos(yaw) cos(pitch) - sin(yaw) sin(roll) sin(pitch)
+# and no quaternion is formed. Equal to the two-step path within rounding.
+# Near gimbal lock (cos(pitch) < GIMBAL_COS) the split between yaw and roll
+# is arbitrary and the two-step path is taken instead, so the result is the
+# same as the original scripts there, bit for bit.
+def psm_euler2euler_into(yaw_pitch_roll, out):
+    yaw = yaw_pitch_roll[0]
+    pitch = yaw_pitch_roll[1]
+    roll = yaw_pitch_roll[2]
+    cy = math.cos(yaw); sy = math.sin(yaw)
+    cp = math.cos(pitch); sp = math.sin(pitch)
+    cr = math.cos(roll); sr = math.sin(roll)
+    sinp = sy * cr
+    if 1.0 - sinp * sinp < _GIMBAL_COS2:
+        return _psm_euler2euler_two_step(yaw, pitch, roll, out)
+    out[1] = math.asin(sinp)
+    sysr = sy * sr
+    out[0] = math.atan2(sr, cy * cr)
+    out[2] = math.atan2(sysr * cp + cy * sp, cy * cp - sysr * sp)
+    return out
+
+# quaternion2euler_into(psm_euler2quaternion_into(...)) without a buffer
+def _psm_euler2euler_two_step(yaw, pitch, roll, out):
+    hy = yaw * 0.5
+    hp = pitch * 0.5
+    hr = roll * 0.5
+    cy = math.cos(hy); sy = math.sin(hy)
+    cp = math.cos(hp); sp = math.sin(hp)
+    cr = math.cos(hr); sr = math.sin(hr)
+    x = cy * cr * sp + sy * sr * cp
+    y = sy * cr * cp + cy * sr * sp
+    z = cy * sr * cp - sy * cr * sp
+    w = cy * cr * cp - sy * sr * sp
+    sinp = 2.0 * (w * y - z * x)
+    if math.fabs(sinp) >= 1:
+        out[1] = math.copysign(HALF_PI, sinp)
+    else:
+        out[1] = math.asin(sinp)
+    out[0] = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    out[2] = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    return out
+
+def psm_euler2euler(yaw_pitch_roll):
+    return psm_euler2euler_into(yaw_pitch_roll, [0.0, 0.0, 0.0])
+
+# to overcome a flipped rotation beyond 90 deg we "normalize" the rotation
+# by rotating the other axis back to 0 deg -> now we get the desired angle
+# independent from orientation. q, q_axis and q_norm are quaternion scratch
+# buffers owned by the caller (see new_quat)
+def get_normalized_roll_into(yaw_pitch_roll, q, q_axis, q_norm):
+    euler2quaternion_into(yaw_pitch_roll, q)
+    conj_into(q_extract_axis_into(q, 1, q_axis), q_axis)
+    multiply_into(q_axis, q, q_norm)
+    conj_into(q_extract_axis_into(q, 2, q_axis), q_axis)
+    multiply_into(q_axis, q_norm, q_norm)
+    # roll of quaternion2euler(q_norm)
+    x = q_norm[0]; y = q_norm[1]; z = q_norm[2]; w = q_norm[3]
+    return math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+
+def get_normalized_roll(yaw_pitch_roll):
+    return get_normalized_roll_into(yaw_pitch_roll, new_quat(), new_quat(), new_quat())
@@ -0,0 +1,176 @@
+# Several rigs (one HMD with its controllers each) driven from one process.
+#
+# A Rig is a profile pipeline (alvr_freepie.pipeline) bound to its own alvr
+# object and its own freePieIO slots. All of its state lives in the
+# pipeline's operations, not in module globals, so any number of rigs can
+# run side by side. RigScheduler ticks them all; with NumPy it evaluates the
+# arm models of every rig in one call (armmodel.arm_model_rows) instead of
+# one calc_arm_model_into per controller. Arm models of profiles with an
+# "arm" geometry go through ik.arm_ik_rows, one call per distinct geometry.
+#
+#   if starting:
+#       profile = load_profile("profiles/single_psmove.json")
+#       g_rigs = RigScheduler([Rig(profile, alvr_a, rig_io(freePieIO, 0), diagnostics),
+#                              Rig(profile, alvr_b, rig_io(freePieIO, 4), diagnostics)])
+#   g_rigs.tick()
+#
+# The batched path runs each rig's begin_frame as the per-rig tick does and
+# stores the two-bone elbows in ArmIKContext.elbows.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from alvr_freepie.armmodel import NUMPY_MIN_COUNT, arm_model_rows
+from alvr_freepie.ik import ArmIKContext, arm_ik_rows
+from alvr_freepie.pipeline import compile_profile
+
+RIG_IO_SLOTS = 4
+
+
+# the freePieIO slots base .. base + 3 of one rig, in the order the profile
+# io indices expect
+def rig_io(freepie_io, base):
+    return [freepie_io[base + i] for i in range(RIG_IO_SLOTS)]
+
+
+class Rig(object):
+    __slots__ = ("name", "alvr", "freepie_io", "pipeline")
+
+    # profile: profile dict (load_profile); freepie_io: the rig's 4 freePieIO
+    # slots (rig_io)
+    def __init__(self, profile, alvr, freepie_io, diagnostics):
+        self.pipeline = compile_profile(profile, alvr, freepie_io, diagnostics)
+        self.name = self.pipeline.name
+        self.alvr = alvr
+        self.freepie_io = freepie_io
+        freepie_io[0].update += self.pipeline.update
+
+
+class RigScheduler(object):
+    __slots__ = ("rigs", "batched", "_arms", "_groups", "_frames", "_elbow_rows", "_times",
+                 "_head_orientations", "_head_positions", "_orientations", "_sides",
+                 "_arm_rolls", "_positions", "_elbows")
+
+    # batched: None = batch the arm models with NumPy if it can be imported
+    # and there are enough of them for it to be faster
+    def __init__(self, rigs, batched=None):
+        self.rigs = list(rigs)
+        # arms ordered by geometry: (geometry or None, first, end) per group
+        groups = {}
+        for rig in self.rigs:
+            for arm in rig.pipeline.arm_models:
+                geometry = arm.ctx.geometry if isinstance(arm.ctx, ArmIKContext) else None
+                groups.setdefault(_geometry_key(geometry), (geometry, []))[1].append(arm)
+        self._arms = []
+        self._groups = []
+        for key in sorted(groups):
+            geometry, arms = groups[key]
+            self._groups.append((geometry, len(self._arms), len(self._arms) + len(arms)))
+            self._arms.extend(arms)
+        # (rig index, BeginFrame) of every rig with arm models
+        self._frames = []
+        for i, rig in enumerate(self.rigs):
+            if rig.pipeline.arm_models:
+                self._frames.append((i, rig.pipeline.arm_models[0].frame))
+        # (row, ctx.elbows[slot]) of the two-bone arm models
+        self._elbow_rows = [(row, arm.ctx.elbows[arm.slot]) for row, arm in enumerate(self._arms)
+                            if isinstance(arm.ctx, ArmIKContext)]
+        count = len(self._arms)
+        if batched is None:
+            batched = numpy is not None and count >= NUMPY_MIN_COUNT
+        elif batched and numpy is None:
+            raise ImportError("NumPy is not available")
+        self.batched = batched
+        self._times = [0.0] * len(self.rigs)
+        # flat x, y, z lists gathered per tick, NumPy arrays for the solve
+        self._head_orientations = [0.0] * (3 * count)
+        self._head_positions = [0.0] * (3 * count)
+        self._orientations = [0.0] * (3 * count)
+        self._arm_rolls = [0.0] * count
+        if batched:
+            self._sides = numpy.array([float(arm.side) for arm in self._arms])
+            self._positions = numpy.zeros((count, 3))
+            self._elbows = numpy.zeros((count, 3))
+        else:
+            self._sides = None
+            self._positions = None
+            self._elbows = None
+
+    # one tick of every rig
+    def tick(self):
+        rigs = self.rigs
+        if not self.batched:
+            for rig in rigs:
+                rig.pipeline.tick()
+            return
+        times = self._times
+        for i, rig in enumerate(rigs):
+            pipeline = rig.pipeline
+            now = pipeline.begin_tick()
+            for op in pipeline.read_ops:
+                op(now)
+            times[i] = now
+        for i, frame in self._frames:
+            frame.run(times[i])
+        if self._arms:
+            self._solve_arms()
+        for i, rig in enumerate(rigs):
+            rig.pipeline.end_tick(times[i])
+
+    # all arm models in one arm_model_rows / arm_ik_rows call per geometry
+    def _solve_arms(self):
+        arms = self._arms
+        head_orientations = self._head_orientations
+        head_positions = self._head_positions
+        orientations = self._orientations
+        arm_rolls = self._arm_rolls
+        k = 0
+        for i, arm in enumerate(arms):
+            frame = arm.frame
+            a = frame.head_orientation
+            b = frame.head_position
+            c = arm.orientation
+            head_orientations[k] = a[0]; head_orientations[k + 1] = a[1]
+            head_orientations[k + 2] = a[2]
+            head_positions[k] = b[0]; head_positions[k + 1] = b[1]; head_positions[k + 2] = b[2]
+            orientations[k] = c[0]; orientations[k + 1] = c[1]; orientations[k + 2] = c[2]
+            arm_rolls[i] = arm.state.arm_roll
+            k += 3
+        count = len(arms)
+        head_orientations = numpy.array(head_orientations).reshape(count, 3)
+        head_positions = numpy.array(head_positions).reshape(count, 3)
+        orientations = numpy.array(orientations).reshape(count, 3)
+        arm_rolls = numpy.array(arm_rolls)
+        positions = self._positions
+        elbows = self._elbows
+        sides = self._sides
+        for geometry, first, end in self._groups:
+            if geometry is None:
+                arm_model_rows(head_orientations[first:end], head_positions[first:end],
+                               orientations[first:end], sides[first:end],
+                               arm_rolls[first:end], positions[first:end])
+            else:
+                arm_ik_rows(geometry, head_orientations[first:end], head_positions[first:end],
+                            orientations[first:end], sides[first:end], arm_rolls[first:end],
+                            positions[first:end], elbows[first:end])
+        values = positions.ravel().tolist()
+        k = 0
+        for arm in arms:
+            out = arm.out
+            out[0] = values[k]; out[1] = values[k + 1]; out[2] = values[k + 2]
+            k += 3
+        if self._elbow_rows:
+            values = elbows.ravel().tolist()
+            for row, elbow in self._elbow_rows:
+                k = 3 * row
+                elbow[0] = values[k]; elbow[1] = values[k + 1]; elbow[2] = values[k + 2]
+
+
+# sort key grouping equal geometries, the fixed arm model (None) first
+def _geometry_key(geometry):
+    if geometry is None:
+        return ()
+    return (geometry.neck, geometry.shoulder, geometry.upper, geometry.fore, geometry.stretch,
+            geometry.min_elbow, geometry.pole)
@@ -0,0 +1,222 @@
+# Record and replay of tracker sessions.
+#
+# A session file is an append-only sequence of fixed-width little-endian
+# records after a 16 byte header, so it can be memory-mapped and indexed
+# directly. One record per script tick holds:
+#   timestamp (double, seconds), tick (uint32), flags (uint32),
+#   freePieIO[0..3] x/y/z/yaw/pitch/roll (24 doubles, slot 3 carries the
+#   packed triggers/buttons), alvr.input_head_orientation,
+#   input_head_position, input_controller_orientation,
+#   input_controller_position (12 doubles), input_trackpad (2 doubles),
+#   input_buttons as bitmask (uint32)
+#
+# Recording inside a script:
+#   if starting:
+#       g_recorder = SessionRecorder("session.afps", freePieIO)
+#   g_recorder.record(alvr, freePieIO)
+#   if stopping:
+#       g_recorder.close()
+#
+# SessionRecorder packs each tick into a preallocated ring buffer and only
+# touches the file when the buffer is full, every flush_interval seconds and
+# on close, so a stopped script loses at most flush_interval seconds even if
+# close is never reached. The freePieIO values are packed only after an
+# update event and copied into the records of the other ticks, as freePieIO
+# changes only with an update.
+#
+# Replaying through the headless runtime (see alvr_freepie.sim):
+#   runtime = Runtime("go_single_psmove.py", replay_stream(SessionReader(path)))
+
+import struct
+import time
+from itertools import compress
+
+from alvr_freepie.clock import monotonic
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+MAGIC = b"AFPS"
+VERSION = 1
+HEADER = struct.Struct("<4sHH8x")
+RECORD = struct.Struct("<dII24d12d2dI")
+# the three blocks of RECORD: tick header, freePieIO, alvr inputs
+_RECORD_HEAD = struct.Struct("<dII")
+_RECORD_IO = struct.Struct("<24d")
+_RECORD_INPUTS = struct.Struct("<12d2dI")
+_IO_OFFSET = _RECORD_HEAD.size
+_IO_SIZE = _RECORD_IO.size
+_INPUTS_OFFSET = _IO_OFFSET + _IO_SIZE
+
+# flags: freePieIO delivered a new sample (update event fired) before this tick
+FLAG_UPDATE = 1
+
+_IO_FIELDS = ("x", "y", "z", "yaw", "pitch", "roll")
+
+
+class SessionRecorder(object):
+
+    # freepie_io: if given, the recorder subscribes to freePieIO[0].update to
+    # set FLAG_UPDATE on the next record; flush_interval: seconds between
+    # writes of a partly filled buffer
+    def __init__(self, path, freepie_io=None, capacity=256, clock=monotonic,
+                 flush_interval=1.0):
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self._buffer = bytearray(RECORD.size * capacity)
+        self._view = memoryview(self._buffer)
+        self._capacity = capacity
+        self._count = 0
+        self._clock = clock
+        self._tick = 0
+        self._updated = False
+        # freePieIO block of the last update event, copied into every record
+        self._io = bytearray(_IO_SIZE)
+        self._io_packed = False
+        self.flush_interval = flush_interval
+        self._flushed = clock()
+        # input_buttons bit values, summed over the pressed buttons
+        self._bits = None
+        if freepie_io is not None:
+            freepie_io[0].update += self.on_update
+
+    def on_update(self, *args):
+        self._updated = True
+
+    # append one tick; fired overrides the update flag seen via on_update.
+    # Does nothing after close.
+    def record(self, alvr, freepie_io, fired=None):
+        if self._file is None:
+            return
+        if fired is None:
+            fired = self._updated
+        self._updated = False
+        buffer = self._buffer
+        offset = self._count * RECORD.size
+        now = self._clock()
+        _RECORD_HEAD.pack_into(buffer, offset, now, self._tick, FLAG_UPDATE if fired else 0)
+        block = self._io
+        if fired or not self._io_packed:
+            io0 = freepie_io[0]; io1 = freepie_io[1]; io2 = freepie_io[2]; io3 = freepie_io[3]
+            _RECORD_IO.pack_into(block, 0,
+                io0.x, io0.y, io0.z, io0.yaw, io0.pitch, io0.roll,
+                io1.x, io1.y, io1.z, io1.yaw, io1.pitch, io1.roll,
+                io2.x, io2.y, io2.z, io2.yaw, io2.pitch, io2.roll,
+                io3.x, io3.y, io3.z, io3.yaw, io3.pitch, io3.roll)
+            self._io_packed = True
+        buffer[offset + _IO_OFFSET:offset + _INPUTS_OFFSET] = block
+        ho0, ho1, ho2 = alvr.input_head_orientation
+        hp0, hp1, hp2 = alvr.input_head_position
+        co0, co1, co2 = alvr.input_controller_orientation
+        cp0, cp1, cp2 = alvr.input_controller_position
+        tp0, tp1 = alvr.input_trackpad
+        bits = self._bits
+        if bits is None:
+            bits = self._bits = tuple(1 << i for i in range(len(alvr.input_buttons)))
+        _RECORD_INPUTS.pack_into(buffer, offset + _INPUTS_OFFSET,
+            ho0, ho1, ho2, hp0, hp1, hp2, co0, co1, co2, cp0, cp1, cp2, tp0, tp1,
+            sum(compress(bits, alvr.input_buttons)))
+        self._tick += 1
+        self._count += 1
+        if self._count == self._capacity or now - self._flushed >= self.flush_interval:
+            self.flush()
+
+    # write the buffered records in one go
+    def flush(self):
+        if self._count:
+            self._file.write(self._view[:self._count * RECORD.size])
+            self._file.flush()
+            self._count = 0
+        self._flushed = self._clock()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class SessionReader(object):
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        if mmap is not None:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = self._file.read()
+        magic, version, record_size = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("%s is not a version %d session file" % (path, VERSION))
+        self._count = (len(self._data) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self._count
+
+    # raw record tuple, see RECORD
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return RECORD.unpack_from(self._data, HEADER.size + index * RECORD.size)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    # raw bytes of the records start..start+count-1 (bulk decoding, see
+    # alvr_freepie.batch)
+    def block(self, start, count):
+        count = max(0, min(count, self._count - start))
+        offset = HEADER.size + start * RECORD.size
+        return self._data[offset:offset + count * RECORD.size]
+
+    def close(self):
+        if mmap is not None:
+            self._data.close()
+        self._file.close()
+
+
+# copy one record into freePieIO and the alvr.input_* fields; returns True
+# when the freePieIO update event should fire
+def apply_record(record, alvr, freepie_io):
+    values = record[3:]
+    for i in range(4):
+        device = freepie_io[i]
+        base = i * 6
+        for j in range(6):
+            setattr(device, _IO_FIELDS[j], values[base + j])
+    inputs = values[24:]
+    alvr.input_head_orientation.load(inputs[0:3])
+    alvr.input_head_position.load(inputs[3:6])
+    alvr.input_controller_orientation.load(inputs[6:9])
+    alvr.input_controller_position.load(inputs[9:12])
+    alvr.input_trackpad.load(inputs[12:14])
+    buttons = inputs[14]
+    alvr.input_buttons.load([buttons & (1 << i) != 0 for i in range(len(alvr.input_buttons))])
+    return record[2] & FLAG_UPDATE != 0
+
+
+# stream for alvr_freepie.sim.Runtime feeding the records of reader tick by
+# tick (run at most len(reader) ticks); with realtime the replay is paced by
+# the recorded timestamps, otherwise it runs as fast as possible. Outputs do
+# not depend on pacing.
+def replay_stream(reader, realtime=False, sleep=time.sleep, clock=monotonic):
+    start = [None, None]
+
+    def stream(runtime, tick):
+        record = reader[tick]
+        if realtime:
+            if start[0] is None:
+                start[0] = clock()
+                start[1] = record[0]
+            delay = (record[0] - start[1]) - (clock() - start[0])
+            if delay > 0:
+                sleep(delay)
+        runtime.now = record[0]
+        return apply_record(record, runtime.alvr, runtime.freepie_io)
+
+    return stream
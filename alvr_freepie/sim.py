@@ -0,0 +1,454 @@
+# Headless stand-in for the FreePIE runtime, to run the ALVR scripts on
+# CPython off-box (profiling, regression checks). Not used inside FreePIE.
+#
+# FreePIE compiles a script once and executes it repeatedly in the same
+# globals, with `starting` True on the first run. The plugins used by the
+# scripts are replaced by recording fakes:
+#   alvr        - FakeAlvr, every write to alvr.* is logged per tick
+#   freePieIO   - 4 FakeIO slots with x/y/z/yaw/pitch/roll and an `update`
+#                 event (freePieIO[0].update += updatePSMove)
+#   diagnostics - FakeDiagnostics, counts watch() calls, prints debug() text
+#                 on request
+#   System      - module with Array.CreateInstance
+#
+# A stream callable feeds device data each tick:
+#   stream(runtime, tick) -> True when freePieIO delivered a new sample,
+#                            which fires the update events before the script
+# and sets runtime.now, the time alvr_freepie.clock.monotonic() returns
+# during the tick.
+# synthetic_stream() generates motion, alvr_freepie.session.replay_stream()
+# replays a recorded session. With a SessionRecorder every tick's input is
+# recorded.
+#
+#   runtime = Runtime("go_single_psmove.py", synthetic_stream())
+#   report = runtime.run(1000, trace_alloc=True)
+#   print(report.summary())
+#
+# or from the command line:
+#   python -m alvr_freepie.sim go_single_psmove.py --ticks 1000 --alloc --profile
+#   python -m alvr_freepie.sim go_single_psmove.py --record session.afps
+#   python -m alvr_freepie.sim go_single_psmove.py --replay session.afps --realtime
+#   python -m alvr_freepie.sim go_single_psmove.py --set INSTRUMENT=True --debug
+
+import argparse
+import cProfile
+import io
+import math
+import pstats
+import re
+import sys
+import time
+import tracemalloc
+import types
+
+from alvr_freepie import clock
+from alvr_freepie.session import SessionReader, SessionRecorder, replay_stream
+
+# ALVR FreePIE plugin button names, the index is what alvr.Id() returns
+BUTTON_NAMES = ["system", "application_menu", "grip", "dpad_left", "dpad_up",
+                "dpad_right", "dpad_down", "a", "b", "x", "y", "trackpad_click",
+                "trackpad_touch", "back", "start", "trigger"]
+# Go / Gear VR input button names, the index is what alvr.InputId() returns
+INPUT_BUTTON_NAMES = ["trackpad_click", "trackpad_touch", "back", "volume_up",
+                      "volume_down", "trigger"]
+
+
+# fixed size array that reports item writes to the owning FakeAlvr
+class RecordingArray(object):
+    __slots__ = ("_values", "_path", "_owner")
+
+    def __init__(self, owner, path, values):
+        self._owner = owner
+        self._path = path
+        self._values = values
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __setitem__(self, index, value):
+        current = self._values[index]
+        if isinstance(current, RecordingArray):
+            # whole row assignment, e.g. alvr.controller_position[0] = Array
+            for i in range(len(current)):
+                current[i] = value[i]
+            return
+        self._values[index] = value
+        if self._owner.recording:
+            self._owner.writes.append((self._owner.tick, "%s[%d]" % (self._path, index), value))
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __repr__(self):
+        return repr(list(self._values))
+
+    # copy plain values in without recording (used for alvr.input_*)
+    def load(self, values):
+        for i in range(len(self._values)):
+            self._values[i] = values[i]
+
+
+class FakeAlvr(object):
+
+    def __init__(self):
+        d = self.__dict__
+        d["recording"] = False
+        d["tick"] = 0
+        d["writes"] = []
+        # inputs from the HMD / Go controller
+        d["input_head_orientation"] = self._array("input_head_orientation", 3)
+        d["input_head_position"] = self._array("input_head_position", 3)
+        d["input_controller_orientation"] = self._array("input_controller_orientation", 3)
+        d["input_controller_position"] = self._array("input_controller_position", 3)
+        d["input_buttons"] = self._array("input_buttons", len(INPUT_BUTTON_NAMES), False)
+        d["input_trackpad"] = self._array("input_trackpad", 2)
+        # outputs to ALVR
+        d["head_orientation"] = self._array("head_orientation", 3)
+        d["head_position"] = self._array("head_position", 3)
+        d["controller_orientation"] = self._rows("controller_orientation", 3)
+        d["controller_position"] = self._rows("controller_position", 3)
+        d["buttons"] = self._rows("buttons", len(BUTTON_NAMES), False)
+        d["trackpad"] = self._rows("trackpad", 2)
+        d["trigger"] = self._array("trigger", 2)
+        d["message"] = ""
+        d["two_controllers"] = False
+        d["override_head_orientation"] = False
+        d["override_head_position"] = False
+        d["override_controller_orientation"] = False
+        d["override_controller_position"] = False
+
+    def _array(self, path, size, value=0.0):
+        return RecordingArray(self, path, [value] * size)
+
+    def _rows(self, path, size, value=0.0):
+        return RecordingArray(self, path, [self._array("%s[%d]" % (path, i), size, value)
+                                           for i in range(2)])
+
+    def __setattr__(self, name, value):
+        if name not in self.__dict__:
+            raise AttributeError("alvr has no attribute %r" % name)
+        if name in ("recording", "tick", "writes"):
+            self.__dict__[name] = value
+            return
+        current = self.__dict__[name]
+        if isinstance(current, RecordingArray):
+            for i in range(len(current)):
+                current[i] = value[i]
+            return
+        self.__dict__[name] = value
+        if self.recording:
+            self.writes.append((self.tick, name, value))
+
+    def Id(self, name):
+        return BUTTON_NAMES.index(name)
+
+    def InputId(self, name):
+        return INPUT_BUTTON_NAMES.index(name)
+
+
+# .NET style event supporting `event += handler`
+class FakeEvent(object):
+    __slots__ = ("handlers",)
+
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.handlers.remove(handler)
+        return self
+
+    def fire(self):
+        for handler in self.handlers:
+            handler()
+
+
+class FakeIO(object):
+    __slots__ = ("x", "y", "z", "yaw", "pitch", "roll", "update")
+
+    def __init__(self):
+        self.x = self.y = self.z = 0.0
+        self.yaw = self.pitch = self.roll = 0.0
+        self.update = FakeEvent()
+
+
+class FakeDiagnostics(object):
+
+    # echo: print diagnostics.debug() text to stdout
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.watch_calls = 0
+        self.last_watch = None
+        self.debug_calls = 0
+
+    def watch(self, value):
+        self.watch_calls += 1
+        self.last_watch = value
+
+    def debug(self, text):
+        self.debug_calls += 1
+        if self.echo:
+            print(text)
+
+
+class FakeArray(object):
+    @staticmethod
+    def CreateInstance(type_, size):
+        return [type_()] * size
+
+
+def fake_system_module():
+    module = types.ModuleType("System")
+    module.Array = FakeArray
+    return module
+
+
+# per run timing / allocation statistics
+class Report(object):
+
+    def __init__(self, script, tick_times, alloc_bytes, retained_bytes, writes,
+                 watch_calls, profile_text):
+        self.script = script
+        self.tick_times = tick_times
+        # peak bytes allocated / bytes still allocated after each tick
+        self.alloc_bytes = alloc_bytes
+        self.retained_bytes = retained_bytes
+        self.writes = writes
+        self.watch_calls = watch_calls
+        self.profile_text = profile_text
+
+    def percentile(self, p):
+        ordered = sorted(self.tick_times)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+    def summary(self):
+        ticks = len(self.tick_times)
+        lines = ["%s: %d ticks" % (self.script, ticks)]
+        if ticks:
+            lines.append("tick time   mean %.1f us  p50 %.1f us  p99 %.1f us  max %.1f us" % (
+                1e6 * sum(self.tick_times) / ticks, 1e6 * self.percentile(50),
+                1e6 * self.percentile(99), 1e6 * max(self.tick_times)))
+            if self.writes is not None:
+                lines.append("alvr writes %.1f per tick" % (len(self.writes) / float(ticks)))
+            lines.append("diagnostics.watch %.1f per tick" % (self.watch_calls / float(ticks)))
+        if self.alloc_bytes:
+            lines.append("allocations peak %.0f B per tick, %.0f B retained per tick" % (
+                sum(self.alloc_bytes) / float(ticks), sum(self.retained_bytes) / float(ticks)))
+        if self.profile_text:
+            lines.append(self.profile_text)
+        return "\n".join(lines)
+
+
+class Runtime(object):
+
+    # settings: {name: source} replaces the value of the top level
+    # assignments `name = ...` of the script (its configuration constants)
+    def __init__(self, script_path, stream=None, record=True, recorder=None,
+                 settings=None, echo_debug=False):
+        self.script_path = script_path
+        with io.open(script_path, encoding="utf-8") as f:
+            source = f.read()
+        for name, value in (settings or {}).items():
+            source, found = re.subn(r"^%s\s*=.*$" % re.escape(name),
+                                    lambda m: "%s = %s" % (name, value), source,
+                                    flags=re.M)
+            if not found:
+                raise ValueError("%s does not assign %s" % (script_path, name))
+        self.code = compile(source, script_path, "exec")
+        self.stream = stream
+        self.record = record
+        self.recorder = recorder
+        self.alvr = FakeAlvr()
+        self.freepie_io = [FakeIO() for _ in range(4)]
+        self.diagnostics = FakeDiagnostics(echo_debug)
+        self.tick_index = 0
+        self.now = 0.0
+        self.script_seconds = 0.0
+        self.globals = {
+            "__name__": "__main__",
+            "alvr": self.alvr,
+            "freePieIO": self.freepie_io,
+            "diagnostics": self.diagnostics,
+            "starting": True,
+            "stopping": False,
+        }
+        if "System" not in sys.modules:
+            sys.modules["System"] = fake_system_module()
+
+    # run one script tick: stream input, update events, script body
+    def tick(self):
+        alvr = self.alvr
+        alvr.recording = False
+        clock.set_source(self._clock)
+        try:
+            fire = self.stream(self, self.tick_index) if self.stream else False
+            if self.recorder:
+                self.recorder.record(alvr, self.freepie_io, fire)
+            alvr.tick = self.tick_index
+            alvr.recording = self.record
+            self.globals["starting"] = self.tick_index == 0
+            start = time.perf_counter()
+            if fire and self.tick_index > 0:
+                for device in self.freepie_io:
+                    device.update.fire()
+            exec(self.code, self.globals)
+            # time spent in the script (update events + tick), without the stream
+            self.script_seconds = time.perf_counter() - start
+        finally:
+            clock.set_source(None)
+        self.tick_index += 1
+
+    # last run of the script with `stopping` set, as FreePIE does when the
+    # script is stopped
+    def stop(self):
+        self.globals["stopping"] = True
+        try:
+            self.tick()
+        finally:
+            self.globals["stopping"] = False
+
+    def _clock(self):
+        return self.now
+
+    # run ticks script ticks and collect statistics; the `starting` tick
+    # (imports, setup) runs first and is not part of the statistics
+    def run(self, ticks, trace_alloc=False, profile=False):
+        if self.tick_index == 0:
+            self.tick()
+        writes_before = len(self.alvr.writes)
+        watch_before = self.diagnostics.watch_calls
+        tick_times = []
+        alloc_bytes = []
+        retained_bytes = []
+        profiler = cProfile.Profile() if profile else None
+        if trace_alloc:
+            tracemalloc.start()
+        try:
+            for _ in range(ticks):
+                if trace_alloc:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                if profiler:
+                    profiler.enable()
+                self.tick()
+                if profiler:
+                    profiler.disable()
+                tick_times.append(self.script_seconds)
+                if trace_alloc:
+                    current, peak = tracemalloc.get_traced_memory()
+                    alloc_bytes.append(peak - before)
+                    retained_bytes.append(current - before)
+        finally:
+            if trace_alloc:
+                tracemalloc.stop()
+        profile_text = ""
+        if profiler:
+            out = io.StringIO()
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats("tottime").print_stats(15)
+            profile_text = out.getvalue()
+        return Report(self.script_path, tick_times, alloc_bytes, retained_bytes,
+                      self.alvr.writes[writes_before:] if self.record else None,
+                      self.diagnostics.watch_calls - watch_before, profile_text)
+
+
+# smooth synthetic motion for the HMD, the Go controller and 3 PS Moves.
+# The script runs at tick_rate, the PS Moves deliver samples at io_rate.
+# The ALVR head / Go controller inputs change at input_rate (headset frames),
+# default every tick.
+def synthetic_stream(tick_rate=120.0, io_rate=60.0, seed=0, input_rate=None):
+    phase = [0.37 * (seed + 1) * i for i in range(12)]
+
+    def stream(runtime, tick):
+        t = tick / tick_rate
+        runtime.now = t
+        alvr = runtime.alvr
+        ti = t if input_rate is None else int(t * input_rate) / input_rate
+        alvr.input_head_orientation.load([0.4 * math.sin(0.5 * ti + phase[0]),
+                                          0.3 * math.sin(0.7 * ti + phase[1]),
+                                          0.1 * math.sin(0.3 * ti + phase[2])])
+        alvr.input_head_position.load([0.05 * math.sin(0.4 * ti), 1.6, 0.05 * math.cos(0.4 * ti)])
+        alvr.input_controller_orientation.load([0.8 * math.sin(1.1 * ti + phase[3]),
+                                                0.6 * math.sin(0.9 * ti + phase[4]),
+                                                0.5 * math.sin(1.3 * ti + phase[5])])
+        alvr.input_trackpad.load([0.0, math.sin(0.2 * ti)])
+        sample = int(t * io_rate)
+        if tick > 0 and sample == int((tick - 1) / tick_rate * io_rate):
+            return False
+        ts = sample / io_rate
+        for i, device in enumerate(runtime.freepie_io[:3]):
+            p = phase[6 + i]
+            device.x = 20.0 * math.sin(0.8 * ts + p) + (i - 1) * 25.0
+            device.y = 120.0 + 10.0 * math.sin(1.2 * ts + p)
+            device.z = -30.0 + 10.0 * math.cos(0.7 * ts + p)
+            device.yaw = 1.2 * math.sin(0.6 * ts + p)
+            device.pitch = 0.8 * math.sin(0.9 * ts + p)
+            device.roll = 0.6 * math.sin(1.1 * ts + p)
+        slot3 = runtime.freepie_io[3]
+        slot3.yaw = 0.5 + 0.5 * math.sin(2.0 * ts)
+        slot3.pitch = 0.5 + 0.5 * math.cos(2.0 * ts)
+        slot3.x = float(1 << (sample // 60 % 6)) if sample % 120 < 30 else 0.0
+        slot3.y = 0.0
+        return True
+
+    return stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an ALVR FreePIE script headless.")
+    parser.add_argument("script")
+    parser.add_argument("--ticks", type=int, default=None,
+                        help="ticks to run after the starting tick (default 1000, "
+                             "or the whole session with --replay)")
+    parser.add_argument("--tick-rate", type=float, default=120.0)
+    parser.add_argument("--io-rate", type=float, default=60.0)
+    parser.add_argument("--input-rate", type=float, default=None,
+                        help="rate of the ALVR head / Go controller inputs (default every tick)")
+    parser.add_argument("--alloc", action="store_true", help="trace allocations per tick")
+    parser.add_argument("--profile", action="store_true", help="print a cProfile breakdown")
+    parser.add_argument("--no-record", action="store_true",
+                        help="do not log alvr writes (keeps the log out of the allocation numbers)")
+    parser.add_argument("--replay", metavar="SESSION", help="replay a recorded session")
+    parser.add_argument("--realtime", action="store_true",
+                        help="pace the replay by the recorded timestamps")
+    parser.add_argument("--record", metavar="SESSION", help="record the input of every tick")
+    parser.add_argument("--set", metavar="NAME=VALUE", action="append", default=[],
+                        help="override a configuration constant of the script, "
+                             "e.g. --set INSTRUMENT=True")
+    parser.add_argument("--debug", action="store_true", help="print diagnostics.debug() output")
+    args = parser.parse_args(argv)
+    settings = {}
+    for item in args.set:
+        name, sep, value = item.partition("=")
+        if not sep:
+            parser.error("--set expects NAME=VALUE, got %r" % item)
+        settings[name.strip()] = value.strip()
+    ticks = args.ticks
+    if args.replay:
+        reader = SessionReader(args.replay)
+        stream = replay_stream(reader, args.realtime)
+        if ticks is None or ticks >= len(reader):
+            ticks = len(reader) - 1
+    else:
+        stream = synthetic_stream(args.tick_rate, args.io_rate, input_rate=args.input_rate)
+        if ticks is None:
+            ticks = 1000
+    recorder = SessionRecorder(args.record) if args.record else None
+    runtime = Runtime(args.script, stream, record=not args.no_record, recorder=recorder,
+                      settings=settings, echo_debug=args.debug)
+    report = runtime.run(ticks, trace_alloc=args.alloc, profile=args.profile)
+    runtime.stop()
+    if recorder:
+        recorder.close()
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
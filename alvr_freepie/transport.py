@@ -0,0 +1,292 @@
+# Shared memory tracker transport between a PSMoveService bridge and the
+# scripts, instead of poses in freePieIO and triggers / buttons packed into
+# the floats of freePieIO[3].
+#
+# The bridge (producer) and the script (consumer) map the same file. After a
+# 32 byte header it holds a ring of `capacity` fixed-width little-endian
+# records, one per device sample:
+#   sequence (uint64), timestamp (double, seconds), device (uint32),
+#   flags (uint32), buttons (uint32, full PS Move mask), trigger (double),
+#   x, y, z (PS Eye centimeters), yaw, pitch, roll (PS Move euler, radians),
+#   sequence again (uint64)
+# Sample n (from 1) goes to slot (n - 1) % capacity; the header count is
+# advanced after the record is complete. The reader takes the records
+# between its last count and the header count, newest first with one
+# unpack_from each until it has the newest sample of every device, and
+# copies each record tuple into the device's preallocated sample list in
+# one slice assignment. A record whose two sequence fields are not n is
+# dropped: the producer lapped the reader and overwrote the slot (or was
+# writing it) meanwhile. This relies on stores becoming visible in program
+# order, as on x86.
+#
+# The timestamp is the producer's clock at the sample; the scripts use it
+# as the sample time (prediction, filters, fusion), so the producer has to
+# stamp with the scripts' clock, alvr_freepie.clock.system_clock.
+#
+# Producer:
+#   writer = TrackerWriter("psmove.trk", devices=3)
+#   writer.write(device, timestamp, x, y, z, yaw, pitch, roll, trigger, buttons, FLAG_TRACKED)
+#
+# Script:
+#   if starting:
+#       g_transport = TrackerReader("psmove.trk")
+#       g_io = g_transport.freepie_io      # instead of freePieIO
+#       g_io[0].update += update
+#   g_transport.poll()                      # fires update on new samples
+#
+# freepie_io mimics the freePieIO layout of the scripts: slots 0..2 hold the
+# poses of devices 0..2, slot 3 the triggers (yaw / pitch) and button masks
+# (x / y) of devices 0 and 1. reader.samples[device] holds all values of the
+# newest record of each device, e.g. samples[device][TIMESTAMP] and
+# samples[device][FLAGS].
+#
+#   python -m alvr_freepie.transport psmove.trk [--rate 60]
+# runs a stand-in producer writing synthetic PS Move motion.
+
+import argparse
+import math
+import os
+import struct
+import time
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+from alvr_freepie.clock import system_clock
+
+MAGIC = b"AFTT"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 16
+RECORDS_OFFSET = 32
+RECORD = struct.Struct("<QdIIIxxxxd6dQ")
+# values of one record in an unpacked tuple and the index of each field
+RECORD_VALUES = 13
+SEQUENCE = 0
+TIMESTAMP = 1
+DEVICE = 2
+FLAGS = 3
+BUTTONS = 4
+TRIGGER = 5
+# x, y, z, yaw, pitch, roll
+POSE = 6
+SEQUENCE_END = 12
+CAPACITY = 64
+# freePieIO slots the reader mimics
+IO_SLOTS = 4
+
+# status flags of a record
+FLAG_CONNECTED = 1
+# the PS Eye sees the device, the position is valid
+FLAG_TRACKED = 2
+
+
+def _map(path, size, create):
+    if mmap is None:
+        raise ImportError("the tracker transport needs the mmap module")
+    f = open(path, "w+b" if create else "r+b")
+    if create:
+        f.truncate(size)
+    else:
+        size = os.fstat(f.fileno()).st_size
+    return f, mmap.mmap(f.fileno(), size)
+
+
+class TrackerWriter(object):
+    __slots__ = ("capacity", "devices", "_file", "_map", "_count")
+
+    # create (or reset) the ring at path for devices devices
+    def __init__(self, path, devices=3, capacity=CAPACITY):
+        self.capacity = capacity
+        self.devices = devices
+        size = RECORDS_OFFSET + capacity * RECORD.size
+        self._file, self._map = _map(path, size, True)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD.size, capacity, devices)
+        COUNT.pack_into(self._map, COUNT_OFFSET, 0)
+        self._count = 0
+
+    # append one device sample
+    def write(self, device, timestamp, x, y, z, yaw, pitch, roll, trigger=0.0, buttons=0,
+              flags=FLAG_CONNECTED | FLAG_TRACKED):
+        n = self._count + 1
+        RECORD.pack_into(self._map, RECORDS_OFFSET + (n - 1) % self.capacity * RECORD.size,
+                         n, timestamp, device, flags, buttons, trigger,
+                         x, y, z, yaw, pitch, roll, n)
+        COUNT.pack_into(self._map, COUNT_OFFSET, n)
+        self._count = n
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+# .NET style event supporting `event += handler`
+class _Event(object):
+    __slots__ = ("handlers",)
+
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.handlers.remove(handler)
+        return self
+
+    def fire(self):
+        for handler in self.handlers:
+            handler()
+
+
+# one freePieIO slot as seen by the scripts
+class TrackerIO(object):
+    __slots__ = ("x", "y", "z", "yaw", "pitch", "roll", "update")
+
+    def __init__(self):
+        self.x = self.y = self.z = 0.0
+        self.yaw = self.pitch = self.roll = 0.0
+        self.update = _Event()
+
+
+class TrackerReader(object):
+    __slots__ = ("capacity", "devices", "samples", "freepie_io", "received", "dropped",
+                 "_file", "_map", "_count")
+
+    def __init__(self, path):
+        self._file, self._map = _map(path, 0, False)
+        magic, version, record_size, capacity, devices = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("%s is not a version %d tracker transport" % (path, VERSION))
+        self.capacity = capacity
+        self.devices = devices
+        # per device: the values of its newest record (index with SEQUENCE,
+        # TIMESTAMP, FLAGS, BUTTONS, TRIGGER, POSE .. POSE + 5)
+        self.samples = [[0, 0.0, device, 0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
+                        for device in range(devices)]
+        self.freepie_io = [TrackerIO() for _ in range(IO_SLOTS)]
+        # samples taken / lost to the producer lapping the reader
+        self.received = 0
+        self.dropped = 0
+        # start with the samples written from now on
+        self._count = COUNT.unpack_from(self._map, COUNT_OFFSET)[0]
+
+    # take the samples written since the last poll; updates freepie_io and
+    # fires freepie_io[0].update once if there were any. Returns their number.
+    def poll(self):
+        data = self._map
+        count = COUNT.unpack_from(data, COUNT_OFFSET)[0]
+        last = self._count
+        if count == last:
+            return 0
+        self._count = count
+        capacity = self.capacity
+        first = last + 1
+        if count - last > capacity:
+            self.dropped += count - last - capacity
+            first = count - capacity + 1
+        # newest first: only the newest sample of each device is copied,
+        # older ones are counted without being unpacked
+        taken = 0
+        devices = self.devices
+        seen = 0
+        complete = (1 << devices) - 1
+        samples = self.samples
+        io = self.freepie_io
+        unpack_from = RECORD.unpack_from
+        size = RECORD.size
+        for n in range(count, first - 1, -1):
+            if seen == complete:
+                taken += n - first + 1
+                break
+            record = unpack_from(data, RECORDS_OFFSET + (n - 1) % capacity * size)
+            device = record[DEVICE]
+            if record[SEQUENCE] != n or record[SEQUENCE_END] != n or device >= devices:
+                self.dropped += 1
+                continue
+            taken += 1
+            if seen >> device & 1:
+                continue
+            seen |= 1 << device
+            samples[device][:] = record
+            if device < IO_SLOTS - 1:
+                view = io[device]
+                view.x = record[6]; view.y = record[7]; view.z = record[8]
+                view.yaw = record[9]; view.pitch = record[10]; view.roll = record[11]
+        if taken:
+            self.received += taken
+            if seen & 3:
+                self._update_buttons()
+            io[0].update.fire()
+        return taken
+
+    # triggers and button masks of devices 0 and 1 in the packed view slot
+    def _update_buttons(self):
+        packed = self.freepie_io[IO_SLOTS - 1]
+        sample = self.samples[0]
+        packed.yaw = sample[TRIGGER]
+        packed.x = sample[BUTTONS]
+        if self.devices > 1:
+            sample = self.samples[1]
+            packed.pitch = sample[TRIGGER]
+            packed.y = sample[BUTTONS]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+# synthetic PS Move motion for device at time t, in the units of the bridge
+def synthetic_sample(device, t):
+    p = 0.37 * (device + 1)
+    return (20.0 * math.sin(0.8 * t + p) + (device - 1) * 25.0,
+            120.0 + 10.0 * math.sin(1.2 * t + p),
+            -30.0 + 10.0 * math.cos(0.7 * t + p),
+            1.2 * math.sin(0.6 * t + p), 0.8 * math.sin(0.9 * t + p),
+            0.6 * math.sin(1.1 * t + p),
+            0.5 + 0.5 * math.sin(2.0 * t + p))
+
+
+# stand-in producer: devices samples every 1 / rate seconds for seconds
+# seconds (0 = until interrupted), stamped with clock()
+def produce(path, rate=60.0, seconds=0.0, devices=3, capacity=CAPACITY, clock=system_clock,
+            sleep=time.sleep):
+    writer = TrackerWriter(path, devices, capacity)
+    start = clock()
+    frame = 0
+    try:
+        while not seconds or clock() - start < seconds:
+            due = start + frame / rate
+            delay = due - clock()
+            if delay > 0:
+                sleep(delay)
+            t = frame / rate
+            for device in range(devices):
+                x, y, z, yaw, pitch, roll, trigger = synthetic_sample(device, t)
+                writer.write(device, clock(), x, y, z, yaw, pitch, roll, trigger,
+                             0, FLAG_CONNECTED | FLAG_TRACKED)
+            frame += 1
+    finally:
+        writer.close()
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in tracker transport producer.")
+    parser.add_argument("path")
+    parser.add_argument("--rate", type=float, default=60.0, help="samples per second and device")
+    parser.add_argument("--seconds", type=float, default=0.0, help="0 = until interrupted")
+    parser.add_argument("--devices", type=int, default=3)
+    parser.add_argument("--capacity", type=int, default=CAPACITY)
+    args = parser.parse_args(argv)
+    try:
+        produce(args.path, args.rate, args.seconds, args.devices, args.capacity)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+# Microbenchmarks and offline evaluations for the ALVR FreePIE scripts.
+#
+# They run on CPython (not inside FreePIE), from the repository root:
+#   python -m benchmarks.bench_quatmath
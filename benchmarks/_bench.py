@@ -0,0 +1,63 @@
+# Small timing / allocation helpers shared by the benchmarks.
+
+import gc
+import json
+import os
+import timeit
+import tracemalloc
+
+from alvr_freepie.pipeline import load_profile
+
+
+# best-of-repeat wall time of fn() in nanoseconds per call
+def ns_per_op(fn, number=20000, repeat=5):
+    timer = timeit.Timer(fn)
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best * 1e9 / number
+
+# peak bytes allocated while running fn() once (after a warm-up call)
+def alloc_bytes_per_op(fn, calls=100):
+    fn()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+# print rows of (name, *values) as an aligned table
+def print_table(header, rows):
+    widths = [len(h) for h in header]
+    text_rows = []
+    for row in rows:
+        cells = [row[0]] + [_fmt(v) for v in row[1:]]
+        widths = [max(w, len(c)) for w, c in zip(widths, cells)]
+        text_rows.append(cells)
+    line = "  ".join(h.ljust(w) if i == 0 else h.rjust(w)
+                     for i, (h, w) in enumerate(zip(header, widths)))
+    print(line)
+    print("-" * len(line))
+    for cells in text_rows:
+        print("  ".join(c.ljust(w) if i == 0 else c.rjust(w)
+                        for i, (c, w) in enumerate(zip(cells, widths))))
+
+def _fmt(v):
+    if isinstance(v, float):
+        return "%.1f" % v
+    return str(v)
+
+# write the profile file at path, changed by edit(profile), to
+# directory/name; returns the new file for settings={"PROFILE": repr(...)}
+def profile_variant(path, directory, name, edit):
+    profile = load_profile(path)
+    edit(profile)
+    variant = os.path.join(directory, name)
+    with open(variant, "w") as f:
+        json.dump(profile, f)
+    return variant
@@ -0,0 +1,57 @@
+# ArmModelBatch against repeated legacy calc_arm_model calls for 1, 2, 8 and
+# 32 controllers per frame. Orientations alternate between two sets so the
+# memoized normalized roll of PoseContext never hits.
+#
+#   python -m benchmarks.bench_arm_batch
+
+import math
+import random
+
+from alvr_freepie import armmodel
+from alvr_freepie.armmodel import PoseContext, ArmModelBatch
+from benchmarks import legacy
+from benchmarks._bench import ns_per_op, print_table
+
+COUNTS = (1, 2, 8, 32)
+
+
+def main():
+    rnd = random.Random(1)
+    head = [0.2, -0.3, 0.05]
+    head_pos = [0.0, 1.6, 0.0]
+    rows = []
+    for count in COUNTS:
+        frames = [[[rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+                   for _ in range(count)] for _ in range(2)]
+        tick = [0]
+        sides = [1 if i % 2 == 0 else -1 for i in range(count)]
+        arm_rolls = [rnd.uniform(0.0, 1.5) for _ in range(count)]
+        ctx = PoseContext(count)
+
+        def repeated():
+            tick[0] ^= 1
+            orientations = frames[tick[0]]
+            for i in range(count):
+                legacy.calc_arm_model(orientations[i], sides[i], arm_rolls[i],
+                                      head, head_pos)
+
+        def batch(solver):
+            def run():
+                tick[0] ^= 1
+                ctx.begin_frame(head, head_pos)
+                solver.solve(ctx, frames[tick[0]], sides, arm_rolls)
+            return run
+
+        number = max(200, 20000 // count)
+        row = [str(count), ns_per_op(repeated, number=number),
+               ns_per_op(batch(ArmModelBatch(count, use_numpy=False)), number=number)]
+        if armmodel.numpy is not None:
+            row.append(ns_per_op(batch(ArmModelBatch(count, use_numpy=True)), number=number))
+        else:
+            row.append("n/a")
+        rows.append(row)
+    print_table(["controllers", "calc_arm_model ns", "batch (python) ns",
+                 "batch (numpy) ns"], rows)
+
+if __name__ == "__main__":
+    main()
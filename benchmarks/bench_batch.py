@@ -0,0 +1,168 @@
+# Offline batch processing (alvr_freepie.batch): NumPy chunks against the
+# per-sample scalar path.
+#
+# Records a synthetic session of random tracker input, runs it through the
+# single PS Move profiles (fixed and two-bone arm model) and the dual PS
+# Move profile, uncalibrated and with a calibration that has a head lever
+# arm, both ways and reports samples/s. Both must produce the same
+# columns (1e-9, angles compared modulo 2 pi), else exits with status 1.
+# Then shows the peak memory of the NumPy path for sessions of growing
+# length, which stays at the chunk size.
+#
+#   python -m benchmarks.bench_batch [--records 50000]
+
+import argparse
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+from alvr_freepie.batch import BatchPlan, process
+from alvr_freepie.calibration import save_calibration
+from alvr_freepie.pipeline import load_profile
+from alvr_freepie.session import SessionRecorder, RECORD
+from alvr_freepie.sim import FakeAlvr, FakeIO
+from benchmarks._bench import print_table
+
+PROFILES = ("profiles/single_psmove.json", "profiles/single_psmove_ik.json",
+            "profiles/dual_psmove_head.json")
+ARM_ROLL = 0.4
+TOLERANCE = 1e-9
+MEMORY_CHUNK = 8192
+MEMORY_RECORDS = (50000, 200000, 800000)
+# rotation of the test calibration about y (radians), its scale, translation
+# and head lever arm
+CALIBRATION_YAW = 0.3
+CALIBRATION_SCALE = 0.011
+CALIBRATION_TRANSLATION = (0.1, -0.2, 0.05)
+CALIBRATION_LEVER_ARM = [0.0, 0.08, -0.1]
+
+
+# session of count records with random poses (a few hundred distinct ones,
+# cycled, so writing a long session is cheap)
+def write_session(path, count, seed=3):
+    rnd = random.Random(seed)
+    alvr = FakeAlvr()
+    freepie_io = [FakeIO() for _ in range(4)]
+    poses = []
+    for _ in range(509):
+        io = [[rnd.uniform(-50.0, 50.0), rnd.uniform(80.0, 180.0), rnd.uniform(-150.0, -50.0),
+               rnd.uniform(-math.pi, math.pi), rnd.uniform(-1.5, 1.5),
+               rnd.uniform(-math.pi, math.pi)] for _ in range(3)]
+        inputs = [rnd.uniform(-math.pi, math.pi), rnd.uniform(-1.2, 1.2), rnd.uniform(-0.5, 0.5),
+                  rnd.uniform(-0.3, 0.3), rnd.uniform(1.4, 1.8), rnd.uniform(-0.3, 0.3),
+                  rnd.uniform(-math.pi, math.pi), rnd.uniform(-1.5, 1.5),
+                  rnd.uniform(-math.pi, math.pi)]
+        poses.append((io, inputs))
+    clock = [0.0]
+    recorder = SessionRecorder(path, clock=lambda: clock[0], capacity=4096)
+    for i in range(count):
+        io, inputs = poses[i % len(poses)]
+        for slot in range(3):
+            device = freepie_io[slot]
+            device.x, device.y, device.z, device.yaw, device.pitch, device.roll = io[slot]
+        alvr.input_head_orientation.load(inputs[0:3])
+        alvr.input_head_position.load(inputs[3:6])
+        alvr.input_controller_orientation.load(inputs[6:9])
+        clock[0] = i / 120.0
+        recorder.record(alvr, freepie_io)
+    recorder.close()
+
+# the dual PS Move profile with a calibration on every device, saved to
+# directory
+def calibrated_profile(directory):
+    c = math.cos(CALIBRATION_YAW)
+    s = math.sin(CALIBRATION_YAW)
+    k = CALIBRATION_SCALE
+    tx, ty, tz = CALIBRATION_TRANSLATION
+    half = 0.5 * CALIBRATION_YAW
+    calibration = {"matrix": [k * c, 0.0, k * s, tx,
+                              0.0, k, 0.0, ty,
+                              -k * s, 0.0, k * c, tz,
+                              0.0, 0.0, 0.0, 1.0],
+                   "rotation": [0.0, math.sin(half), 0.0, math.cos(half)],
+                   "scale": k, "rms": 0.0, "samples": 0,
+                   "lever_arm": CALIBRATION_LEVER_ARM}
+    path = os.path.join(directory, "calibration.json")
+    save_calibration(path, calibration)
+    profile = load_profile(PROFILES[2])
+    for device in profile["devices"].values():
+        device["calibration"] = path
+    return profile
+
+def load_columns(directory, plan):
+    return [numpy.load(os.path.join(directory, name + ".npy")) for name in plan.columns]
+
+# largest difference between two column sets; orientations modulo 2 pi
+def max_difference(plan, a, b):
+    worst = 0.0
+    for name, x, y in zip(plan.columns, a, b):
+        d = x.astype(float) - y.astype(float)
+        if "orientation" in name:
+            d = (d + math.pi) % (2.0 * math.pi) - math.pi
+        worst = max(worst, float(numpy.abs(d).max()))
+    return worst
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=50000)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    session = os.path.join(directory, "batch.afps")
+    write_session(session, args.records)
+
+    failed = []
+    rows = []
+    profiles = [(name, load_profile(name)) for name in PROFILES]
+    profiles.append((PROFILES[2] + " calibrated", calibrated_profile(directory)))
+    for profile, loaded in profiles:
+        plan = BatchPlan(loaded, ARM_ROLL)
+        scalar_dir = os.path.join(directory, "scalar")
+        numpy_dir = os.path.join(directory, "numpy")
+        scalar_seconds = timed(lambda: process(session, scalar_dir, plan, scalar=True))
+        numpy_seconds = min(timed(lambda: process(session, numpy_dir, plan))
+                            for _ in range(3))
+        difference = max_difference(plan, load_columns(scalar_dir, plan),
+                                    load_columns(numpy_dir, plan))
+        if difference > TOLERANCE:
+            failed.append("%s: NumPy and scalar columns differ by %.3g" % (profile, difference))
+        rows.append((profile, args.records / scalar_seconds / 1e3,
+                     args.records / numpy_seconds / 1e3, scalar_seconds / numpy_seconds,
+                     "%.1e" % difference))
+    print_table(["profile", "scalar k samples/s", "numpy k samples/s", "speedup",
+                 "max difference"], rows)
+
+    os.remove(session)
+    print("")
+    plan = BatchPlan(load_profile(PROFILES[2]), ARM_ROLL)
+    rows = []
+    for count in MEMORY_RECORDS:
+        write_session(session, count)
+        tracemalloc.start()
+        process(session, os.path.join(directory, "memory"), plan, chunk=MEMORY_CHUNK)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        os.remove(session)
+        rows.append((str(count), count * RECORD.size / 1e6, peak / 1e6))
+    print_table(["records (chunk %d)" % MEMORY_CHUNK, "session MB", "peak MB"], rows)
+    shutil.rmtree(directory)
+    if failed:
+        print("")
+        for line in failed:
+            print("FAILED: " + line)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# ButtonMap against the per-update button code of the v1/v3 scripts.
+#
+# Replays a stream of packed PS Move masks where a button changes on about
+# one update in 30 (buttons are held much longer than a 60 Hz update) and
+# reports ALVR writes and time per update. The resulting ALVR button rows
+# and select mode cycling are checked against the legacy code first.
+#
+#   python -m benchmarks.bench_buttons
+
+import random
+import time
+
+from alvr_freepie.buttons import (ButtonMap, PSM_SQUARE, PSM_TRIANGLE,
+    PSM_CROSS, PSM_CIRCLE, PSM_MOVE, PSM_PS, PSM_SELECT)
+from alvr_freepie.sim import FakeAlvr
+from benchmarks import legacy
+from benchmarks._bench import print_table
+
+MODE_COUNT = 3
+DUAL_MAP = [(PSM_SQUARE, "application_menu"), (PSM_TRIANGLE, "back"),
+            (PSM_CROSS, "grip"), (PSM_CIRCLE, "start"),
+            (PSM_MOVE, "trackpad_click"), (PSM_PS, "system")]
+
+
+def mask_stream(count, seed=2, change_every=30):
+    rnd = random.Random(seed)
+    masks = []
+    mask = 0
+    for _ in range(count):
+        if rnd.random() < 1.0 / change_every:
+            mask ^= 1 << rnd.randrange(8)
+        masks.append(mask)
+    return masks
+
+
+class Single(object):
+    # the go_single_psmove.py mapping in default mode built on ButtonMap
+
+    def __init__(self, alvr):
+        self.alvr = alvr
+        self.selected = 0
+        self.buttons = ButtonMap(alvr, 1, DUAL_MAP[:4] + DUAL_MAP[5:])
+        self.buttons.on_press(PSM_SELECT, self.next_mode)
+        self.buttons.on_release(PSM_SELECT, self.clear_message)
+        self.id_trigger = alvr.Id("trigger")
+        self.id_trackpad_click = alvr.Id("trackpad_click")
+
+    def next_mode(self):
+        self.selected += 1
+        if self.selected >= MODE_COUNT:
+            self.selected = 0
+        self.alvr.message = "-> mode %d" % self.selected
+
+    def clear_message(self):
+        self.alvr.message = ""
+
+    def update(self, trigger, buttons):
+        alvr = self.alvr
+        alvr.buttons[1][self.id_trigger] = trigger
+        alvr.trigger[1] = trigger
+        alvr.buttons[1][self.id_trackpad_click] = buttons & PSM_MOVE > 0
+        self.buttons.update(buttons)
+
+
+def run_single(alvr, masks, use_map):
+    if use_map:
+        single = Single(alvr)
+        for mask in masks:
+            single.update(0.5, mask)
+        return single.selected
+    state = [0, 0]
+    for mask in masks:
+        legacy.map_single_buttons(alvr, 0.5, mask, state, MODE_COUNT)
+    return state[1]
+
+def run_dual(alvr, masks, use_map):
+    if use_map:
+        left = ButtonMap(alvr, 0, DUAL_MAP)
+        right = ButtonMap(alvr, 1, DUAL_MAP)
+        for mask in masks:
+            alvr.trigger[0] = 0.5
+            left.update(mask)
+            alvr.trigger[1] = 0.5
+            right.update(mask ^ 0b101)
+        return 0
+    for mask in masks:
+        legacy.map_dual_buttons(alvr, 0.5, mask, 0.5, mask ^ 0b101)
+    return 0
+
+def check(run, masks):
+    # the same button rows after every update, and the same selected mode
+    for n in (1, 2, 10, 100, len(masks)):
+        a = FakeAlvr()
+        b = FakeAlvr()
+        if run(a, masks[:n], False) != run(b, masks[:n], True):
+            raise AssertionError("selected mode differs after %d updates" % n)
+        for row in (0, 1):
+            if list(a.buttons[row]) != list(b.buttons[row]):
+                raise AssertionError("buttons[%d] differ after %d updates" % (row, n))
+        if a.message != b.message:
+            raise AssertionError("message differs after %d updates" % n)
+
+def measure(run, masks, use_map):
+    alvr = FakeAlvr()
+    alvr.recording = True
+    run(alvr, masks, use_map)
+    writes = len(alvr.writes) / float(len(masks))
+    alvr = FakeAlvr()
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        run(alvr, masks, use_map)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return writes, best * 1e9 / len(masks)
+
+
+def main():
+    masks = mask_stream(20000)
+    check(run_single, masks)
+    check(run_dual, masks)
+    print("check: same button rows, message and mode cycling as the legacy code\n")
+    rows = []
+    for name, run in (("single", run_single), ("dual", run_dual)):
+        for variant, use_map in (("legacy", False), ("ButtonMap", True)):
+            writes, ns = measure(run, masks, use_map)
+            rows.append(("%s, %s" % (name, variant), writes, ns))
+    print_table(["script mapping", "writes/update", "ns/update"], rows)
+    print("\n(writes include the analog triggers, which are written every update)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# OneEuroFilter: per-sample cost and latency / jitter trade-off.
+#
+# Synthetic 60 Hz traces with 1.5 mm Gaussian jitter (typical PS Eye noise):
+#   jitter  - RMS output noise with the controller at rest
+#   lag     - delay behind a 0.5 m/s ramp once the filter settled
+#   error   - RMS error against the clean signal for hand-like motion
+# The unfiltered row is the raw input.
+#
+#   python -m benchmarks.bench_filters
+
+import math
+import random
+
+from alvr_freepie.filters import OneEuroFilter
+from benchmarks._bench import ns_per_op, alloc_bytes_per_op, print_table
+
+RATE = 60.0
+NOISE = 0.0015
+PARAMS = [(0.5, 0.0), (1.0, 0.0), (1.0, 0.5), (1.0, 2.0), (1.0, 5.0), (1.0, 20.0),
+          (2.0, 1.0), (5.0, 1.0)]
+
+
+def run(pose_filter, signal, seconds, seed=1):
+    rnd = random.Random(seed)
+    pose = [0.0] * 6
+    out = [0.0] * 6
+    clean = []
+    filtered = []
+    for i in range(int(seconds * RATE)):
+        t = i / RATE
+        value = signal(t)
+        pose[0] = value + rnd.gauss(0.0, NOISE)
+        if pose_filter:
+            pose_filter.filter_into(t, pose, out)
+        else:
+            out[0] = pose[0]
+        clean.append(value)
+        filtered.append(out[0])
+    return clean, filtered
+
+def rms(a, b, skip=60):
+    pairs = list(zip(a, b))[skip:]
+    return math.sqrt(sum((x - y) ** 2 for x, y in pairs) / len(pairs))
+
+def measure(make_filter):
+    clean, out = run(make_filter(), lambda t: 0.0, 20.0)
+    jitter = rms(clean, out)
+    clean, out = run(make_filter(), lambda t: 0.5 * t, 4.0)
+    lag = sum(c - o for c, o in zip(clean[120:], out[120:])) / len(out[120:]) / 0.5
+    clean, out = run(make_filter(),
+                     lambda t: 0.25 * math.sin(1.3 * t) + 0.05 * math.sin(4.1 * t), 20.0)
+    return 1000.0 * jitter, 1000.0 * lag, 1000.0 * rms(clean, out)
+
+def main():
+    rows = [("unfiltered", "-", "-") + measure(lambda: None)]
+    pose = [0.01, 1.2, -0.3, 0.1, 0.2, 0.3]
+    for min_cutoff, beta in PARAMS:
+        f = OneEuroFilter(min_cutoff, beta)
+        t = [0.0]
+
+        def step():
+            t[0] += 1.0 / RATE
+            f.filter_into(t[0], pose, pose)
+
+        rows.append(("min_cutoff %.1f beta %.1f" % (min_cutoff, beta),
+                     ns_per_op(step), alloc_bytes_per_op(step)) +
+                    measure(lambda: OneEuroFilter(min_cutoff, beta)))
+    print_table(["filter", "ns/sample", "B/sample", "jitter mm", "lag ms", "error mm"], rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Cost of the two-bone arm model (alvr_freepie.ik) per call against the
+# fixed-offset arm model, and per row of the NumPy versions for 1 to 1024
+# rows. Orientations alternate between two sets so the memoized normalized
+# roll of PoseContext never hits.
+#
+# Exits with status 1 if a frame of two controllers (begin_frame and two
+# arm model calls) takes more than BUDGET times as long with ArmIKContext /
+# calc_arm_ik_into as with PoseContext / calc_arm_model_into.
+#
+#   python -m benchmarks.bench_ik
+
+import math
+import random
+import sys
+
+from alvr_freepie.armmodel import PoseContext, calc_arm_model_into, arm_model_rows, numpy
+from alvr_freepie.ik import (ArmGeometry, ArmIKContext, calc_arm_ik_into, solve_two_bone_into,
+    arm_ik_rows, two_bone_rows)
+from benchmarks._bench import ns_per_op, print_table
+
+ROWS = (1, 8, 64, 1024)
+BUDGET = 1.5
+
+
+def main():
+    rnd = random.Random(21)
+    head = [0.2, -0.3, 0.05]
+    head_pos = [0.0, 1.6, 0.0]
+    frames = [[rnd.uniform(-math.pi, math.pi) for _ in range(3)] for _ in range(2)]
+    tick = [0]
+    out = [0.0, 0.0, 0.0]
+    geometry = ArmGeometry()
+    legacy = PoseContext(1)
+    ik = ArmIKContext(1, geometry)
+    legacy.begin_frame(head, head_pos)
+    ik.begin_frame(head, head_pos)
+
+    def arm(ctx, solve):
+        def run():
+            tick[0] ^= 1
+            solve(ctx, frames[tick[0]], 1, 0.6, out, 0)
+        return run
+
+    shoulder = [0.18, 1.4, 0.0]
+    targets = [[0.3, 1.1, -0.35], [0.1, 1.3, -0.5]]
+    elbow = [0.0, 0.0, 0.0]
+
+    def two_bone():
+        tick[0] ^= 1
+        solve_two_bone_into(shoulder, targets[tick[0]], geometry.pole, geometry.upper,
+                            geometry.fore, geometry.min_elbow, elbow, out)
+
+    calls = [("PoseContext.begin_frame", ns_per_op(lambda: legacy.begin_frame(head, head_pos))),
+             ("ArmIKContext.begin_frame", ns_per_op(lambda: ik.begin_frame(head, head_pos))),
+             ("calc_arm_model_into", ns_per_op(arm(legacy, calc_arm_model_into))),
+             ("calc_arm_ik_into", ns_per_op(arm(ik, calc_arm_ik_into))),
+             ("solve_two_bone_into", ns_per_op(two_bone))]
+    frames_ns = (calls[0][1] + 2 * calls[2][1], calls[1][1] + 2 * calls[3][1])
+    calls.append(("frame of 2, fixed offsets", frames_ns[0]))
+    calls.append(("frame of 2, two-bone", frames_ns[1]))
+    print_table(["per call", "ns"], calls)
+
+    if numpy is not None:
+        rows = []
+        for n in ROWS:
+            head_orientations = numpy.array([[rnd.uniform(-0.5, 0.5), rnd.uniform(-math.pi, math.pi),
+                                              rnd.uniform(-0.2, 0.2)] for _ in range(n)])
+            head_positions = numpy.tile(head_pos, (n, 1))
+            orientations = numpy.array([[rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+                                        for _ in range(n)])
+            sides = numpy.array([1.0 if i % 2 == 0 else -1.0 for i in range(n)])
+            arm_rolls = numpy.array([rnd.uniform(0.0, 1.5) for _ in range(n)])
+            positions = numpy.empty((n, 3))
+            elbows = numpy.empty((n, 3))
+            shoulders = head_positions + [0.18, -0.2, 0.0]
+            reach = shoulders + numpy.array([[rnd.uniform(-0.6, 0.6) for _ in range(3)]
+                                             for _ in range(n)])
+            number = max(200, 20000 // n)
+            rows.append(("%d" % n,
+                ns_per_op(lambda: arm_model_rows(head_orientations, head_positions, orientations,
+                                                 sides, arm_rolls, positions), number) / n,
+                ns_per_op(lambda: arm_ik_rows(geometry, head_orientations, head_positions,
+                                              orientations, sides, arm_rolls, positions, elbows),
+                          number) / n,
+                ns_per_op(lambda: two_bone_rows(shoulders, reach, geometry.pole, geometry.upper,
+                                                geometry.fore, geometry.min_elbow, elbows,
+                                                positions), number) / n))
+        print("")
+        print_table(["rows", "arm_model_rows ns/row", "arm_ik_rows ns/row",
+                     "two_bone_rows ns/row"], rows)
+
+    if frames_ns[1] > BUDGET * frames_ns[0]:
+        print("")
+        print("FAILED: a two-bone frame takes %.1fx the fixed arm model (budget %.1fx)" % (
+            frames_ns[1] / frames_ns[0], BUDGET))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Cost of an instrumentation span (disabled / enabled) and of the sampled
+# watch view, plus a check that the histogram percentiles stay within one
+# bucket of the exact values.
+#
+#   python -m benchmarks.bench_instrument
+
+import random
+import sys
+
+from alvr_freepie.instrument import Instrumentation, Sampler, Histogram, SPAN_ARM_MODEL
+from alvr_freepie.sim import FakeDiagnostics
+from benchmarks._bench import ns_per_op, alloc_bytes_per_op, print_table
+
+# ratio between neighbouring bucket edges
+BUCKET_RATIO = 2.0 ** 0.25
+
+
+def check_percentiles():
+    rnd = random.Random(3)
+    samples = [rnd.lognormvariate(-11.0, 1.0) for _ in range(20000)]
+    histogram = Histogram()
+    for value in samples:
+        histogram.add(value)
+    ordered = sorted(samples)
+    worst = 1.0
+    for q in (0.5, 0.9, 0.99, 0.999):
+        exact = ordered[int(q * len(ordered)) - 1]
+        estimate = histogram.percentile(q)
+        ratio = max(estimate / exact, exact / estimate)
+        worst = max(worst, ratio)
+        if ratio > BUCKET_RATIO:
+            print("FAILED: p%g %.3g s, exact %.3g s" % (100 * q, estimate, exact))
+            sys.exit(1)
+    if histogram.max != ordered[-1]:
+        print("FAILED: max %.3g s, exact %.3g s" % (histogram.max, ordered[-1]))
+        sys.exit(1)
+    print("percentiles within %.1f%% of exact (bucket width %.1f%%)\n" % (
+        100 * (worst - 1.0), 100 * (BUCKET_RATIO - 1.0)))
+
+
+def main():
+    check_percentiles()
+
+    disabled = Instrumentation(False)
+    enabled = Instrumentation(True)
+    diagnostics = FakeDiagnostics()
+    off = Sampler(0)
+    every_30 = Sampler(30)
+
+    def span_disabled():
+        t = disabled.start()
+        disabled.stop(SPAN_ARM_MODEL, t)
+
+    def span_enabled():
+        t = enabled.start()
+        enabled.stop(SPAN_ARM_MODEL, t)
+
+    def tick_enabled():
+        enabled.tick()
+
+    def watch_always():
+        diagnostics.watch(1.0)
+        diagnostics.watch(2.0)
+        diagnostics.watch(3.0)
+
+    def watch_off():
+        if off.due():
+            watch_always()
+
+    def watch_sampled():
+        if every_30.due():
+            watch_always()
+
+    rows = []
+    for name, fn in (("span, disabled", span_disabled),
+                     ("span, enabled", span_enabled),
+                     ("tick (no report due)", tick_enabled),
+                     ("3 watches, every call", watch_always),
+                     ("3 watches, WATCH_EVERY=0", watch_off),
+                     ("3 watches, WATCH_EVERY=30", watch_sampled)):
+        rows.append((name, ns_per_op(fn, number=100000), alloc_bytes_per_op(fn)))
+    print_table(["operation", "ns/op", "B/op"], rows)
+    print("\n(watch cost is the headless FakeDiagnostics; FreePIE's watch panel "
+          "costs more)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Per-frame PoseContext against calling the legacy calc_arm_model twice.
+#
+# Mirrors one frame of go_single_psmove.py in MODE_ARM: arm model for the Go
+# controller and the PS Move plus the normalized roll lookup of the PS Move.
+# Before timing, the counters of PoseContext are checked: the head terms must
+# be computed exactly once per frame and the normalized roll once per changed
+# orientation, with positions equal to the legacy model.
+#
+#   python -m benchmarks.bench_pose_context
+
+import math
+import random
+
+from alvr_freepie.armmodel import PoseContext, calc_arm_model_into
+from benchmarks import legacy
+from benchmarks._bench import ns_per_op, print_table
+
+
+def random_frames(count, seed=1):
+    rnd = random.Random(seed)
+    frames = []
+    psm = [0.0, 0.0, 0.0]
+    for i in range(count):
+        head = [rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+        go = [rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+        # the PS Move delivers new samples at a lower rate than the script
+        if i % 3 == 0:
+            psm = [rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+        frames.append((head, [0.1, 1.6, 0.2], go, psm, rnd.uniform(0.0, 1.5)))
+    return frames
+
+def check_counters(frames):
+    ctx = PoseContext(2)
+    out = [0.0, 0.0, 0.0]
+    changes = 0
+    last = {}
+    for frame, (head, head_pos, go, psm, arm_roll) in enumerate(frames, 1):
+        ctx.begin_frame(head, head_pos)
+        for slot, (ypr, side) in enumerate(((go, +1), (psm, -1))):
+            if last.get(slot) != ypr:
+                changes += 1
+                last[slot] = ypr
+            calc_arm_model_into(ctx, ypr, side, arm_roll, out, slot)
+            expected = legacy.calc_arm_model(ypr, side, arm_roll, head, head_pos)
+            if max(abs(a - b) for a, b in zip(out, expected)) > 1e-12:
+                raise AssertionError("arm model differs in frame %d" % frame)
+        ctx.normalized_roll(psm, 1)
+        if ctx.head_computations != frame:
+            raise AssertionError("head terms computed %d times in %d frames"
+                                 % (ctx.head_computations, frame))
+        if ctx.roll_computations != changes:
+            raise AssertionError("normalized roll computed %d times for %d changes"
+                                 % (ctx.roll_computations, changes))
+
+def main():
+    frames = random_frames(3000)
+    check_counters(frames)
+    print("counter check: head terms once per frame, roll once per change\n")
+
+    head, head_pos, go, psm, arm_roll = frames[0]
+    ctx = PoseContext(2)
+    out = [0.0, 0.0, 0.0]
+
+    def legacy_frame():
+        legacy.calc_arm_model(go, +1, arm_roll, head, head_pos)
+        legacy.calc_arm_model(psm, -1, arm_roll, head, head_pos)
+        legacy.get_normalized_roll(psm)
+
+    def context_frame():
+        ctx.begin_frame(head, head_pos)
+        calc_arm_model_into(ctx, go, +1, arm_roll, out, 0)
+        calc_arm_model_into(ctx, psm, -1, arm_roll, out, 1)
+        ctx.normalized_roll(psm, 1)
+
+    print_table(["frame (2 controllers + arm mode, static pose)", "ns/frame"],
+                [("legacy calc_arm_model", ns_per_op(legacy_frame, number=5000)),
+                 ("PoseContext", ns_per_op(context_frame, number=5000))])
+
+if __name__ == "__main__":
+    main()
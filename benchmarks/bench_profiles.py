@@ -0,0 +1,136 @@
+# Profile pipeline: the scripts against go_profile.py, and profiles of the
+# same layout against each other.
+#
+# Records a session with synthetic motion and random PS Move / Go buttons
+# (so the select / move mode switching is exercised), replays it into both
+# runs of each pair and checks that the whole alvr state is identical after
+# every tick: each script against go_profile.py with the script's profile,
+# and the INI form of the single PS Move layout against the JSON form. Then
+# reports profile load + compile time and the tick time of every profile.
+#
+#   python -m benchmarks.bench_profiles [--ticks 6000]
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+from alvr_freepie.pipeline import load_profile, compile_profile
+from alvr_freepie.session import SessionReader, SessionRecorder, replay_stream
+from alvr_freepie.sim import (Runtime, FakeAlvr, FakeIO, FakeDiagnostics,
+    RecordingArray, synthetic_stream)
+from benchmarks._bench import print_table
+
+# pairs of (script, profile or None for the script's own) runs
+PAIRS = [(("go_single_psmove.py", None), ("go_profile.py", "profiles/single_psmove.json")),
+         (("Go_Dual_PSMove_Plus_Head_6DOF.py", None),
+          ("go_profile.py", "profiles/dual_psmove_head.json")),
+         (("go_profile.py", "profiles/single_psmove.json"),
+          ("go_profile.py", "profiles/gear_vr_single_psmove.ini"))]
+PROFILES = ("profiles/single_psmove.json", "profiles/gear_vr_single_psmove.ini",
+            "profiles/single_psmove_ik.json", "profiles/dual_psmove_head.json")
+
+
+# synthetic motion (default synthetic_stream()) with buttons that change
+# every few updates
+def button_stream(seed=4, motion=None):
+    if motion is None:
+        motion = synthetic_stream()
+    rnd = random.Random(seed)
+    masks = [0, 0]
+
+    def stream(runtime, tick):
+        fired = motion(runtime, tick)
+        if fired:
+            for i in (0, 1):
+                if rnd.random() < 0.08:
+                    masks[i] ^= 1 << rnd.randrange(8)
+            slot3 = runtime.freepie_io[3]
+            slot3.x = float(masks[0])
+            slot3.y = float(masks[1])
+        if rnd.random() < 0.05:
+            runtime.alvr.input_buttons.load([rnd.random() < 0.3 for _ in range(6)])
+        return fired
+
+    return stream
+
+def record_session(path, ticks):
+    recorder = SessionRecorder(path)
+    runtime = Runtime("go_single_psmove.py", button_stream(), record=False,
+                      recorder=recorder)
+    for _ in range(ticks + 1):
+        runtime.tick()
+    recorder.close()
+
+def state(alvr):
+    values = []
+    for name, value in sorted(alvr.__dict__.items()):
+        if name in ("writes", "tick", "recording"):
+            continue
+        values.append((name, repr(value) if isinstance(value, RecordingArray) else value))
+    return values
+
+def runtime(run, stream):
+    script, profile = run
+    settings = {"PROFILE": repr(profile)} if profile else None
+    return Runtime(script, stream, record=False, settings=settings)
+
+def name(run):
+    script, profile = run
+    return "%s with %s" % (script, profile) if profile else script
+
+def compare(session, a, b):
+    reader = SessionReader(session)
+    expected = runtime(a, replay_stream(reader))
+    actual = runtime(b, replay_stream(reader))
+    messages = set()
+    for tick in range(len(reader)):
+        expected.tick()
+        actual.tick()
+        state_a = state(expected.alvr)
+        state_b = state(actual.alvr)
+        if state_a != state_b:
+            for (field, x), (_, y) in zip(state_a, state_b):
+                if x != y:
+                    print("FAILED: %s / %s differ at tick %d in alvr.%s:\n  %r\n  %r"
+                          % (name(a), name(b), tick, field, x, y))
+            sys.exit(1)
+        messages.add(expected.alvr.message.split(" ")[0])
+    reader.close()
+    return len(reader), messages
+
+def startup_seconds(profile):
+    def build():
+        compile_profile(load_profile(profile), FakeAlvr(), [FakeIO() for _ in range(4)],
+                        FakeDiagnostics())
+    return min(timeit.repeat(build, number=20, repeat=5)) / 20
+
+def tick_seconds(profile, session):
+    reader = SessionReader(session)
+    report = runtime(("go_profile.py", profile), replay_stream(reader)).run(len(reader) - 1)
+    reader.close()
+    return sum(report.tick_times) / len(report.tick_times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=6000)
+    args = parser.parse_args()
+    session = os.path.join(tempfile.mkdtemp(), "profiles.afps")
+    record_session(session, args.ticks)
+    for a, b in PAIRS:
+        ticks, messages = compare(session, a, b)
+        print("%s == %s: %d ticks identical (messages seen: %s)"
+              % (name(a), name(b), ticks, " ".join(sorted(m for m in messages if m))))
+    print("")
+    rows = []
+    for profile in PROFILES:
+        rows.append((profile, startup_seconds(profile) * 1e6,
+                     tick_seconds(profile, session) * 1e6))
+    print_table(["profile", "load+compile us", "us/tick"], rows)
+    os.remove(session)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# PS Move euler -> ALVR euler conversion: closed-form psm_euler2euler_into
+# against the two-step psm_euler2quaternion + quaternion2euler path.
+#
+# Before timing, the closed form is checked on a grid over the full angle
+# range (including every pitch = +-90 deg case that ends up in gimbal lock),
+# on random samples and on samples around quatmath.GIMBAL_COS. Where the
+# closed form is used its angles must describe the PS Move rotation
+# (ROTATION_TOLERANCE) and equal the angles of the two-step path of the
+# original scripts within ANGLE_TOLERANCE. Where cos(pitch) < GIMBAL_COS
+# takes the two-step path they must equal it bit for bit; the rotation is
+# not checked there, the two-step path itself is off by up to 0.2 rad so
+# close to gimbal lock. Any difference aborts the benchmark.
+#
+#   python -m benchmarks.bench_psm_euler
+
+import math
+import random
+
+from alvr_freepie import quatmath as qm
+from benchmarks import legacy
+from benchmarks._bench import ns_per_op, alloc_bytes_per_op, print_table
+
+DEVICES = 3
+ROTATION_TOLERANCE = 1e-12
+ANGLE_TOLERANCE = 1e-9
+
+
+def golden_inputs():
+    steps = [i * math.pi / 12 for i in range(-12, 13)]
+    for yaw in steps:
+        for pitch in steps:
+            for roll in steps:
+                yield [yaw, pitch, roll]
+    rnd = random.Random(1)
+    for _ in range(50000):
+        yield [rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+    # cos(pitch) = sqrt(1 - (sin(yaw) cos(roll))^2) from 0 to 10 * GIMBAL_COS
+    for _ in range(20000):
+        c = rnd.uniform(0.0, 10.0 * qm.GIMBAL_COS)
+        roll = rnd.choice((0.0, math.pi)) + rnd.uniform(-c, c)
+        yaw = rnd.choice((1.0, -1.0)) * (qm.HALF_PI - rnd.uniform(0.0, c))
+        yield [yaw, rnd.uniform(-math.pi, math.pi), roll]
+
+def two_step_taken(ypr):
+    sinp = math.sin(ypr[0]) * math.cos(ypr[2])
+    return 1.0 - sinp * sinp < qm.GIMBAL_COS * qm.GIMBAL_COS
+
+# 1 - |cos| of the angle between two rotations (0 for the same rotation)
+def rotation_error(a, b):
+    return 1.0 - math.fabs(a[0] * b[0] + a[1] * b[1] + a[2] * b[2] + a[3] * b[3])
+
+def angle_error(a, b):
+    return max(math.fabs((x - y + math.pi) % (2.0 * math.pi) - math.pi) for x, y in zip(a, b))
+
+def check_golden():
+    out = [0.0, 0.0, 0.0]
+    samples = 0
+    locked = 0
+    for ypr in golden_inputs():
+        q = legacy.psm_euler2quaternion(ypr)
+        expected = legacy.quaternion2euler(q)
+        qm.psm_euler2euler_into(ypr, out)
+        samples += 1
+        if two_step_taken(ypr):
+            locked += 1
+            if out != expected:
+                raise AssertionError("not bit-equal near gimbal lock for %r: %r != %r"
+                                     % (ypr, out, expected))
+            continue
+        if rotation_error(legacy.euler2quaternion(out), q) > ROTATION_TOLERANCE:
+            raise AssertionError("wrong rotation for %r: %r" % (ypr, out))
+        if angle_error(out, expected) > ANGLE_TOLERANCE:
+            raise AssertionError("mismatch for %r: %r != %r" % (ypr, out, expected))
+    if not locked:
+        raise AssertionError("two-step branch not covered")
+    return samples, locked
+
+def main():
+    samples, locked = check_golden()
+    print("golden check: %d samples match (%d in the two-step branch)\n"
+          % (samples, locked))
+
+    rnd = random.Random(2)
+    poses = [[rnd.uniform(-math.pi, math.pi) for _ in range(3)]
+             for _ in range(DEVICES)]
+    out = [0.0, 0.0, 0.0]
+
+    def two_step():
+        for ypr in poses:
+            legacy.quaternion2euler(legacy.psm_euler2quaternion(ypr))
+
+    def closed_form():
+        for ypr in poses:
+            qm.psm_euler2euler_into(ypr, out)
+
+    old_ns = ns_per_op(two_step)
+    new_ns = ns_per_op(closed_form)
+    print_table(["%d devices per update" % DEVICES, "ns/update", "ns/sample",
+                 "B/update"],
+                [("two-step", old_ns, old_ns / DEVICES, alloc_bytes_per_op(two_step)),
+                 ("closed form", new_ns, new_ns / DEVICES, alloc_bytes_per_op(closed_form))])
+
+if __name__ == "__main__":
+    main()
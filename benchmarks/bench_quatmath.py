@@ -0,0 +1,57 @@
+# ns/op and allocations of alvr_freepie.quatmath against the copies the
+# scripts used to carry (benchmarks/legacy.py).
+#
+#   python -m benchmarks.bench_quatmath
+
+from alvr_freepie import quatmath as qm
+from benchmarks import legacy
+from benchmarks._bench import ns_per_op, alloc_bytes_per_op, print_table
+
+
+def cases():
+    ypr = [0.3, -0.7, 1.1]
+    q = legacy.euler2quaternion(ypr)
+    r = legacy.euler2quaternion([-1.2, 0.4, 0.2])
+    vec = [0.1, -0.25, -0.4, 0.0]
+    q_out = qm.new_quat()
+    v_out = qm.new_vec()
+    e_out = [0.0, 0.0, 0.0]
+    return [
+        ("multiply",
+         lambda: legacy.multiply(q, r),
+         lambda: qm.multiply_into(q, r, q_out)),
+        ("conj",
+         lambda: legacy.conj(q),
+         lambda: qm.conj_into(q, q_out)),
+        ("euler2quaternion",
+         lambda: legacy.euler2quaternion(ypr),
+         lambda: qm.euler2quaternion_into(ypr, q_out)),
+        ("psm_euler2quaternion",
+         lambda: legacy.psm_euler2quaternion(ypr),
+         lambda: qm.psm_euler2quaternion_into(ypr, q_out)),
+        ("quaternion2euler",
+         lambda: legacy.quaternion2euler(q),
+         lambda: qm.quaternion2euler_into(q, e_out)),
+        ("q_extract_axis",
+         lambda: legacy.q_extract_axis(q, 1),
+         lambda: qm.q_extract_axis_into(q, 1, q_out)),
+        ("q_rotatevec",
+         lambda: legacy.q_rotatevec(q, vec),
+         lambda: qm.q_rotatevec_into(q, vec, v_out)),
+        ("rotatevec",
+         lambda: legacy.rotatevec(ypr, vec),
+         lambda: qm.rotatevec_into(ypr, vec, v_out)),
+    ]
+
+def main():
+    rows = []
+    for name, old, new in cases():
+        old_ns = ns_per_op(old)
+        new_ns = ns_per_op(new)
+        rows.append((name, old_ns, new_ns, old_ns / new_ns,
+                     alloc_bytes_per_op(old), alloc_bytes_per_op(new)))
+    print_table(["function", "legacy ns/op", "_into ns/op", "speedup",
+                 "legacy B/op", "_into B/op"], rows)
+
+if __name__ == "__main__":
+    main()
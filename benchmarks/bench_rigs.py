@@ -0,0 +1,115 @@
+# Many rigs in one process (alvr_freepie.rigs): tick time and memory per rig
+# for 1 to 64 rigs running profiles/single_psmove.json and
+# profiles/single_psmove_ik.json (two arm model controllers each, fixed
+# offsets / two-bone), every rig with its own synthetic input.
+#
+# Per-rig ticks (Pipeline.tick of each rig) are compared with the batched
+# scheduler (arm models of all rigs in one NumPy call). The tick time
+# includes the PS Move update events of that tick but not the generation of
+# the input. Both must write the same controller and head positions and,
+# for the two-bone arm model, the same elbows (1e-9), else exits with
+# status 1. Memory per rig is what compiling its pipeline
+# allocates, without the alvr / freePieIO stand-ins.
+#
+#   python -m benchmarks.bench_rigs [--ticks 600]
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from alvr_freepie import clock
+from alvr_freepie.pipeline import load_profile
+from alvr_freepie.rigs import Rig, RigScheduler
+from alvr_freepie.sim import FakeAlvr, FakeIO, FakeDiagnostics, synthetic_stream
+from benchmarks._bench import print_table
+
+PROFILES = ("profiles/single_psmove.json", "profiles/single_psmove_ik.json")
+RIG_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+TOLERANCE = 1e-9
+
+
+# what synthetic_stream needs of a Runtime, one per rig
+class Feed(object):
+    __slots__ = ("alvr", "freepie_io", "now", "stream")
+
+    def __init__(self, seed):
+        self.alvr = FakeAlvr()
+        self.freepie_io = [FakeIO() for _ in range(4)]
+        self.now = 0.0
+        self.stream = synthetic_stream(120.0, 60.0, seed=seed)
+
+# count rigs with their feeds; returns (scheduler, feeds, bytes per rig)
+def build(profile, count, batched):
+    feeds = [Feed(i) for i in range(count)]
+    diagnostics = FakeDiagnostics()
+    tracemalloc.start()
+    rigs = [Rig(profile, feed.alvr, feed.freepie_io, diagnostics) for feed in feeds]
+    memory = tracemalloc.get_traced_memory()[0] / float(count)
+    tracemalloc.stop()
+    return RigScheduler(rigs, batched), feeds, memory
+
+# run ticks; returns (seconds per tick, positions and elbows after every
+# tick)
+def run(scheduler, feeds, ticks):
+    now = [0.0]
+    clock.set_source(lambda: now[0])
+    elapsed = 0.0
+    outputs = []
+    try:
+        for tick in range(ticks):
+            fired = [feed.stream(feed, tick) for feed in feeds]
+            now[0] = feeds[0].now
+            start = time.perf_counter()
+            for feed, fire in zip(feeds, fired):
+                if fire:
+                    feed.freepie_io[0].update.fire()
+            scheduler.tick()
+            elapsed += time.perf_counter() - start
+            values = [value for feed in feeds
+                      for array in (feed.alvr.head_position,
+                                    feed.alvr.controller_position[0],
+                                    feed.alvr.controller_position[1])
+                      for value in array]
+            for rig in scheduler.rigs:
+                for arm in rig.pipeline.arm_models:
+                    elbows = getattr(arm.ctx, "elbows", None)
+                    if elbows is not None:
+                        values.extend(elbows[arm.slot])
+            outputs.append(values)
+    finally:
+        clock.set_source(None)
+    return elapsed / ticks, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=600)
+    args = parser.parse_args()
+    failed = []
+    rows = []
+    for name in PROFILES:
+        profile = load_profile(name)
+        for count in RIG_COUNTS:
+            scheduler, feeds, memory = build(profile, count, False)
+            rig_seconds, rig_outputs = run(scheduler, feeds, args.ticks)
+            scheduler, feeds, _ = build(profile, count, True)
+            batch_seconds, batch_outputs = run(scheduler, feeds, args.ticks)
+            difference = max(abs(a - b) for x, y in zip(rig_outputs, batch_outputs)
+                             for a, b in zip(x, y))
+            if difference > TOLERANCE:
+                failed.append("%s, %d rigs: batched outputs differ by %.3g"
+                              % (name, count, difference))
+            rows.append((name, str(count), rig_seconds * 1e6, batch_seconds * 1e6,
+                         rig_seconds * 1e6 / count, batch_seconds * 1e6 / count,
+                         memory / 1024.0, "%.1e" % difference))
+    print_table(["profile", "rigs", "per-rig us/tick", "batched us/tick", "per-rig us/rig",
+                 "batched us/rig", "KB/rig", "max difference"], rows)
+    if failed:
+        print("")
+        for line in failed:
+            print("FAILED: " + line)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Cost of SessionRecorder.record() in the script tick and replay throughput.
+#
+# record() is timed for ticks with and without a freePieIO update and for
+# the usual mix of a 120 Hz script with 60 Hz PS Move samples. Every record
+# is read back and compared with the values it was made from, and each
+# script recording RECORD_SESSION in the headless runtime must have every
+# tick in its file after the `stopping` run. A failure exits with status 1.
+#
+#   python -m benchmarks.bench_session
+
+import os
+import sys
+import tempfile
+
+from alvr_freepie.session import FLAG_UPDATE, SessionReader, SessionRecorder
+from alvr_freepie.sim import FakeAlvr, FakeIO, Runtime, synthetic_stream
+from benchmarks._bench import ns_per_op, alloc_bytes_per_op, print_table
+
+SCRIPTS = ("go_single_psmove.py", "Go_Dual_PSMove_Plus_Head_6DOF.py", "go_profile.py")
+
+
+def fill(alvr, freepie_io, i):
+    for j, device in enumerate(freepie_io):
+        device.x = i + 0.25 * j
+        device.yaw = -i - 0.5 * j
+    alvr.input_head_orientation.load([0.001 * i, 0.2, -0.3])
+    alvr.input_trackpad.load([0.5, -0.001 * i])
+    alvr.input_buttons.load([k == i % 3 for k in range(len(alvr.input_buttons))])
+
+# records that differ from what record() was given, as text lines
+def check(path, ticks):
+    alvr = FakeAlvr()
+    freepie_io = [FakeIO() for _ in range(4)]
+    reader = SessionReader(path)
+    problems = []
+    if len(reader) != ticks:
+        problems.append("%d records, expected %d" % (len(reader), ticks))
+    for i in range(min(len(reader), ticks)):
+        if i % 2 == 0:
+            fill(alvr, freepie_io, i)
+        record = reader[i]
+        expected = []
+        for device in freepie_io:
+            expected.extend([device.x, device.y, device.z, device.yaw, device.pitch, device.roll])
+        expected.extend(list(alvr.input_head_orientation) + [0.0] * 9 +
+                        list(alvr.input_trackpad))
+        buttons = sum(1 << k for k, b in enumerate(alvr.input_buttons) if b)
+        if (record[1] != i or list(record[3:-1]) != expected or record[-1] != buttons or
+                (record[2] & FLAG_UPDATE != 0) != (i % 2 == 0)):
+            problems.append("record %d differs" % i)
+            break
+    reader.close()
+    return problems
+
+# whether a session recorded by script holds all ticks after stopping
+def script_session_complete(script, directory, ticks=300):
+    path = os.path.join(directory, "script.afps")
+    runtime = Runtime(script, synthetic_stream(), record=False,
+                      settings={"RECORD_SESSION": repr(path)})
+    runtime.run(ticks)
+    runtime.stop()
+    reader = SessionReader(path)
+    # the starting tick, ticks and the stopping tick
+    complete = len(reader) == ticks + 2
+    reader.close()
+    os.remove(path)
+    return complete
+
+def main():
+    alvr = FakeAlvr()
+    freepie_io = [FakeIO() for _ in range(4)]
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "check.afps")
+    recorder = SessionRecorder(path, freepie_io, capacity=16)
+    ticks = 100
+    for i in range(ticks):
+        if i % 2 == 0:
+            fill(alvr, freepie_io, i)
+        recorder.record(alvr, freepie_io, i % 2 == 0)
+    recorder.close()
+    problems = check(path, ticks)
+    os.remove(path)
+    print("%s records read back as written%s" % ("FAILED" if problems else "ok    ",
+                                               "".join("\n       " + p for p in problems)))
+    for script in SCRIPTS:
+        complete = script_session_complete(script, directory)
+        print("%s %s session complete after stopping" % ("ok    " if complete else "FAILED",
+                                                        script))
+        if not complete:
+            problems.append(script)
+
+    path = os.path.join(directory, "bench.afps")
+    recorder = SessionRecorder(path, freepie_io)
+    tick = [0]
+
+    def record_update():
+        recorder.record(alvr, freepie_io, True)
+
+    def record_no_update():
+        recorder.record(alvr, freepie_io, False)
+
+    def record_mixed():
+        tick[0] ^= 1
+        recorder.record(alvr, freepie_io, tick[0] == 1)
+
+    rows = []
+    for name, fn in (("record, update tick", record_update),
+                     ("record, tick without update", record_no_update),
+                     ("record, 120 Hz ticks / 60 Hz samples", record_mixed)):
+        rows.append((name + " (incl. amortized flush)", ns_per_op(fn, number=50000),
+                     alloc_bytes_per_op(fn)))
+    recorder.close()
+
+    reader = SessionReader(path)
+    count = len(reader)
+
+    def read_all():
+        for record in reader:
+            pass
+
+    read_ns = ns_per_op(read_all, number=1, repeat=3) / count
+    reader.close()
+    os.remove(path)
+    os.rmdir(directory)
+    rows.append(("replay read", read_ns, "-"))
+    print("")
+    print_table(["operation", "ns/record", "B/record"], rows)
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Shared memory tracker transport (alvr_freepie.transport) against the
+# per-field freePieIO reads.
+#
+# - equivalence: the scripts fed through the transport must write exactly
+#   what they write when fed through freePieIO (else exit status 1)
+# - read cost per tick in one process: the 22 freePieIO field reads and two
+#   int() conversions of the dual PS Move update, against one poll() taking
+#   3 new samples. On CPython a FakeIO field read is a plain attribute
+#   access; inside FreePIE every one of them is an interop call.
+# - cross process: the stand-in producer (python -m alvr_freepie.transport)
+#   in a subprocess at fixed rates, the samples taken per second, the share
+#   lost to the producer lapping the reader and the age of the newest sample
+#   when poll() returns it
+#
+#   python -m benchmarks.bench_transport [--seconds 2]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from alvr_freepie.clock import system_clock
+from alvr_freepie.sim import Runtime, FakeIO
+from alvr_freepie.transport import (TrackerWriter, TrackerReader, HEADER, MAGIC,
+    TIMESTAMP, FLAG_CONNECTED, FLAG_TRACKED)
+from benchmarks._bench import ns_per_op, print_table
+from benchmarks.bench_profiles import button_stream, state
+
+SCRIPTS = (("go_single_psmove.py", {}),
+           ("Go_Dual_PSMove_Plus_Head_6DOF.py", {}),
+           ("go_profile.py", {"PROFILE": repr("profiles/single_psmove_ik.json")}))
+TICKS = 1500
+DEVICES = 3
+PRODUCER_RATES = (60.0, 1000.0, 10000.0, 50000.0)
+
+
+# button_stream delivered through writer instead of freePieIO
+def transport_stream(writer):
+    inner = button_stream()
+
+    def stream(runtime, tick):
+        if inner(runtime, tick):
+            io = runtime.freepie_io
+            packed = io[3]
+            triggers = (packed.yaw, packed.pitch, 0.0)
+            buttons = (int(packed.x), int(packed.y), 0)
+            for device in range(DEVICES):
+                d = io[device]
+                writer.write(device, runtime.now, d.x, d.y, d.z, d.yaw, d.pitch, d.roll,
+                             triggers[device], buttons[device], FLAG_CONNECTED | FLAG_TRACKED)
+        return False
+
+    return stream
+
+def equivalent(script, settings, directory):
+    path = os.path.join(directory, "equivalence.trk")
+    writer = TrackerWriter(path, DEVICES)
+    direct = Runtime(script, button_stream(), record=False, settings=settings)
+    settings = dict(settings, TRACKER_TRANSPORT=repr(path))
+    transported = Runtime(script, transport_stream(writer), record=False, settings=settings)
+    try:
+        for tick in range(TICKS):
+            direct.tick()
+            transported.tick()
+            if state(direct.alvr) != state(transported.alvr):
+                return "tick %d differs" % tick
+        return None
+    finally:
+        writer.close()
+        transported.globals["g_transport"].close()
+
+def read_costs(directory):
+    io = [FakeIO() for _ in range(4)]
+
+    def fields():
+        for device in (io[0], io[1], io[2]):
+            device.x; device.y; device.z; device.yaw; device.pitch; device.roll
+        packed = io[3]
+        packed.yaw; int(packed.x); packed.pitch; int(packed.y)
+
+    path = os.path.join(directory, "cost.trk")
+    writer = TrackerWriter(path, DEVICES)
+    reader = TrackerReader(path)
+    view = reader.freepie_io
+
+    def write3():
+        for device in (0, 1, 2):
+            writer.write(device, 0.0, 1.0, 2.0, 3.0, 0.1, 0.2, 0.3, 0.5, 4)
+
+    def write3_poll():
+        write3()
+        reader.poll()
+        for device in (view[0], view[1], view[2]):
+            device.x; device.y; device.z; device.yaw; device.pitch; device.roll
+        packed = view[3]
+        packed.yaw; int(packed.x); packed.pitch; int(packed.y)
+
+    rows = [("freePieIO: 22 field reads + 2 int()", ns_per_op(fields)),
+            ("transport: poll, nothing new", ns_per_op(reader.poll))]
+    write_ns = ns_per_op(write3)
+    rows.append(("transport: poll 3 samples + view reads", ns_per_op(write3_poll) - write_ns))
+    rows.append(("(producer: write 3 samples)", write_ns))
+    reader.close()
+    writer.close()
+    return rows
+
+# start the stand-in producer at rate; returns (process, reader)
+def start_producer(path, rate, seconds):
+    process = subprocess.Popen([sys.executable, "-m", "alvr_freepie.transport", path,
+                                "--rate", repr(rate), "--seconds", repr(seconds),
+                                "--devices", str(DEVICES)])
+    deadline = time.time() + 10.0
+    while time.time() < deadline:
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            with open(path, "rb") as f:
+                if f.read(4) == MAGIC:
+                    return process, TrackerReader(path)
+        time.sleep(0.01)
+    process.kill()
+    raise RuntimeError("the producer did not start")
+
+# age of the newest sample at the poll that returns it, with the producer
+# writing DEVICES samples rate times a second and a spinning reader
+def cross_process(directory, seconds):
+    rows = []
+    for rate in PRODUCER_RATES:
+        path = os.path.join(directory, "producer.trk")
+        process, reader = start_producer(path, rate, seconds)
+        ages = []
+        while process.poll() is None:
+            if reader.poll():
+                ages.append(system_clock() - max(sample[TIMESTAMP] for sample in reader.samples))
+        reader.poll()
+        reader.close()
+        ages.sort()
+        if ages:
+            rows.append(("%.0f Hz x %d devices" % (rate, DEVICES),
+                         reader.received / seconds / 1e3,
+                         100.0 * reader.dropped / max(reader.received + reader.dropped, 1),
+                         ages[len(ages) // 2] * 1e6, ages[int(0.99 * len(ages))] * 1e6))
+        os.remove(path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    failed = []
+    for script, settings in SCRIPTS:
+        problem = equivalent(script, settings, directory)
+        print("%s %s via transport%s" % ("FAILED" if problem else "ok    ", script,
+                                         ": " + problem if problem else ""))
+        if problem:
+            failed.append(script)
+    print("")
+    print_table(["per tick, one process", "ns"], read_costs(directory))
+    print("")
+    print_table(["producer process", "k samples/s", "dropped %", "p50 us", "p99 us"],
+                cross_process(directory, args.seconds))
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# PS Eye to HMD calibration solver (alvr_freepie.calibration) on synthetic
+# data with known ground truth.
+#
+# - exact samples: the solved rotation, scale and translation must match
+#   the ground truth to 1e-9, with NumPy and with the plain loops
+# - samples with 2 mm HMD noise: rotation within 0.2 deg, scale within
+#   0.5 %, translation within 5 mm, rms close to the noise
+# - collinear samples must be rejected
+# - head PS Move at a lever arm from the HMD, the head turning: the lever
+#   arm solve must recover the transform and the lever arm (exact: 1e-5 m,
+#   2 mm noise: 5 mm), NumPy and plain loops must agree; the plain solve
+#   is shown for comparison
+# - end to end: Go_Dual_PSMove_Plus_Head_6DOF.py in the headless runtime
+#   with a "calibrate" profile, calibrated with the left select button, must
+#   then put the head where the HMD reports it plus its device offset; a
+#   profile with the saved calibration file as well
+# Exits with status 1 on a failed check. Then reports the solve time per
+# sample count and the per-sample cost of the device transform.
+#
+#   python -m benchmarks.eval_calibration
+
+import math
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+from alvr_freepie import calibration
+from alvr_freepie.calibration import (solve_similarity, solve_head_calibration,
+    CalibrationSamples, load_calibration, device_matrix, transform_point_into)
+from alvr_freepie.buttons import PSM_SELECT
+from alvr_freepie.quatmath import euler2quaternion, q_rotatevec
+from alvr_freepie.sim import Runtime, FakeIO
+from benchmarks._bench import ns_per_op, print_table, profile_variant
+
+SAMPLE_COUNTS = (500, 2000, 5000)
+NOISE = 0.002
+# the head moves up to ~7 mm between two 60 Hz PS Eye samples
+HEAD_TOLERANCE = 0.01
+# head PS Move position in the head frame (meters)
+LEVER_ARM = (0.0, 0.08, -0.1)
+# head device offset added on top of the calibration in the end to end runs
+HEAD_OFFSET = [0.0, 0.05, 0.0]
+SCRIPT = "Go_Dual_PSMove_Plus_Head_6DOF.py"
+PROFILE = "profiles/dual_psmove_head.json"
+
+
+# random ground truth: rotation quaternion [x, y, z, w], scale, translation
+def ground_truth(rnd):
+    q = [rnd.gauss(0.0, 1.0) for _ in range(4)]
+    norm = math.sqrt(sum(v * v for v in q))
+    q = [v / norm for v in q]
+    if q[3] < 0.0:
+        q = [-v for v in q]
+    return q, rnd.uniform(0.008, 0.012), [rnd.uniform(-1.0, 1.0) for _ in range(3)]
+
+def apply_truth(truth, p):
+    q, scale, t = truth
+    v = q_rotatevec(q, [p[0], p[1], p[2], 0.0])
+    return tuple(scale * v[i] + t[i] for i in range(3))
+
+# PS Eye positions (cm) spread over the tracking volume, and HMD positions
+def samples(truth, count, noise, rnd):
+    source = [(rnd.uniform(-60.0, 60.0), rnd.uniform(100.0, 180.0), rnd.uniform(-150.0, -50.0))
+              for _ in range(count)]
+    target = [tuple(v + rnd.gauss(0.0, noise) for v in apply_truth(truth, p)) for p in source]
+    return source, target
+
+# PS Eye point (cm) of the head PS Move for the HMD position / orientation
+def head_source(truth, hmd, orientation, lever_arm):
+    q, scale, offset = truth
+    arm = q_rotatevec(euler2quaternion(orientation), list(lever_arm) + [0.0])
+    inverse = [-q[0], -q[1], -q[2], q[3]]
+    v = q_rotatevec(inverse, [(hmd[i] + arm[i] - offset[i]) / scale for i in range(3)] + [0.0])
+    return v[0], v[1], v[2]
+
+# head samples with the head turning: (source, target, rotations)
+def head_samples(truth, count, noise, rnd):
+    samples = CalibrationSamples(count, min_distance=0.0)
+    for _ in range(count):
+        hmd = (rnd.uniform(-0.5, 0.5), rnd.uniform(1.2, 1.9), rnd.uniform(-1.0, 0.0))
+        orientation = (rnd.uniform(-1.2, 1.2), rnd.uniform(-0.6, 0.6), rnd.uniform(-0.3, 0.3))
+        sx, sy, sz = head_source(truth, hmd, orientation, LEVER_ARM)
+        tx, ty, tz = [v + rnd.gauss(0.0, noise) for v in hmd]
+        samples.add(sx, sy, sz, tx, ty, tz, orientation)
+    return samples.source, samples.target, samples.rotations
+
+def rotation_error_deg(a, b):
+    dot = abs(sum(x * y for x, y in zip(a, b)))
+    return math.degrees(2.0 * math.acos(min(1.0, dot)))
+
+def solve(source, target, use_numpy, rotations=None):
+    saved = calibration.numpy
+    if not use_numpy:
+        calibration.numpy = None
+    try:
+        if rotations is None:
+            return solve_similarity(source, target)
+        return solve_head_calibration(source, target, rotations)
+    finally:
+        calibration.numpy = saved
+
+def lever_arm_error(result):
+    return math.sqrt(sum((a - b) ** 2 for a, b in zip(result["lever_arm"], LEVER_ARM)))
+
+def errors(truth, result):
+    q, scale, t = truth
+    m = result["matrix"]
+    return (rotation_error_deg(q, result["rotation"]), abs(result["scale"] / scale - 1.0),
+            math.sqrt(sum((m[4 * i + 3] - t[i]) ** 2 for i in range(3))))
+
+# head path and orientation of the HMD and the matching raw PS Eye
+# positions of the head PS Move
+def calibration_stream(truth, select_until=0.05):
+    def stream(runtime, tick):
+        t = tick / 120.0
+        runtime.now = t
+        hmd = (0.3 * math.sin(0.9 * t), 1.6 + 0.2 * math.sin(1.3 * t + 1.0),
+               -0.5 + 0.3 * math.cos(0.7 * t))
+        orientation = (0.8 * math.sin(0.5 * t), 0.4 * math.sin(0.8 * t + 0.3),
+                       0.2 * math.sin(1.1 * t))
+        runtime.alvr.input_head_position.load(list(hmd))
+        runtime.alvr.input_head_orientation.load(list(orientation))
+        if tick % 2:
+            return False
+        head = runtime.freepie_io[2]
+        head.x, head.y, head.z = head_source(truth, hmd, orientation, LEVER_ARM)
+        runtime.freepie_io[3].x = float(PSM_SELECT) if t < select_until else 0.0
+        return True
+    return stream
+
+# distance of the head from the HMD position plus offset
+def head_error(runtime, offset):
+    alvr = runtime.alvr
+    return math.sqrt(sum((alvr.head_position[i] - alvr.input_head_position[i] - offset[i]) ** 2
+                         for i in range(3)))
+
+# the dual PS Move profile with HEAD_OFFSET, calibrated with the file at
+# path by a calibration mode (samples: sample count) or per device, saved
+# next to it
+def calibrated_profile(path, samples=None):
+    def calibrate(profile):
+        if samples:
+            profile["calibrate"] = {"file": path, "samples": samples}
+        else:
+            for device in profile["devices"].values():
+                device["calibration"] = path
+        profile["devices"]["head"]["offset"] = HEAD_OFFSET
+    return profile_variant(PROFILE, os.path.dirname(path), "profile.json", calibrate)
+
+
+def main():
+    failed = []
+
+    def check(name, ok):
+        print("%s %s" % ("ok    " if ok else "FAILED", name))
+        if not ok:
+            failed.append(name)
+
+    rnd = random.Random(7)
+    use_numpy = (True, False) if calibration.numpy is not None else (False,)
+    for use in use_numpy:
+        label = "numpy" if use else "loops"
+        truth = ground_truth(rnd)
+        source, target = samples(truth, 3000, 0.0, rnd)
+        rotation, scale, translation = errors(truth, solve(source, target, use))
+        check("%s exact: rotation %.1e deg, scale %.1e, translation %.1e m"
+              % (label, rotation, scale, translation),
+              rotation < 1e-6 and scale < 1e-9 and translation < 1e-9)
+        truth = ground_truth(rnd)
+        source, target = samples(truth, 3000, NOISE, rnd)
+        result = solve(source, target, use)
+        rotation, scale, translation = errors(truth, result)
+        expected_rms = NOISE * math.sqrt(3.0)
+        check("%s %.0f mm noise: rotation %.3f deg, scale %.2f %%, translation %.1f mm, "
+              "rms %.2f mm" % (label, NOISE * 1000, rotation, scale * 100, translation * 1000,
+                               result["rms"] * 1000),
+              rotation < 0.2 and scale < 0.005 and translation < 0.005
+              and 0.8 * expected_rms < result["rms"] < 1.2 * expected_rms)
+    if len(use_numpy) == 2:
+        source, target = samples(ground_truth(rnd), 2000, NOISE, rnd)
+        a = solve(source, target, True)["matrix"]
+        b = solve(source, target, False)["matrix"]
+        check("numpy == loops: max difference %.1e" % max(abs(x - y) for x, y in zip(a, b)),
+              max(abs(x - y) for x, y in zip(a, b)) < 1e-9)
+
+    for use in use_numpy:
+        label = "numpy" if use else "loops"
+        truth = ground_truth(rnd)
+        source, target, rotations = head_samples(truth, 3000, 0.0, rnd)
+        result = solve(source, target, use, rotations)
+        rotation, scale, translation = errors(truth, result)
+        check("%s lever arm exact: rotation %.1e deg, scale %.1e, translation %.1e m, "
+              "lever arm %.1e m" % (label, rotation, scale, translation, lever_arm_error(result)),
+              rotation < 1e-3 and scale < 1e-6 and translation < 1e-5
+              and lever_arm_error(result) < 1e-5)
+        truth = ground_truth(rnd)
+        source, target, rotations = head_samples(truth, 3000, NOISE, rnd)
+        result = solve(source, target, use, rotations)
+        rotation, scale, translation = errors(truth, result)
+        plain = solve(source, target, use)
+        expected_rms = NOISE * math.sqrt(3.0)
+        check("%s lever arm %.0f mm noise: rotation %.3f deg, scale %.2f %%, translation "
+              "%.1f mm, lever arm %.1f mm, rms %.2f mm (without lever arm %.1f mm)"
+              % (label, NOISE * 1000, rotation, scale * 100, translation * 1000,
+                 lever_arm_error(result) * 1000, result["rms"] * 1000, plain["rms"] * 1000),
+              rotation < 0.2 and scale < 0.005 and translation < 0.005
+              and lever_arm_error(result) < 0.005
+              and 0.8 * expected_rms < result["rms"] < 1.2 * expected_rms)
+    if len(use_numpy) == 2:
+        source, target, rotations = head_samples(ground_truth(rnd), 2000, NOISE, rnd)
+        a = solve(source, target, True, rotations)
+        b = solve(source, target, False, rotations)
+        difference = max(abs(x - y) for x, y in zip(a["matrix"] + a["lever_arm"],
+                                                    b["matrix"] + b["lever_arm"]))
+        check("lever arm numpy == loops: max difference %.1e" % difference, difference < 1e-6)
+
+    line = [(float(i), 2.0 * i, -1.0 * i) for i in range(100)]
+    try:
+        solve_similarity(line, line)
+        check("collinear samples rejected", False)
+    except ValueError:
+        check("collinear samples rejected", True)
+
+    path = os.path.join(tempfile.mkdtemp(), "psmove_calibration.json")
+    truth = ground_truth(rnd)
+    profile_path = calibrated_profile(path, 300)
+    runtime = Runtime(SCRIPT, calibration_stream(truth), record=False,
+                      settings={"PROFILE": repr(profile_path)})
+    for _ in range(120 * 30):
+        runtime.tick()
+    os.remove(profile_path)
+    saved = load_calibration(path)
+    error = head_error(runtime, HEAD_OFFSET)
+    check("script calibration: %s, saved %s samples, lever arm %s mm off, head %.2f mm from "
+          "the HMD + offset"
+          % (runtime.alvr.message, saved and saved["samples"],
+             saved and "%.1f" % (lever_arm_error(saved) * 1000), error * 1000),
+          saved is not None and error < HEAD_TOLERANCE and lever_arm_error(saved) < 0.005)
+    profile_path = calibrated_profile(path)
+    runtime = Runtime(SCRIPT, calibration_stream(truth, 0.0), record=False,
+                      settings={"PROFILE": repr(profile_path)})
+    for _ in range(120 * 5):
+        runtime.tick()
+    error = head_error(runtime, HEAD_OFFSET)
+    check("profile calibration: head %.2f mm from the HMD + offset" % (error * 1000),
+          error < HEAD_TOLERANCE)
+    os.remove(profile_path)
+    os.remove(path)
+
+    print("")
+    rows = []
+    for count in SAMPLE_COUNTS:
+        source, target, rotations = head_samples(ground_truth(rnd), count, NOISE, rnd)
+        for label, head in (("solve", None), ("solve with lever arm", rotations)):
+            row = ["%s %d samples" % (label, count)]
+            for use in (True, False):
+                if use and calibration.numpy is None:
+                    row.append(float("nan"))
+                    continue
+                seconds = min(timeit.repeat(lambda: solve(source, target, use, head),
+                                            number=3, repeat=3)) / 3
+                row.append(seconds * 1e3)
+            rows.append(row)
+    print_table(["", "numpy ms", "loops ms"], rows)
+    print("")
+    matrix = device_matrix(None, [0.0, 0.1, -0.1])
+    out = [0.0, 0.0, 0.0]
+    io = FakeIO()
+    io.x, io.y, io.z = 12.5, 140.0, -80.0
+
+    def legacy():
+        out[0] = io.x/100
+        out[1] = io.y/100 + 0.1
+        out[2] = io.z/100 - 0.1
+
+    def transformed():
+        transform_point_into(matrix, io.x, io.y, io.z, out)
+
+    print_table(["per sample", "ns"], [("x/100 + offset", ns_per_op(legacy)),
+                                       ("4x4 device matrix", ns_per_op(transformed))])
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
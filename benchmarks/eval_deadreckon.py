@@ -0,0 +1,238 @@
+# Dead reckoning (the "dead_reckoning" of a profile's devices) against the
+# frozen positions of the
+# PS Eye losing a PS Move, on replayed sessions with injected dropouts.
+#
+# Records a synthetic session of Go_Dual_PSMove_Plus_Head_6DOF.py: both
+# hands and the head move with up to about 1 m/s, sampled at 60 Hz with
+# 1 mm noise, the script runs at 120 Hz. Then the same motion is recorded
+# with dropouts: every device loses optical tracking for 0.1 to 0.5 s every
+# few seconds, during which its position repeats the last optical fix (as
+# PSMoveService does) while the orientation goes on. Both sessions are
+# replayed with profiles/dual_psmove_head.json as it is and with a
+# dead_reckoning stage (default settings) on every device, and the positions
+# written to ALVR
+# are compared with the true positions of every tick:
+#   lost      rms / p95 / max error while a device is lost
+#   settled   rms error in the 0.3 s after the blend back onto the tracked
+#             position ended (blend_time after tracking returns)
+#   snap      largest jump of one tick beyond the true motion of that
+#             tick, around the returns (mean / max over the returns)
+# The sessions without dropouts, once with update events at the PS Eye rate
+# and once at the script rate (the PS Move IMU is faster than the camera, the
+# position repeats in between), must come out unchanged by dead reckoning.
+# The blend trails the tracked position on purpose, so the error during the
+# blend is not compared with the frozen positions, which jump straight onto
+# it. Exits with status 1 unless dead reckoning lowers the error while lost
+# and the largest snap, keeps every snap under SNAP_BOUND and the settled
+# error within SETTLED_MARGIN of the frozen positions, or if it changes the
+# output of a session without dropouts.
+#
+#   python -m benchmarks.eval_deadreckon [--seconds 60]
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+from alvr_freepie.deadreckon import DeadReckoning
+from alvr_freepie.session import SessionReader, SessionRecorder, replay_stream
+from alvr_freepie.sim import Runtime
+from benchmarks._bench import print_table, profile_variant
+
+SCRIPT = "Go_Dual_PSMove_Plus_Head_6DOF.py"
+PROFILE = "profiles/dual_psmove_head.json"
+TICK_RATE = 120.0
+IO_RATE = 60.0
+NOISE = 0.001
+# device offsets of the uncalibrated dual profile
+OFFSETS = ((0.0, 0.3, 0.0), (0.0, 0.3, 0.0), (0.0, 0.1, -0.1))
+DEVICES = ("left hand", "right hand", "head")
+DROPOUT_EVERY = (2.0, 5.0)
+DROPOUT_LENGTH = (0.1, 0.5)
+SETTLED = 0.3
+# allowed settled rms of dead reckoning relative to the frozen positions
+SETTLED_MARGIN = 1.25
+# largest allowed snap with dead reckoning (mm); the default blend moves
+# about 1.5 * gap / blend_time, 14 mm per tick for the 0.23 m gaps of the
+# longest dropouts, plus the sample noise
+SNAP_BOUND = 25.0
+# seconds from a return to the end of the default blend
+BLEND_TIME = DeadReckoning().blend_time
+# ticks after a return searched for the snap
+SNAP_TICKS = 12
+
+
+def truth(device, t):
+    if device == 2:
+        return (0.3 * math.sin(0.9 * t) + 0.05 * math.sin(3.1 * t),
+                1.6 + 0.03 * math.sin(2.3 * t),
+                -0.5 + 0.3 * math.cos(0.7 * t) + 0.04 * math.sin(4.3 * t))
+    side = 1.0 if device == 1 else -1.0
+    p = 0.9 * device
+    return (side * 0.25 + 0.2 * math.sin(1.7 * t + p) + 0.05 * math.sin(5.3 * t + p),
+            1.2 + 0.2 * math.sin(1.3 * t + 2.0 * p) + 0.04 * math.sin(4.1 * t),
+            -0.35 + 0.2 * math.cos(1.9 * t + p))
+
+# [(start, end)] dropout windows of each device
+def dropouts(seconds, seed=11):
+    rnd = random.Random(seed)
+    windows = []
+    for device in range(3):
+        device_windows = []
+        t = rnd.uniform(*DROPOUT_EVERY)
+        while t < seconds - 1.0:
+            length = rnd.uniform(*DROPOUT_LENGTH)
+            device_windows.append((t, t + length))
+            t += length + rnd.uniform(*DROPOUT_EVERY)
+        windows.append(device_windows)
+    return windows
+
+def lost_at(windows, t):
+    for start, end in windows:
+        if start <= t < end:
+            return True
+    return False
+
+# update events at update_rate, new positions at the PS Eye rate IO_RATE
+def session_stream(windows, update_rate=IO_RATE, seed=5):
+    rnd = random.Random(seed)
+
+    def stream(runtime, tick):
+        t = tick / TICK_RATE
+        runtime.now = t
+        if tick > 0 and int(t * update_rate) == int((tick - 1) / TICK_RATE * update_rate):
+            return False
+        frame = tick == 0 or int(t * IO_RATE) != int((tick - 1) / TICK_RATE * IO_RATE)
+        for device in range(3):
+            io = runtime.freepie_io[device]
+            io.yaw = 1.2 * math.sin(0.6 * t + device)
+            io.pitch = 0.8 * math.sin(0.9 * t + device)
+            io.roll = 0.6 * math.sin(1.1 * t + device)
+            if not frame or lost_at(windows[device], t):
+                continue
+            p = truth(device, t)
+            offset = OFFSETS[device]
+            io.x = (p[0] + rnd.gauss(0.0, NOISE) - offset[0]) * 100.0
+            io.y = (p[1] + rnd.gauss(0.0, NOISE) - offset[1]) * 100.0
+            io.z = (p[2] + rnd.gauss(0.0, NOISE) - offset[2]) * 100.0
+        return True
+
+    return stream
+
+def record(path, ticks, windows, update_rate=IO_RATE):
+    recorder = SessionRecorder(path)
+    runtime = Runtime(SCRIPT, session_stream(windows, update_rate), record=False,
+                      recorder=recorder)
+    for _ in range(ticks + 1):
+        runtime.tick()
+    recorder.close()
+
+# [(t, (left, right, head))] positions of every tick of a replay of the
+# script with profile
+def replay(path, profile):
+    reader = SessionReader(path)
+    runtime = Runtime(SCRIPT, replay_stream(reader), record=False,
+                      settings={"PROFILE": repr(profile)})
+    alvr = runtime.alvr
+    output = []
+    for _ in range(len(reader)):
+        runtime.tick()
+        output.append((runtime.now, (tuple(alvr.controller_position[0]),
+                                     tuple(alvr.controller_position[1]),
+                                     tuple(alvr.head_position))))
+    reader.close()
+    return output
+
+def distance(a, b):
+    return math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2)
+
+def rms(values):
+    return math.sqrt(sum(v * v for v in values) / len(values)) if values else 0.0
+
+# (lost rms, p95, max, settled rms, mean snap, max snap) in mm for device
+def evaluate(output, device, windows):
+    lost = []
+    settled = []
+    snaps = []
+    ends = [end for _, end in windows]
+    for t, positions in output:
+        p = positions[device]
+        error = distance(p, truth(device, t))
+        if lost_at(windows, t):
+            lost.append(error)
+        elif any(end + BLEND_TIME <= t < end + BLEND_TIME + SETTLED for end in ends):
+            settled.append(error)
+    for end in ends:
+        first = int(math.ceil(end * TICK_RATE)) - 1
+        snap = 0.0
+        for i in range(max(first, 1), min(first + SNAP_TICKS, len(output))):
+            t0, a = output[i - 1]
+            t1, b = output[i]
+            moved = [b[device][k] - a[device][k] for k in range(3)]
+            q0 = truth(device, t0)
+            q1 = truth(device, t1)
+            snap = max(snap, distance(moved, [q1[k] - q0[k] for k in range(3)]))
+        snaps.append(snap)
+    lost.sort()
+    return (rms(lost) * 1e3, lost[int(0.95 * len(lost))] * 1e3, lost[-1] * 1e3,
+            rms(settled) * 1e3, sum(snaps) / len(snaps) * 1e3, max(snaps) * 1e3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=60.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    ticks = int(args.seconds * TICK_RATE)
+    failed = []
+
+    def reckon(profile):
+        for device in profile["devices"].values():
+            device["dead_reckoning"] = {}
+    profiles = {False: PROFILE,
+                True: profile_variant(PROFILE, directory, "dead_reckoning.json", reckon)}
+
+    clean = os.path.join(directory, "clean.afps")
+    for update_rate in (IO_RATE, TICK_RATE):
+        record(clean, ticks, [[], [], []], update_rate)
+        same = replay(clean, profiles[False]) == replay(clean, profiles[True])
+        print("%s no dropouts, %.0f Hz updates: dead reckoning leaves the output unchanged"
+              % ("ok    " if same else "FAILED", update_rate))
+        if not same:
+            failed.append("output without dropouts at %.0f Hz updates" % update_rate)
+        os.remove(clean)
+
+    windows = dropouts(args.seconds)
+    path = os.path.join(directory, "dropouts.afps")
+    record(path, ticks, windows)
+    outputs = dict((reckoning, replay(path, profile))
+                   for reckoning, profile in profiles.items())
+    os.remove(profiles[True])
+    os.remove(path)
+    os.rmdir(directory)
+    rows = []
+    for device, name in enumerate(DEVICES):
+        results = {}
+        for reckoning in (False, True):
+            results[reckoning] = evaluate(outputs[reckoning], device, windows[device])
+            rows.append((name, "dead reckoning" if reckoning else "frozen") +
+                        results[reckoning])
+        if (results[True][0] >= results[False][0] or results[True][5] >= results[False][5]
+                or results[True][3] > SETTLED_MARGIN * results[False][3]):
+            failed.append(name)
+        if results[True][5] > SNAP_BOUND:
+            failed.append("%s snap %.1f mm > %.0f mm" % (name, results[True][5], SNAP_BOUND))
+    print("")
+    print("%d dropouts of %.1f to %.1f s in %.0f s, errors in mm" % (
+        sum(len(w) for w in windows), DROPOUT_LENGTH[0], DROPOUT_LENGTH[1], args.seconds))
+    print_table(["device", "mode", "lost rms", "p95", "max", "settled rms", "snap mean",
+                 "snap max"], rows)
+    if failed:
+        print("")
+        print("FAILED: " + ", ".join(failed))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Head position fusion (the "fusion" of a profile's head) against PS Eye
+# only head tracking.
+#
+# Records a synthetic session with a known head trajectory: the HMD
+# reports its position at 72 Hz without latency but with a slow drift of a
+# few centimeters, the head PS Move arrives at 60 Hz, 30 ms late and with
+# 1.5 mm noise. The session is replayed through
+# Go_Dual_PSMove_Plus_Head_6DOF.py at 120 Hz without fusion (PS Eye only)
+# and with it at several time constants, and alvr.head_position is
+# compared with the true head position of every tick:
+#   error     rms / p95 / max distance to the true position now
+#   latency   the delay L that minimizes the rms distance to the true
+#             position L seconds ago
+#   updates   ticks per second with a new head position
+# Exits with status 1 unless the fused head is more accurate and has a
+# lower latency than PS Eye only tracking.
+#
+#   python -m benchmarks.eval_fusion [--seconds 30]
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+from alvr_freepie.session import SessionReader, SessionRecorder, replay_stream
+from alvr_freepie.sim import Runtime
+from benchmarks._bench import print_table, profile_variant
+
+SCRIPT = "Go_Dual_PSMove_Plus_Head_6DOF.py"
+PROFILE = "profiles/dual_psmove_head.json"
+TICK_RATE = 120.0
+HMD_RATE = 72.0
+IO_RATE = 60.0
+OPTICAL_LATENCY = 0.03
+OPTICAL_NOISE = 0.0015
+HMD_NOISE = 0.0003
+# head PS Move offset of the uncalibrated dual profile
+HEAD_OFFSET = (0.0, 0.1, -0.1)
+TIME_CONSTANTS = (0.05, 0.1, 0.3)
+LAGS_MS = range(0, 101)
+
+
+def truth(t):
+    return (0.3 * math.sin(0.9 * t) + 0.05 * math.sin(3.1 * t),
+            1.6 + 0.03 * math.sin(2.3 * t),
+            -0.5 + 0.3 * math.cos(0.7 * t) + 0.04 * math.sin(4.3 * t))
+
+def drift(t):
+    return (0.03 * math.sin(0.13 * t), 0.02 * math.sin(0.07 * t + 1.0),
+            0.03 * math.cos(0.11 * t) - 0.03)
+
+def session_stream(seed=5):
+    rnd = random.Random(seed)
+
+    def stream(runtime, tick):
+        t = tick / TICK_RATE
+        runtime.now = t
+        th = int(t * HMD_RATE) / HMD_RATE
+        if tick == 0 or int(t * HMD_RATE) != int((tick - 1) / TICK_RATE * HMD_RATE):
+            p = truth(th)
+            d = drift(th)
+            runtime.alvr.input_head_position.load(
+                [p[i] + d[i] + rnd.gauss(0.0, HMD_NOISE) for i in range(3)])
+        sample = int(t * IO_RATE)
+        if tick > 0 and sample == int((tick - 1) / TICK_RATE * IO_RATE):
+            return False
+        # raw PS Eye centimeters of the head PS Move, OPTICAL_LATENCY late
+        p = truth(t - OPTICAL_LATENCY)
+        head = runtime.freepie_io[2]
+        head.x = (p[0] + rnd.gauss(0.0, OPTICAL_NOISE) - HEAD_OFFSET[0]) * 100.0
+        head.y = (p[1] + rnd.gauss(0.0, OPTICAL_NOISE) - HEAD_OFFSET[1]) * 100.0
+        head.z = (p[2] + rnd.gauss(0.0, OPTICAL_NOISE) - HEAD_OFFSET[2]) * 100.0
+        return True
+
+    return stream
+
+def record(path, ticks):
+    recorder = SessionRecorder(path)
+    runtime = Runtime(SCRIPT, session_stream(), record=False, recorder=recorder)
+    for _ in range(ticks + 1):
+        runtime.tick()
+    recorder.close()
+
+# [(t, head position)] of every tick of a replay with profile
+def replay(path, profile):
+    reader = SessionReader(path)
+    runtime = Runtime(SCRIPT, replay_stream(reader), record=False,
+                      settings={"PROFILE": repr(profile)})
+    output = []
+    for _ in range(len(reader)):
+        runtime.tick()
+        output.append((runtime.now, tuple(runtime.alvr.head_position)))
+    reader.close()
+    return output
+
+def distances(output, lag, skip):
+    result = []
+    for t, p in output[skip:]:
+        q = truth(t - lag)
+        result.append(math.sqrt(sum((p[i] - q[i]) ** 2 for i in range(3))))
+    return result
+
+def rms(values):
+    return math.sqrt(sum(v * v for v in values) / len(values))
+
+def evaluate(output):
+    # skip the first second (filter start up)
+    skip = int(TICK_RATE)
+    errors = sorted(distances(output, 0.0, skip))
+    latency = min(LAGS_MS, key=lambda ms: rms(distances(output, ms / 1000.0, skip)))
+    updates = sum(1 for a, b in zip(output, output[1:]) if a[1] != b[1])
+    seconds = output[-1][0] - output[0][0]
+    return (rms(errors) * 1000.0, errors[int(0.95 * len(errors))] * 1000.0,
+            errors[-1] * 1000.0, float(latency), updates / seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=30.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "fusion.afps")
+    record(path, int(args.seconds * TICK_RATE))
+
+    rows = [("PS Eye only",) + evaluate(replay(path, PROFILE))]
+    for time_constant in TIME_CONSTANTS:
+        def fuse(profile):
+            profile["head"]["fusion"] = {"time_constant": time_constant,
+                                         "latency": OPTICAL_LATENCY}
+        profile = profile_variant(PROFILE, directory, "fusion.json", fuse)
+        rows.append(("fusion tau %.2f s" % time_constant,) + evaluate(replay(path, profile)))
+        os.remove(profile)
+    os.remove(path)
+    os.rmdir(directory)
+    print_table(["head position", "rms mm", "p95 mm", "max mm", "latency ms", "updates/s"],
+                rows)
+
+    optical = rows[0]
+    fused = rows[1 + TIME_CONSTANTS.index(0.1)]
+    if not (fused[1] < optical[1] and fused[4] < optical[4]):
+        print("FAILED: fusion (tau 0.1 s) is not more accurate / faster than PS Eye only")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
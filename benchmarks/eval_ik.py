@@ -0,0 +1,277 @@
+# Two-bone arm model (alvr_freepie.ik) against the fixed-offset arm model
+# (calc_arm_model_into).
+#
+# Checks (exit status 1 if one fails):
+# - calc_arm_ik_into with ArmGeometry(**LEGACY_GEOMETRY) reproduces
+#   calc_arm_model_into (1e-9 m)
+# - arm_ik_rows / two_bone_rows match calc_arm_ik_into /
+#   solve_two_bone_into, elbows included (1e-9 m)
+# - bone lengths are kept, the elbow never folds below min_elbow, reachable
+#   tracked hands are hit exactly
+#
+# Accuracy on simulated bodies: every pose has its own limb lengths,
+# shoulder width and neck, a torso turned up to 25 degrees away from the
+# head, a nodding and tilting head, an upper arm swung forward by the arm
+# roll (reduced by an inward wrist roll as both models assume) and spread
+# up to 20 degrees sideways, and a controller pointing anywhere that leaves
+# the elbow open by 30 degrees or more. Both models get the head pose, the
+# controller orientation and the true swing as the upper arm roll; the
+# fixed model's elbow is where it puts the shoulder end of its forearm.
+# The tracked hand row gives reach_into the true hand: its shoulders
+# follow the head, not the torso, so some hands end up out of reach.
+# Fails unless the two-bone model with the default ArmGeometry has lower
+# rms hand and elbow errors than the fixed model.
+#
+#   python -m benchmarks.eval_ik [--poses 20000]
+
+import argparse
+import math
+import random
+import sys
+
+from alvr_freepie.armmodel import PoseContext, calc_arm_model_into, numpy
+from alvr_freepie.ik import (ArmGeometry, ArmIKContext, LEGACY_GEOMETRY, calc_arm_ik_into,
+    solve_two_bone_into, arm_ik_rows, two_bone_rows)
+from alvr_freepie.quatmath import (euler2quaternion_into, new_quat, new_vec, q_rotatevec_into,
+    rotatevec_into)
+from benchmarks._bench import print_table
+
+TOLERANCE = 1e-9
+MIN_ELBOW = math.radians(30.0)
+
+
+def distance(a, b):
+    return math.sqrt((a[0] - b[0])**2 + (a[1] - b[1])**2 + (a[2] - b[2])**2)
+
+def random_pose(rnd):
+    head = [rnd.uniform(-0.6, 0.6), rnd.uniform(-math.pi, math.pi), rnd.uniform(-0.3, 0.3)]
+    position = [rnd.uniform(-1.0, 1.0), rnd.uniform(1.2, 1.8), rnd.uniform(-1.0, 1.0)]
+    controller = [rnd.uniform(-math.pi, math.pi), rnd.uniform(-math.pi, math.pi),
+                  rnd.uniform(-math.pi, math.pi)]
+    return head, position, controller, rnd.choice((1, -1)), rnd.uniform(0.0, 0.5 * math.pi)
+
+def check(failed, name, error, tolerance=TOLERANCE):
+    ok = error <= tolerance
+    print("%s %s (max error %.2e)" % ("ok    " if ok else "FAILED", name, error))
+    if not ok:
+        failed.append(name)
+
+# calc_arm_ik_into with the legacy geometry against calc_arm_model_into
+def legacy_error(rnd, count):
+    legacy = PoseContext(1)
+    ik = ArmIKContext(1, ArmGeometry(**LEGACY_GEOMETRY))
+    a = [0.0, 0.0, 0.0]
+    b = [0.0, 0.0, 0.0]
+    worst = 0.0
+    for _ in range(count):
+        head, position, controller, side, arm_roll = random_pose(rnd)
+        legacy.begin_frame(head, position)
+        ik.begin_frame(head, position)
+        calc_arm_model_into(legacy, controller, side, arm_roll, a, 0)
+        calc_arm_ik_into(ik, controller, side, arm_roll, b, 0)
+        worst = max(worst, distance(a, b))
+    return worst
+
+# bone lengths and elbow angle of calc_arm_ik_into, and its rows against
+# the scalar function; returns (invariant error, angle error, rows error)
+def ik_errors(rnd, count):
+    g = ArmGeometry()
+    ctx = ArmIKContext(1, g)
+    limit = math.cos(g.min_elbow)
+    out = [0.0, 0.0, 0.0]
+    rows = [[], [], [], [], []]
+    expected = []
+    lengths = 0.0
+    angles = 0.0
+    for _ in range(count):
+        head, position, controller, side, arm_roll = random_pose(rnd)
+        ctx.begin_frame(head, position)
+        calc_arm_ik_into(ctx, controller, side, arm_roll, out, 0)
+        elbow = ctx.elbows[0]
+        shoulder = ctx.shoulders[0 if side > 0 else 1]
+        lengths = max(lengths, abs(distance(shoulder, elbow) - g.upper),
+                      abs(distance(elbow, out) - g.fore))
+        a = [(elbow[i] - shoulder[i]) / g.upper for i in range(3)]
+        d = [(out[i] - elbow[i]) / g.fore for i in range(3)]
+        angles = max(angles, -(a[0]*d[0] + a[1]*d[1] + a[2]*d[2]) - limit)
+        for column, value in zip(rows, (head, position, controller, side, arm_roll)):
+            column.append(value)
+        expected.append((list(out), list(elbow)))
+    if numpy is None:
+        return lengths, angles, None
+    n = len(expected)
+    positions = numpy.empty((n, 3))
+    elbows = numpy.empty((n, 3))
+    arm_ik_rows(g, numpy.array(rows[0]), numpy.array(rows[1]), numpy.array(rows[2]),
+                numpy.array(rows[3], dtype=float), numpy.array(rows[4]), positions, elbows)
+    rows_error = 0.0
+    for i, (out, elbow) in enumerate(expected):
+        rows_error = max(rows_error, distance(out, positions[i]), distance(elbow, elbows[i]))
+    return lengths, angles, rows_error
+
+# solve_two_bone_into on random targets: (invariant error, reach error,
+# rows error)
+def two_bone_errors(rnd, count):
+    g = ArmGeometry()
+    near = g.near()
+    elbow = [0.0, 0.0, 0.0]
+    hand = [0.0, 0.0, 0.0]
+    pole = g.pole
+    shoulders = []
+    targets = []
+    expected = []
+    lengths = 0.0
+    reach = 0.0
+    for _ in range(count):
+        shoulder = [rnd.uniform(-1.0, 1.0) for _ in range(3)]
+        target = [s + rnd.uniform(-0.8, 0.8) for s in shoulder]
+        solve_two_bone_into(shoulder, target, pole, g.upper, g.fore, g.min_elbow, elbow, hand)
+        lengths = max(lengths, abs(distance(shoulder, elbow) - g.upper),
+                      abs(distance(elbow, hand) - g.fore))
+        d = distance(shoulder, target)
+        if near < d < g.upper + g.fore:
+            reach = max(reach, distance(hand, target))
+        shoulders.append(shoulder)
+        targets.append(target)
+        expected.append((list(elbow), list(hand)))
+    if numpy is None:
+        return lengths, reach, None
+    elbows = numpy.empty((count, 3))
+    hands = numpy.empty((count, 3))
+    two_bone_rows(numpy.array(shoulders), numpy.array(targets), numpy.array(pole), g.upper,
+                  g.fore, g.min_elbow, elbows, hands)
+    rows_error = 0.0
+    for i, (elbow, hand) in enumerate(expected):
+        rows_error = max(rows_error, distance(elbow, elbows[i]), distance(hand, hands[i]))
+    return lengths, reach, rows_error
+
+
+# simulated bodies and arm poses; pose() returns the body's ArmGeometry,
+# the model inputs, the true elbow and hand and the forearm direction
+class Body(object):
+
+    def __init__(self, rnd):
+        self.rnd = rnd
+        self.q = new_quat()
+        self.v = new_vec()
+        self.a = new_vec()
+        self.d = new_vec()
+
+    def pose(self):
+        rnd = self.rnd
+        upper = rnd.uniform(0.27, 0.34)
+        fore = rnd.uniform(0.29, 0.36)
+        shoulder_offset = (rnd.uniform(0.16, 0.21), rnd.uniform(-0.14, -0.10),
+                           rnd.uniform(-0.02, 0.02))
+        neck_offset = (0.0, rnd.uniform(-0.12, -0.08), rnd.uniform(0.06, 0.10))
+        geometry = ArmGeometry(neck_offset, shoulder_offset, upper, fore)
+        heading = rnd.uniform(-math.pi, math.pi)
+        torso = heading + math.radians(rnd.uniform(-25.0, 25.0))
+        head = [rnd.uniform(-0.5, 0.5), heading, rnd.uniform(-0.2, 0.2)]
+        side = rnd.choice((1, -1))
+        neck = [rnd.uniform(-1.0, 1.0), rnd.uniform(1.3, 1.6), rnd.uniform(-1.0, 1.0)]
+        q = self.q
+        v = self.v
+        # eyes in front of and above the neck pivot
+        euler2quaternion_into(head, q)
+        v[0] = -neck_offset[0]; v[1] = -neck_offset[1]; v[2] = -neck_offset[2]
+        q_rotatevec_into(q, v, v)
+        position = [neck[0] + v[0], neck[1] + v[1], neck[2] + v[2]]
+        euler2quaternion_into([0.0, torso, 0.0], q)
+        v[0] = shoulder_offset[0] * side; v[1] = shoulder_offset[1]; v[2] = shoulder_offset[2]
+        q_rotatevec_into(q, v, v)
+        shoulder = [neck[0] + v[0], neck[1] + v[1], neck[2] + v[2]]
+        while True:
+            controller = [rnd.uniform(-1.2, 1.2), torso + rnd.uniform(-1.2, 1.2),
+                          rnd.uniform(-1.5, 1.5)]
+            arm_roll = rnd.uniform(0.0, 0.5 * math.pi)
+            roll = _normalized_roll(controller)
+            swing = max(arm_roll + min(roll, 0.0), 0.0)
+            spread = math.radians(rnd.uniform(0.0, 20.0)) * side
+            a = self.a
+            a[0] = math.sin(spread) * math.cos(swing)
+            a[1] = -math.cos(spread) * math.cos(swing)
+            a[2] = -math.sin(swing)
+            q_rotatevec_into(q, a, a)
+            d = self.d
+            d[0] = 0.0; d[1] = 0.0; d[2] = -1.0
+            rotatevec_into(controller, d, d)
+            if -(a[0]*d[0] + a[1]*d[1] + a[2]*d[2]) <= math.cos(MIN_ELBOW):
+                break
+        elbow = [shoulder[i] + upper * a[i] for i in range(3)]
+        hand = [elbow[i] + fore * d[i] for i in range(3)]
+        return geometry, head, position, controller, side, arm_roll, elbow, hand, d
+
+_roll_ctx = PoseContext(1)
+
+def _normalized_roll(controller):
+    return _roll_ctx.normalized_roll(controller, 0)
+
+def stats(errors):
+    errors.sort()
+    n = len(errors)
+    return (100.0 * math.sqrt(sum(e * e for e in errors) / n),
+            100.0 * errors[min(n - 1, int(0.95 * n))], 100.0 * errors[-1])
+
+def accuracy(rnd, count):
+    body = Body(rnd)
+    legacy = PoseContext(1)
+    default = ArmIKContext(1, ArmGeometry())
+    names = ("fixed offsets (calc_arm_model_into)", "two-bone, default ArmGeometry",
+             "two-bone, measured ArmGeometry", "two-bone, tracked hand (reach_into)")
+    hand_errors = [[] for _ in names]
+    elbow_errors = [[] for _ in names]
+    out = [0.0, 0.0, 0.0]
+    for _ in range(count):
+        geometry, head, position, controller, side, arm_roll, elbow, hand, d = body.pose()
+        measured = ArmIKContext(1, geometry)
+        legacy.begin_frame(head, position)
+        calc_arm_model_into(legacy, controller, side, arm_roll, out, 0)
+        forearm = 0.25 + 0.25 * math.sin(arm_roll)
+        hand_errors[0].append(distance(out, hand))
+        elbow_errors[0].append(distance([out[i] - forearm * d[i] for i in range(3)], elbow))
+        for k, ctx in ((1, default), (2, measured)):
+            ctx.begin_frame(head, position)
+            calc_arm_ik_into(ctx, controller, side, arm_roll, out, 0)
+            hand_errors[k].append(distance(out, hand))
+            elbow_errors[k].append(distance(ctx.elbows[0], elbow))
+        measured.reach_into(hand, side, 0, out)
+        hand_errors[3].append(distance(out, hand))
+        elbow_errors[3].append(distance(measured.elbows[0], elbow))
+    rows = []
+    for name, hands, elbows in zip(names, hand_errors, elbow_errors):
+        rows.append((name,) + stats(hands) + stats(elbows))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--poses", type=int, default=20000)
+    args = parser.parse_args()
+    rnd = random.Random(21)
+    failed = []
+    check(failed, "legacy geometry == calc_arm_model_into", legacy_error(rnd, args.poses))
+    lengths, angles, rows_error = ik_errors(rnd, args.poses)
+    check(failed, "calc_arm_ik_into bone lengths", lengths)
+    check(failed, "calc_arm_ik_into elbow >= min_elbow", angles)
+    if rows_error is not None:
+        check(failed, "arm_ik_rows == calc_arm_ik_into", rows_error)
+    lengths, reach, rows_error = two_bone_errors(rnd, args.poses)
+    check(failed, "solve_two_bone_into bone lengths", lengths)
+    check(failed, "solve_two_bone_into reaches reachable targets", reach)
+    if rows_error is not None:
+        check(failed, "two_bone_rows == solve_two_bone_into", rows_error)
+    print("")
+    rows = accuracy(rnd, args.poses)
+    print("%d simulated poses, errors in cm" % args.poses)
+    print_table(["model", "hand rms", "p95", "max", "elbow rms", "p95", "max"], rows)
+    fixed, default = rows[0], rows[1]
+    if default[1] >= fixed[1] or default[4] >= fixed[4]:
+        failed.append("accuracy")
+        print("")
+        print("FAILED: the two-bone model is not more accurate than the fixed offsets")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
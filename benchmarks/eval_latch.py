@@ -0,0 +1,189 @@
+# Late latching (LATE_LATCH) against the free-running script loop, on a
+# simulated clock.
+#
+# The headset sends a frame at 72 Hz with 0.3 ms jitter: the ALVR head
+# input changes and ALVR takes the poses published so far. The PS Moves
+# write a sample to the tracker transport at 60 Hz (10% jitter), stamped
+# with the time of the motion. FreePIE starts the next script tick a loop period (10%
+# jitter) after the last one returned; sleeping advances the simulated
+# clock, with up to 0.5 ms overshoot, and delivers the frames and samples
+# due meanwhile. The script's own run time is not simulated.
+#
+# For every frame after the first WARMUP seconds:
+#   motion age   frame time - stamp of the PS Move sample in the poses
+#                ALVR takes (motion to publish latency)
+#   publish age  frame time - time these poses were published
+#   late         waits that overslept the frame, % of frames
+# Exits with status 1 if late latching raises the mean or p99 motion age at
+# any loop rate, does not lower both where the loop is faster than the
+# frames, or oversleeps 2% of the frames or more.
+#
+#   python -m benchmarks.eval_latch [--seconds 20] [--script go_single_psmove.py]
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+from alvr_freepie import clock
+from alvr_freepie.sim import Runtime
+from alvr_freepie.transport import TrackerWriter, TIMESTAMP, FLAG_CONNECTED, FLAG_TRACKED
+from benchmarks._bench import print_table
+
+FRAME_RATE = 72.0
+FRAME_JITTER = 0.0003
+SAMPLE_RATE = 60.0
+# of a sample period
+SAMPLE_JITTER = 0.1
+LOOP_RATES = (60.0, 120.0, 250.0)
+LOOP_JITTER = 0.1
+SLEEP_OVERSHOOT = 0.0005
+DEVICES = 3
+WARMUP = 2.0
+MAX_LATE = 2.0
+
+
+# the simulated headset, PS Moves and FreePIE loop of one run
+class World(object):
+
+    def __init__(self, runtime, writer, seconds, loop_rate, seed):
+        rnd = random.Random(seed)
+        self.runtime = runtime
+        self.writer = writer
+        self.rnd = rnd
+        self.loop_period = 1.0 / loop_rate
+        self.frames = [k / FRAME_RATE + rnd.gauss(0.0, FRAME_JITTER)
+                       for k in range(1, int(seconds * FRAME_RATE))]
+        self.samples = [(k + rnd.uniform(0.0, SAMPLE_JITTER)) / SAMPLE_RATE
+                        for k in range(int(seconds * SAMPLE_RATE))]
+        self.frame_index = 0
+        self.sample_index = 0
+        self.start = 0.0
+
+    # move the clock to t, delivering the frames and samples due
+    def advance(self, t):
+        self.runtime.now = t
+        frames = self.frames
+        while self.frame_index < len(frames) and frames[self.frame_index] <= t:
+            f = frames[self.frame_index]
+            self.runtime.alvr.input_head_orientation.load(
+                [0.4 * math.sin(0.5 * f), 0.3 * math.sin(0.7 * f), 0.1 * math.sin(0.3 * f)])
+            self.frame_index += 1
+        samples = self.samples
+        while self.sample_index < len(samples) and samples[self.sample_index] <= t:
+            s = samples[self.sample_index]
+            for device in range(DEVICES):
+                p = 0.37 * (device + 1)
+                self.writer.write(device, s, 20.0 * math.sin(0.8 * s + p), 120.0, -30.0,
+                                  1.2 * math.sin(0.6 * s + p), 0.8 * math.sin(0.9 * s + p),
+                                  0.6 * math.sin(1.1 * s + p), 0.0, 0,
+                                  FLAG_CONNECTED | FLAG_TRACKED)
+            self.sample_index += 1
+
+    def sleep(self, seconds):
+        self.advance(self.runtime.now + seconds + self.rnd.uniform(0.0, SLEEP_OVERSHOOT))
+
+    # Runtime stream: the tick starts a loop period after the last one ended
+    def stream(self, runtime, tick):
+        gap = self.loop_period * (1.0 + self.rnd.uniform(-LOOP_JITTER, LOOP_JITTER))
+        self.advance(runtime.now + gap if tick else 0.0)
+        return False
+
+# the script's g_transport, noting the time of every poll: the script
+# publishes right after it (its run time is not simulated)
+class TimedReader(object):
+
+    def __init__(self, reader, runtime):
+        self.reader = reader
+        self.runtime = runtime
+        self.polled = 0.0
+        self.samples = reader.samples
+
+    def poll(self):
+        self.polled = self.runtime.now
+        return self.reader.poll()
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+# run script for seconds; returns (motion ages, publish ages, late waits)
+def run(script, directory, loop_rate, latch, seconds, seed):
+    path = os.path.join(directory, "latch.trk")
+    writer = TrackerWriter(path, DEVICES)
+    settings = {"TRACKER_TRANSPORT": repr(path), "LATE_LATCH": repr(latch)}
+    if script == "go_profile.py":
+        settings["PROFILE"] = repr("profiles/single_psmove.json")
+    runtime = Runtime(script, None, record=False, settings=settings)
+    world = World(runtime, writer, seconds, loop_rate, seed)
+    runtime.stream = world.stream
+    runtime.tick()
+    reader = runtime.globals["g_transport"]
+    timed = TimedReader(reader, runtime)
+    runtime.globals["g_transport"] = timed
+    clock.set_sleep(world.sleep)
+    # (publish time, sample stamp) of every tick
+    published = []
+    try:
+        while world.frame_index < len(world.frames):
+            runtime.tick()
+            published.append((timed.polled, reader.samples[0][TIMESTAMP]))
+    finally:
+        clock.set_sleep(None)
+        reader.close()
+        writer.close()
+        os.remove(path)
+    motion = []
+    publish = []
+    i = 0
+    for f in world.frames:
+        while i + 1 < len(published) and published[i + 1][0] <= f:
+            i += 1
+        if f < WARMUP or published[i][0] > f:
+            continue
+        motion.append(f - published[i][1])
+        publish.append(f - published[i][0])
+    latch = runtime.globals["g_latch"]
+    return motion, publish, latch.late if latch else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--script", default="go_single_psmove.py")
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    rows = []
+    failed = []
+    for loop_rate in LOOP_RATES:
+        results = {}
+        for latch in (False, True):
+            motion, publish, late = run(args.script, directory, loop_rate, latch,
+                                        args.seconds, int(loop_rate))
+            motion.sort()
+            mean = sum(motion) / len(motion)
+            p99 = percentile(motion, 99)
+            late_share = 100.0 * late / len(motion)
+            results[latch] = (mean, p99, late_share)
+            rows.append(("%.0f Hz" % loop_rate, "late latch" if latch else "free-running",
+                         1e3 * mean, 1e3 * percentile(motion, 50), 1e3 * p99, 1e3 * motion[-1],
+                         1e3 * sum(publish) / len(publish), late_share))
+        free, latched = results[False], results[True]
+        if loop_rate > FRAME_RATE:
+            worse = latched[0] >= free[0] or latched[1] >= free[1]
+        else:
+            worse = latched[0] > free[0] or latched[1] > free[1]
+        if worse or latched[2] >= MAX_LATE:
+            failed.append("%.0f Hz loop" % loop_rate)
+    os.rmdir(directory)
+    print("%s, %.0f Hz frames, %.0f Hz PS Move samples, motion age in ms" % (
+        args.script, FRAME_RATE, SAMPLE_RATE))
+    print_table(["loop", "mode", "mean", "p50", "p99", "max", "publish age", "late %"], rows)
+    if failed:
+        print("")
+        print("FAILED: late latching is not better at " + ", ".join(failed))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# Fly mode distance against the script tick rate.
+#
+# Replays the same trackpad input (full forward, then half backward, then
+# released) at different tick rates, with regular and with jittered tick
+# timing, and checks that the distance travelled is the same:
+#   - Locomotion alone, integrating over dt and in fixed steps
+#   - go_single_psmove.py in the headless runtime, with its profile and
+#     with a fixed step "fly" setting, fly mode selected with the PS Move
+#     select / move buttons
+# Exits with status 1 if a distance is off by more than the input timing
+# allows: exact tick times must match to 1e-6 m; jittered ticks sample the
+# input changes up to one tick late, which moves the result by at most
+# max_speed * longest tick per change. The forward distance of the old fixed
+# 0.002 per tick step is shown for comparison.
+#
+#   python -m benchmarks.eval_locomotion
+
+import math
+import os
+import random
+import sys
+import tempfile
+
+from alvr_freepie.buttons import PSM_SELECT, PSM_MOVE
+from alvr_freepie.locomotion import Locomotion
+from alvr_freepie.sim import Runtime, INPUT_BUTTON_NAMES
+from benchmarks._bench import print_table, profile_variant
+
+SCRIPT = "go_single_psmove.py"
+PROFILE = "profiles/single_psmove.json"
+TICK_RATES = (30.0, 60.0, 90.0, 120.0, 250.0, 1000.0)
+SCRIPT_RATES = (60.0, 90.0, 120.0, 250.0)
+FIXED_STEP = 1.0 / 240.0
+JITTER = 0.6
+# (until, trackpad y); fly mode is enabled at ENABLE in the scripts
+INPUT = ((2.0, 1.0), (3.0, -0.6), (6.0, 0.0))
+ENABLE = 0.2
+IO_RATE = 60.0
+EXACT = 1e-6
+
+
+def trackpad(t):
+    for until, axis in INPUT:
+        if t < until:
+            return axis
+    return 0.0
+
+# tick times 0..end at rate, jittered by +-jitter/2 of a period
+def tick_times(rate, end, jitter, seed=2):
+    rnd = random.Random(seed)
+    times = []
+    tick = 0
+    while True:
+        t = tick / rate
+        if jitter and tick > 0:
+            t += (rnd.random() - 0.5) * jitter / rate
+        if t > end:
+            return times
+        times.append(t)
+        tick += 1
+
+def longest_tick(times):
+    return max(b - a for a, b in zip(times, times[1:]))
+
+def locomotion_distance(times, fixed_step):
+    fly = Locomotion(fixed_step=fixed_step)
+    offset = [0.0, 0.0, 0.0]
+    direction = (0.0, 0.0, -1.0)
+    for t in times:
+        fly.update(t, trackpad(t), direction, offset)
+    return -offset[2]
+
+# fly mode input for the scripts: select once (-> Fly Mode), then hold move
+def fly_stream(times):
+    touch = INPUT_BUTTON_NAMES.index("trackpad_touch")
+    buttons = [False] * len(INPUT_BUTTON_NAMES)
+
+    def stream(runtime, tick):
+        t = times[tick]
+        runtime.now = t
+        alvr = runtime.alvr
+        alvr.input_head_position.load([0.0, 1.6, 0.0])
+        axis = trackpad(t) if t >= ENABLE else 0.0
+        buttons[touch] = axis != 0.0
+        alvr.input_buttons.load(buttons)
+        alvr.input_trackpad.load([0.0, axis])
+        sample = int(t * IO_RATE)
+        if tick > 0 and sample == int(times[tick - 1] * IO_RATE):
+            return False
+        if t < ENABLE / 2:
+            mask = PSM_SELECT
+        elif t < ENABLE:
+            mask = 0
+        else:
+            mask = PSM_MOVE
+        runtime.freepie_io[3].x = float(mask)
+        return True
+
+    return stream
+
+def script_distance(profile, times):
+    runtime = Runtime(SCRIPT, fly_stream(times), record=False,
+                      settings={"PROFILE": repr(profile)})
+    for _ in times:
+        runtime.tick()
+    alvr = runtime.alvr
+    return math.sqrt(sum((alvr.head_position[i] - alvr.input_head_position[i]) ** 2
+                         for i in range(3)))
+
+
+def main():
+    failed = []
+    rows = []
+    end = INPUT[-1][0]
+
+    def check(name, distance, reference, tolerance):
+        error = abs(distance - reference)
+        if error > tolerance:
+            failed.append("%s: %.6f m, expected %.6f +- %.6f" % (name, distance, reference,
+                                                                 tolerance))
+        return error * 1000.0
+
+    for label, fixed_step in (("dt", 0.0), ("fixed step", FIXED_STEP)):
+        reference = locomotion_distance(tick_times(1000.0, end, 0.0), fixed_step)
+        for rate in TICK_RATES:
+            times = tick_times(rate, end, 0.0)
+            distance = locomotion_distance(times, fixed_step)
+            # a fixed step grid does not line up with every tick rate
+            tolerance = EXACT if not fixed_step else 2 * len(INPUT) * FIXED_STEP
+            error = check("Locomotion %s @ %.0f Hz" % (label, rate), distance, reference,
+                          tolerance)
+            jittered = tick_times(rate, end, JITTER)
+            jitter_distance = locomotion_distance(jittered, fixed_step)
+            jitter_error = check("Locomotion %s @ %.0f Hz jittered" % (label, rate),
+                                 jitter_distance, reference,
+                                 len(INPUT) * longest_tick(jittered) + tolerance)
+            rows.append(("Locomotion %s @ %.0f Hz" % (label, rate), distance * 1000.0,
+                         error, jitter_distance * 1000.0, jitter_error,
+                         2.0 * sum(1 for t in times if trackpad(t) > 0.5)))
+
+    def fixed(profile):
+        profile["modes"].setdefault("fly", {})["fixed_step"] = FIXED_STEP
+    directory = tempfile.mkdtemp()
+    profiles = (("", PROFILE),
+                (" fixed step", profile_variant(PROFILE, directory, "fixed_step.json", fixed)))
+    for label, profile in profiles:
+        reference = script_distance(profile, tick_times(SCRIPT_RATES[0], end, 0.0))
+        tolerance = EXACT if not label else 2 * len(INPUT) * FIXED_STEP
+        for rate in SCRIPT_RATES:
+            name = "%s%s @ %.0f Hz" % (SCRIPT, label, rate)
+            times = tick_times(rate, end, 0.0)
+            distance = script_distance(profile, times)
+            error = check(name, distance, reference, tolerance)
+            jittered = tick_times(rate, end, JITTER)
+            jitter_distance = script_distance(profile, jittered)
+            jitter_error = check(name + " jittered", jitter_distance, reference,
+                                 len(INPUT) * longest_tick(jittered) + tolerance)
+            rows.append((name, distance * 1000.0, error,
+                         jitter_distance * 1000.0, jitter_error,
+                         2.0 * sum(1 for t in times if ENABLE <= t and trackpad(t) > 0.5)))
+
+    os.remove(profiles[1][1])
+    os.rmdir(directory)
+
+    print_table(["run", "distance mm", "error mm", "jittered mm", "error mm",
+                 "old 2 mm/tick forward"], rows)
+    if failed:
+        print("")
+        for line in failed:
+            print("FAILED: " + line)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Offline evaluation of PosePredictor: prediction error against lead time.
+#
+# For every tracker sample of a trace the predictor sees the samples so far
+# and predicts the pose lead seconds later; the reference is the trace
+# linearly interpolated at that time. Without --session a synthetic 60 Hz
+# hand trace with 1 mm / 0.2 deg jitter is used.
+#
+#   python -m benchmarks.eval_prediction [--session file.afps --device 0]
+
+import argparse
+import bisect
+import math
+import random
+
+from alvr_freepie.predict import PosePredictor, MODEL_VELOCITY, MODEL_ACCELERATION
+from alvr_freepie.quatmath import psm_euler2euler
+from alvr_freepie.session import SessionReader, FLAG_UPDATE
+from benchmarks._bench import print_table
+
+LEADS_MS = (0, 10, 20, 30, 50, 80)
+
+
+# [(t, [x, y, z, yaw, pitch, roll])] of one freePieIO device of a session
+def session_trace(path, device):
+    trace = []
+    reader = SessionReader(path)
+    for record in reader:
+        if not record[2] & FLAG_UPDATE:
+            continue
+        base = 3 + device * 6
+        x, y, z, yaw, pitch, roll = record[base:base + 6]
+        trace.append((record[0], [x / 100, y / 100, z / 100] +
+                      psm_euler2euler([yaw, pitch, roll])))
+    reader.close()
+    return trace
+
+def synthetic_trace(seconds=60.0, rate=60.0, seed=1):
+    rnd = random.Random(seed)
+    trace = []
+    for i in range(int(seconds * rate)):
+        t = i / rate
+        pose = [0.25 * math.sin(1.3 * t) + 0.05 * math.sin(4.1 * t),
+                1.2 + 0.15 * math.sin(0.9 * t + 1.0),
+                -0.3 + 0.2 * math.cos(1.7 * t),
+                1.0 * math.sin(0.8 * t), 0.6 * math.sin(1.9 * t), 0.5 * math.sin(1.1 * t)]
+        for k in range(3):
+            pose[k] += rnd.gauss(0.0, 0.001)
+        for k in range(3, 6):
+            pose[k] += rnd.gauss(0.0, math.radians(0.2))
+        trace.append((t, pose))
+    return trace
+
+def interpolate(trace, times, t):
+    i = bisect.bisect_left(times, t)
+    if i == 0 or i >= len(trace):
+        return None
+    t0, p0 = trace[i - 1]
+    t1, p1 = trace[i]
+    f = (t - t0) / (t1 - t0)
+    out = []
+    for k in range(6):
+        d = p1[k] - p0[k]
+        if k > 2:
+            d = math.atan2(math.sin(d), math.cos(d))
+        out.append(p0[k] + f * d)
+    return out
+
+def evaluate(trace, lead, model, history):
+    times = [t for t, _ in trace]
+    predictor = PosePredictor(lead, model, history)
+    out = [0.0] * 6
+    pos_sq = ang_sq = 0.0
+    count = 0
+    for t, pose in trace:
+        predictor.add_sample(t, *pose)
+        expected = interpolate(trace, times, t + lead)
+        if expected is None:
+            continue
+        predictor.predict_into(t, out)
+        pos_sq += sum((out[k] - expected[k]) ** 2 for k in range(3))
+        for k in range(3, 6):
+            d = out[k] - expected[k]
+            ang_sq += math.atan2(math.sin(d), math.cos(d)) ** 2
+        count += 1
+    return 1000.0 * math.sqrt(pos_sq / count), math.degrees(math.sqrt(ang_sq / count))
+
+# error of holding the last sample (what the scripts do without prediction)
+def evaluate_hold(trace, lead):
+    times = [t for t, _ in trace]
+    pos_sq = ang_sq = 0.0
+    count = 0
+    for t, pose in trace:
+        expected = interpolate(trace, times, t + lead)
+        if expected is None:
+            continue
+        pos_sq += sum((pose[k] - expected[k]) ** 2 for k in range(3))
+        for k in range(3, 6):
+            d = pose[k] - expected[k]
+            ang_sq += math.atan2(math.sin(d), math.cos(d)) ** 2
+        count += 1
+    return 1000.0 * math.sqrt(pos_sq / count), math.degrees(math.sqrt(ang_sq / count))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--session", help="recorded session (alvr_freepie.session)")
+    parser.add_argument("--device", type=int, default=0, help="freePieIO index")
+    args = parser.parse_args()
+    trace = session_trace(args.session, args.device) if args.session else synthetic_trace()
+
+    rows = []
+    for lead_ms in LEADS_MS:
+        row = ["%d ms" % lead_ms]
+        for model, history in ((MODEL_VELOCITY, 2), (MODEL_VELOCITY, 4),
+                               (MODEL_ACCELERATION, 5)):
+            pos, ang = evaluate(trace, lead_ms / 1000.0, model, history)
+            row.append("%.2f / %.2f" % (pos, ang))
+        pos, ang = evaluate_hold(trace, lead_ms / 1000.0)
+        row.append("%.2f / %.2f" % (pos, ang))
+        rows.append(row)
+    print("RMS error, position mm / angle deg, %d samples\n" % len(trace))
+    print_table(["lead", "velocity h=2", "velocity h=4", "acceleration h=5", "no prediction"],
+                rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# Reference copies of the code the scripts carried before alvr_freepie
+# existed. Benchmarks compare the shared implementation against these.
+#
+# Only change to the original code: quaternion2euler used the undefined
+# name M_PI in its gimbal-lock branch, math.pi is used here instead.
+#
+# benchmarks/legacy_scripts/ holds the original scripts themselves, with the
+# same change; benchmarks/regress_scripts.py generates golden outputs from
+# them.
+
+import math
+
+
+def conj(q):
+    return [-q[0], -q[1], -q[2], q[3]]
+
+def multiply(a, b):
+    x0, y0, z0, w0 = a
+    x1, y1, z1, w1 = b
+    return [x1 * w0 - y1 * z0 + z1 * y0 + w1 * x0,
+            x1 * z0 + y1 * w0 - z1 * x0 + w1 * y0,
+            -x1 * y0 + y1 * x0 + z1 * w0 + w1 * z0,
+            -x1 * x0 - y1 * y0 - z1 * z0 + w1 * w0]
+
+def quaternion2euler(q):
+    yaw_pitch_roll = [0.0, 0.0, 0.0]
+    # roll (x-axis rotation)
+    sinr = +2.0 * (q[3] * q[0] + q[1] * q[2])
+    cosr = +1.0 - 2.0 * (q[0] * q[0] + q[1] * q[1])
+    yaw_pitch_roll[2] = math.atan2(sinr, cosr)
+
+    # pitch (y-axis rotation)
+    sinp = +2.0 * (q[3] * q[1] - q[2] * q[0])
+    if (math.fabs(sinp) >= 1):
+        yaw_pitch_roll[1] = math.copysign(math.pi / 2, sinp)
+    else:
+        yaw_pitch_roll[1] = math.asin(sinp)
+
+    # yaw (z-axis rotation)
+    siny = +2.0 * (q[3] * q[2] + q[0] * q[1]);
+    cosy = +1.0 - 2.0 * (q[1] * q[1] + q[2] * q[2]);
+    yaw_pitch_roll[0] = math.atan2(siny, cosy);
+
+    return yaw_pitch_roll
+
+def euler2quaternion(yaw_pitch_roll):
+    cy = math.cos(yaw_pitch_roll[0] * 0.5);
+    sy = math.sin(yaw_pitch_roll[0] * 0.5);
+    cr = math.cos(yaw_pitch_roll[2] * 0.5);
+    sr = math.sin(yaw_pitch_roll[2] * 0.5);
+    cp = math.cos(yaw_pitch_roll[1] * 0.5);
+    sp = math.sin(yaw_pitch_roll[1] * 0.5);
+
+    return [cy * sr * cp - sy * cr * sp, # x
+    cy * cr * sp + sy * sr * cp,         # y
+    sy * cr * cp - cy * sr * sp,         # z
+    cy * cr * cp + sy * sr * sp]         # w
+
+def psm_euler2quaternion(yaw_pitch_roll):
+    cy = math.cos(yaw_pitch_roll[0] * 0.5);
+    sy = math.sin(yaw_pitch_roll[0] * 0.5);
+    cr = math.cos(yaw_pitch_roll[2] * 0.5);
+    sr = math.sin(yaw_pitch_roll[2] * 0.5);
+    cp = math.cos(yaw_pitch_roll[1] * 0.5);
+    sp = math.sin(yaw_pitch_roll[1] * 0.5);
+
+    return [cy * cr * sp + sy * sr * cp, # x
+    sy * cr * cp + cy * sr * sp,         # y
+    cy * sr * cp - sy * cr * sp,         # z
+    cy * cr * cp - sy * sr * sp]         # w
+
+def q_extract_axis(quat, axis):
+    q = [quat[0], quat[1], quat[2], quat[3]]
+    if axis == 0:
+        i = 1; j = 2;
+    elif axis == 1:
+        i = 0; j = 2;
+    elif axis == 2:
+        i = 0; j = 1;
+    else:
+        return q
+    q[i] = 0
+    q[j] = 0
+    mag = math.sqrt(q[3]*q[3] + q[axis]*q[axis])
+    q[axis] /= mag
+    q[3] /= mag
+    return q
+
+def rotatevec(yaw_pitch_roll, vec):
+    q = euler2quaternion(yaw_pitch_roll)
+    return multiply(multiply(q, vec), conj(q))
+
+def q_rotatevec(q, vec):
+    return multiply(multiply(q, vec), conj(q))
+
+def get_normalized_roll(yaw_pitch_roll):
+    q = euler2quaternion(yaw_pitch_roll)
+    q_norm = multiply(conj(q_extract_axis(q, 1)), q)
+    q_norm = multiply(conj(q_extract_axis(q, 2)), q_norm)
+    [yaw, pitch, roll] = quaternion2euler(q_norm)
+    return roll
+
+# calc_arm_model of go_single_psmove.py v3 with the alvr globals passed in and
+# a list returned instead of a .NET Array
+def calc_arm_model(controller_orientation, leftright, upper_arm_roll,
+                   head_orientation, head_position):
+    hand = [0.0, 0.0, -0.25 - 0.25*math.sin(upper_arm_roll), 0.0]
+    hand = rotatevec(controller_orientation, hand)
+    shoulder = [0.2*leftright, -0.10, -0.05]
+    roll = get_normalized_roll(controller_orientation)
+    if roll < 0.0:
+        arm_roll = upper_arm_roll + roll
+    else:
+        arm_roll = upper_arm_roll
+    if arm_roll < 0.0:
+        arm_roll = 0.0
+    elbow = rotatevec([0.0, 0.0, arm_roll], [0.0, -0.25, 0.0, 0.0])
+    elbow[0] += shoulder[0]
+    elbow[1] += shoulder[1]
+    elbow[2] += shoulder[2]
+    q_head_orientation = euler2quaternion(head_orientation)
+    q_head_pitch = q_extract_axis(q_head_orientation, 1)
+    elbow = q_rotatevec(q_head_pitch, elbow)
+    return [head_position[0] + elbow[0] + hand[0],
+            head_position[1] + elbow[1] + hand[1],
+            head_position[2] + elbow[2] + hand[2]]
+
+# PS Move button mapping of Go_Dual_PSMove_Plus_Head_6DOF.py v1 (updatePSMove)
+def map_dual_buttons(alvr, left_trigger, left_buttons, right_trigger, right_buttons):
+    alvr.trigger[0] = left_trigger
+    alvr.buttons[0][alvr.Id("application_menu")] = left_buttons & 0b00000001 > 0 # square
+    alvr.buttons[0][alvr.Id("back")]             = left_buttons & 0b00000010 > 0 # triangle
+    alvr.buttons[0][alvr.Id("grip")]             = left_buttons & 0b00000100 > 0 # cross
+    alvr.buttons[0][alvr.Id("start")]            = left_buttons & 0b00001000 > 0 # circle
+    alvr.buttons[0][alvr.Id("trackpad_click")]   = left_buttons & 0b00010000 > 0
+    alvr.buttons[0][alvr.Id("system")]           = left_buttons & 0b00100000 > 0 # PS btn
+    alvr.trigger[1] = right_trigger
+    alvr.buttons[1][alvr.Id("application_menu")] = right_buttons & 0b00000001 > 0 # square
+    alvr.buttons[1][alvr.Id("back")]             = right_buttons & 0b00000010 > 0 # triangle
+    alvr.buttons[1][alvr.Id("grip")]             = right_buttons & 0b00000100 > 0 # cross
+    alvr.buttons[1][alvr.Id("start")]            = right_buttons & 0b00001000 > 0 # circle
+    alvr.buttons[1][alvr.Id("trackpad_click")]   = right_buttons & 0b00010000 > 0
+    alvr.buttons[1][alvr.Id("system")]           = right_buttons & 0b00100000 > 0 # PS btn
+
+# PS Move button mapping of go_single_psmove.py v3 (updatePSMove) in default
+# mode; state is [g_buttons, g_selected_mode], mode_count len(g_mode_list)
+def map_single_buttons(alvr, trigger, buttons, state, mode_count):
+    alvr.buttons[1][alvr.Id("trigger")] = trigger
+    alvr.trigger[1] = trigger
+    alvr.buttons[1][alvr.Id("application_menu")] = buttons & 0b00000001 > 0 # square
+    alvr.buttons[1][alvr.Id("back")]             = buttons & 0b00000010 > 0 # triangle
+    alvr.buttons[1][alvr.Id("grip")]             = buttons & 0b00000100 > 0 # cross
+    alvr.buttons[1][alvr.Id("start")]            = buttons & 0b00001000 > 0 # circle
+    alvr.buttons[1][alvr.Id("trackpad_click")] = buttons & 0b00010000 > 0 # move btn
+    alvr.buttons[1][alvr.Id("system")]           = buttons & 0b00100000 > 0 # PS btn
+    if buttons & 0b10000000 > 0: # select
+        if state[0] & 0b10000000 == 0:
+            state[1] += 1
+            if state[1] >= mode_count:
+                state[1] = 0
+            alvr.message = "-> mode %d" % state[1]
+    else:
+        if state[0] & 0b10000000 > 0:
+            alvr.message = ""
+    state[0] = buttons
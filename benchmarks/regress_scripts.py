@@ -0,0 +1,492 @@
+# Golden output and performance regression suite for go_single_psmove.py
+# and Go_Dual_PSMove_Plus_Head_6DOF.py.
+#
+# Canonical traces are fed through both scripts in the headless runtime
+# (alvr_freepie.sim), 6 s at 120 Hz with PS Move samples at 60 Hz and ALVR
+# inputs at 72 Hz:
+#   motion   smooth synthetic motion, no buttons
+#   modes    select / move / trackpad sequences: fly mode with trackpad
+#            flying and the center click reset, arm mode with PS Move roll,
+#            default mode trackpad click, mapped buttons of both PS Moves
+#   gimbal   orientations held at and around +-90 degrees on every axis
+#            (PS Move yaw +-90 degrees reaches the gimbal lock branch of
+#            the euler conversion), and 180 degree flips
+#
+# Outputs: every alvr.* output (orientations, positions, buttons, trackpad,
+# triggers, override flags) is compared with benchmarks/golden/<script>.json
+# every CHECKPOINT_EVERY ticks (TOLERANCE, orientations modulo 2 pi), and
+# per output over all ticks through the sum and the total variation
+# (SUM_TOLERANCE; sines for orientations), so a difference in any tick
+# shows. alvr.message must change at the same ticks to the same text. Ticks
+# before START_TICK are left out: the scripts publish the first PS Move
+# sample only from the update event after `starting`.
+#
+# Every golden output is generated from the original scripts in
+# benchmarks/legacy_scripts/ (see benchmarks/legacy.py), so the goldens hold
+# the scripts to the code they replaced. One trace diverges from them on
+# purpose: in the modes trace of the single script, fly mode integrates a
+# speed over time (alvr_freepie.locomotion) instead of moving 2 mm per tick.
+# For that trace (VIEWS) the outputs are compared with the head position
+# left out and the controller positions taken relative to the head position
+# of the previous tick, which the arm model starts from. The head position
+# is checked against its own reference instead (REFERENCES): the input head
+# position plus a fly offset integrated in FLY_SUBSTEPS steps per tick from
+# the fly settings of the profile, with the fly mode taken from the original
+# script, within FLY_TOLERANCE meters on every tick.
+#
+# Performance: mean tick time in units of a fixed pure Python reference
+# workload (so the baseline carries over between machines of different
+# speed) and peak / retained bytes allocated per tick (tracemalloc) are
+# compared with benchmarks/golden/baseline.json; more than TIME_SLACK times
+# the baseline time or ALLOC_SLACK bytes more allocation fails.
+#
+# Exits with status 1 on any difference or regression.
+#
+#   python -m benchmarks.regress_scripts [--skip-perf]
+#   python -m benchmarks.regress_scripts --update            # new golden outputs
+#   python -m benchmarks.regress_scripts --update-baseline   # new perf baseline
+
+import argparse
+import json
+import math
+import os
+import sys
+
+from alvr_freepie.pipeline import load_profile
+from alvr_freepie.buttons import (PSM_SQUARE, PSM_TRIANGLE, PSM_CROSS, PSM_CIRCLE, PSM_MOVE,
+    PSM_PS, PSM_SELECT)
+from alvr_freepie.sim import Runtime, INPUT_BUTTON_NAMES, synthetic_stream
+from benchmarks._bench import ns_per_op, print_table
+from benchmarks.legacy import rotatevec
+
+SCRIPTS = ("go_single_psmove.py", "Go_Dual_PSMove_Plus_Head_6DOF.py")
+TICK_RATE = 120.0
+IO_RATE = 60.0
+INPUT_RATE = 72.0
+TICKS = 720
+CHECKPOINT_EVERY = 12
+TOLERANCE = 1e-9
+SUM_TOLERANCE = 1e-6
+TIME_SLACK = 1.5
+TIME_REPEAT = 5
+ALLOC_SLACK = 256
+START_TICK = 4
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+LEGACY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "legacy_scripts")
+FLY_PROFILE = "profiles/single_psmove.json"
+FLY_SUBSTEPS = 64
+FLY_TOLERANCE = 1e-5
+BASELINE = os.path.join(GOLDEN_DIR, "baseline.json")
+
+# alvr outputs compared, in this order
+OUTPUT_ARRAYS = ("head_orientation", "head_position", "trigger")
+OUTPUT_ROWS = ("controller_orientation", "controller_position", "buttons", "trackpad")
+OUTPUT_FLAGS = ("two_controllers", "override_head_orientation", "override_head_position",
+                "override_controller_orientation", "override_controller_position")
+ANGLES = ("head_orientation", "controller_orientation")
+
+HALF_PI = 0.5 * math.pi
+_TRACKPAD_CLICK = INPUT_BUTTON_NAMES.index("trackpad_click")
+_TRACKPAD_TOUCH = INPUT_BUTTON_NAMES.index("trackpad_touch")
+_BACK = INPUT_BUTTON_NAMES.index("back")
+
+
+# --- traces -------------------------------------------------------------------
+
+def motion_trace():
+    return synthetic_stream(TICK_RATE, IO_RATE, seed=0, input_rate=INPUT_RATE)
+
+# (start, end, bit) in seconds of the held PS Move buttons (slot 3 x / y)
+# and (start, end, input button index) of the Go controller
+LEFT_PRESSES = ((0.2, 0.3, PSM_SQUARE), (0.5, 0.6, PSM_SELECT), (1.0, 2.5, PSM_MOVE),
+                (2.6, 2.7, PSM_PS), (3.0, 3.1, PSM_SELECT), (3.3, 4.5, PSM_MOVE),
+                (4.8, 4.9, PSM_SELECT), (5.2, 5.5, PSM_MOVE), (5.6, 5.7, PSM_CROSS))
+RIGHT_PRESSES = ((1.5, 1.7, PSM_TRIANGLE), (3.5, 3.6, PSM_CIRCLE), (4.0, 4.2, PSM_MOVE))
+INPUT_PRESSES = ((0.8, 0.9, _BACK), (1.2, 2.0, _TRACKPAD_TOUCH), (2.1, 2.2, _TRACKPAD_CLICK),
+                 (5.3, 5.4, _TRACKPAD_CLICK))
+
+def _mask(presses, t):
+    mask = 0
+    for start, end, bit in presses:
+        if start <= t < end:
+            mask |= bit
+    return mask
+
+def modes_trace():
+    motion = motion_trace()
+    inputs = [False] * len(INPUT_BUTTON_NAMES)
+
+    def stream(runtime, tick):
+        fired = motion(runtime, tick)
+        t = tick / TICK_RATE
+        slot3 = runtime.freepie_io[3]
+        slot3.x = float(_mask(LEFT_PRESSES, t))
+        slot3.y = float(_mask(RIGHT_PRESSES, t))
+        for i in range(len(inputs)):
+            inputs[i] = False
+        for start, end, index in INPUT_PRESSES:
+            if start <= t < end:
+                inputs[index] = True
+        runtime.alvr.input_buttons.load(inputs)
+        # fly forward, then backward, while the trackpad is touched
+        runtime.alvr.input_trackpad.load([0.0, 0.8 if t < 1.6 else -0.5])
+        return fired
+
+    return stream
+
+# raw PS Move [yaw, pitch, roll] and ALVR euler inputs cycled through
+PSM_POSES = ((HALF_PI, 0.0, 0.0), (-HALF_PI, 0.0, 0.0), (HALF_PI, HALF_PI, 0.0),
+             (0.0, HALF_PI, 0.0), (0.0, -HALF_PI, 0.0), (0.0, 0.0, HALF_PI),
+             (0.0, 0.0, -HALF_PI), (math.pi, 0.0, 0.0), (HALF_PI, 0.0, math.pi),
+             (-HALF_PI, HALF_PI, HALF_PI), (HALF_PI - 1e-9, 0.0, 0.0),
+             (HALF_PI + 1e-9, 0.0, 0.0))
+INPUT_POSES = ((HALF_PI, 0.0, 0.0), (-HALF_PI, 0.0, 0.0), (0.0, HALF_PI, 0.0),
+               (0.0, -HALF_PI, 0.0), (0.0, 0.0, HALF_PI), (0.0, 0.0, -HALF_PI),
+               (HALF_PI, HALF_PI, 0.0), (0.0, math.pi, 0.0), (math.pi, 0.0, math.pi),
+               (HALF_PI - 1e-9, 0.3, 0.0), (0.2, -HALF_PI, 0.4), (0.0, 0.0, 0.0))
+POSE_TICKS = 30
+
+def gimbal_trace():
+    motion = motion_trace()
+
+    def stream(runtime, tick):
+        fired = motion(runtime, tick)
+        k = tick // POSE_TICKS
+        if fired:
+            for device in range(3):
+                yaw, pitch, roll = PSM_POSES[(k + 4 * device) % len(PSM_POSES)]
+                io = runtime.freepie_io[device]
+                io.yaw = yaw
+                io.pitch = pitch
+                io.roll = roll
+        alvr = runtime.alvr
+        alvr.input_head_orientation.load(INPUT_POSES[k % len(INPUT_POSES)])
+        alvr.input_controller_orientation.load(INPUT_POSES[(k + 5) % len(INPUT_POSES)])
+        return fired
+
+    return stream
+
+TRACES = (("motion", motion_trace), ("modes", modes_trace), ("gimbal", gimbal_trace))
+
+
+# --- outputs ------------------------------------------------------------------
+
+def output_names():
+    names = []
+    for name in OUTPUT_ARRAYS:
+        names.extend("%s[%d]" % (name, i) for i in range(_SIZES[name]))
+    for name in OUTPUT_ROWS:
+        for row in (0, 1):
+            names.extend("%s[%d][%d]" % (name, row, i) for i in range(_SIZES[name]))
+    names.extend(OUTPUT_FLAGS)
+    return names
+
+def _sizes():
+    from alvr_freepie.sim import FakeAlvr
+    alvr = FakeAlvr()
+    sizes = dict((name, len(getattr(alvr, name))) for name in OUTPUT_ARRAYS)
+    sizes.update((name, len(getattr(alvr, name)[0])) for name in OUTPUT_ROWS)
+    return sizes
+
+_SIZES = _sizes()
+
+# whether each output (in output_names order) is an angle
+def angle_flags():
+    flags = []
+    for name in OUTPUT_ARRAYS:
+        flags.extend([name in ANGLES] * _SIZES[name])
+    for name in OUTPUT_ROWS:
+        flags.extend([name in ANGLES] * (2 * _SIZES[name]))
+    flags.extend([False] * len(OUTPUT_FLAGS))
+    return flags
+
+# alvr outputs as floats, in output_names order
+def outputs(alvr):
+    values = []
+    for name in OUTPUT_ARRAYS:
+        values.extend(float(v) for v in getattr(alvr, name))
+    for name in OUTPUT_ROWS:
+        for row in getattr(alvr, name):
+            values.extend(float(v) for v in row)
+    values.extend(float(getattr(alvr, name)) for name in OUTPUT_FLAGS)
+    return values
+
+def _wrap(d):
+    return (d + math.pi) % (2.0 * math.pi) - math.pi
+
+# run trace through script (a path); returns its golden record. view:
+# function(values, values of the previous tick) returning the values
+# compared (VIEWS)
+def capture(script, trace, view=None):
+    runtime = Runtime(script, trace(), record=False)
+    angles = angle_flags()
+    checkpoints = []
+    messages = []
+    sums = [0.0] * len(angles)
+    variation = [0.0] * len(angles)
+    previous = None
+    last = None
+    message = ""
+    for tick in range(TICKS + 1):
+        runtime.tick()
+        values = outputs(runtime.alvr)
+        if view is not None:
+            values, last = view(values, last), values
+        if tick < START_TICK:
+            continue
+        for i, value in enumerate(values):
+            if angles[i]:
+                sums[i] += math.sin(value)
+                if previous is not None:
+                    variation[i] += abs(_wrap(value - previous[i]))
+            else:
+                sums[i] += value
+                if previous is not None:
+                    variation[i] += abs(value - previous[i])
+        previous = values
+        if tick % CHECKPOINT_EVERY == 0:
+            checkpoints.append([tick, values])
+        if runtime.alvr.message != message:
+            message = runtime.alvr.message
+            messages.append([tick, message])
+    return {"checkpoints": checkpoints, "sums": sums, "variation": variation,
+            "messages": messages}
+
+
+# --- deliberate divergence ----------------------------------------------------
+
+def _output_index(name):
+    return output_names().index(name)
+
+# head position left out, controller positions relative to the head
+# position of the previous tick
+def fly_view(values, last):
+    head = _output_index("head_position[0]")
+    values = list(values)
+    for row in (0, 1):
+        position = _output_index("controller_position[%d][0]" % row)
+        for i in range(3):
+            values[position + i] -= last[head + i] if last is not None else 0.0
+    values[head:head + 3] = [0.0, 0.0, 0.0]
+    return values
+
+# speed after dt seconds towards target, and the distance covered, in
+# FLY_SUBSTEPS steps: speeding up at acceleration, slowing down (and through
+# 0 when the direction flips) at deceleration
+def _fly_advance(fly, speed, target, dt):
+    distance = 0.0
+    h = dt / FLY_SUBSTEPS
+    for _ in range(FLY_SUBSTEPS):
+        start = speed
+        if speed * target < 0.0 or abs(target) < abs(speed):
+            rate = fly["deceleration"]
+        else:
+            rate = fly["acceleration"]
+        if abs(target - speed) <= rate * h:
+            speed = target
+        else:
+            speed += rate * h if target > speed else -rate * h
+        distance += 0.5 * (start + speed) * h
+    return speed, distance
+
+def _fly_target(fly, axis):
+    magnitude = abs(axis)
+    if magnitude <= fly["dead_zone"]:
+        return 0.0
+    speed = fly["max_speed"] * (min((magnitude - fly["dead_zone"]) / (1.0 - fly["dead_zone"]),
+                                    1.0) ** fly["exponent"])
+    return math.copysign(speed, axis)
+
+# problems of the head position of script in the modes trace against the
+# input head position plus the reference fly offset; the fly mode of each
+# tick comes from the original script run side by side
+def check_fly(script, trace):
+    fly = load_profile(FLY_PROFILE)["modes"]["fly"]
+    runtime = Runtime(script, trace(), record=False)
+    legacy = Runtime(os.path.join(LEGACY_DIR, script), trace(), record=False)
+    touch = INPUT_BUTTON_NAMES.index("trackpad_touch")
+    offset = [0.0, 0.0, 0.0]
+    speed = 0.0
+    target = None
+    for tick in range(TICKS + 1):
+        runtime.tick()
+        legacy.tick()
+        alvr = runtime.alvr
+        if legacy.globals["g_active_mode"] == legacy.globals["MODE_FLY"]:
+            if target is not None:
+                direction = rotatevec(list(alvr.input_controller_orientation), [0, 0, -1, 0])
+                speed, distance = _fly_advance(fly, speed, target, 1.0 / TICK_RATE)
+                for i in range(3):
+                    offset[i] += distance * direction[i]
+            touched = alvr.input_buttons[touch]
+            target = _fly_target(fly, alvr.input_trackpad[1]) if touched else 0.0
+            if alvr.input_buttons[_TRACKPAD_CLICK]:
+                offset = [0.0, 0.0, 0.0]
+                speed = 0.0
+        else:
+            speed = 0.0
+            target = None
+        if tick < START_TICK:
+            continue
+        for i in range(3):
+            if abs(alvr.head_position[i] - alvr.input_head_position[i] - offset[i]) > FLY_TOLERANCE:
+                return ["tick %d alvr.head_position[%d]: %r, reference %r"
+                        % (tick, i, alvr.head_position[i],
+                           alvr.input_head_position[i] + offset[i])]
+    return []
+
+# (script, trace) pairs compared in a view, and the check of what it leaves out
+VIEWS = {("go_single_psmove.py", "modes"): fly_view}
+REFERENCES = {("go_single_psmove.py", "modes"): check_fly}
+
+# differences between a captured record and its golden one, as text lines
+def compare(golden, actual, names):
+    angles = angle_flags()
+    problems = []
+    if len(golden["checkpoints"]) != len(actual["checkpoints"]):
+        return ["%d checkpoints, golden has %d" % (len(actual["checkpoints"]),
+                                                   len(golden["checkpoints"]))]
+    for (tick, expected), (_, values) in zip(golden["checkpoints"], actual["checkpoints"]):
+        for i, (a, b) in enumerate(zip(expected, values)):
+            d = _wrap(b - a) if angles[i] else b - a
+            if abs(d) > TOLERANCE:
+                problems.append("tick %d alvr.%s: %r, golden %r" % (tick, names[i], b, a))
+                break
+        if problems:
+            break
+    for key in ("sums", "variation"):
+        for i, (a, b) in enumerate(zip(golden[key], actual[key])):
+            if abs(b - a) > SUM_TOLERANCE:
+                problems.append("alvr.%s over all ticks (%s): %r, golden %r"
+                                % (names[i], key, b, a))
+                break
+    if golden["messages"] != actual["messages"]:
+        for expected, found in zip(golden["messages"] + [None] * len(actual["messages"]),
+                                   actual["messages"] + [None] * len(golden["messages"])):
+            if expected != found:
+                problems.append("alvr.message: %r, golden %r" % (found, expected))
+                break
+    return problems
+
+def golden_path(script):
+    return os.path.join(GOLDEN_DIR, os.path.splitext(script)[0] + ".json")
+
+# value as JSON text: objects with one key per line (sorted), lists of
+# lists with one item per line, so a golden diff shows the changed ticks
+def _json_text(value, indent=""):
+    inner = indent + " "
+    if isinstance(value, dict):
+        items = ["%s%s: %s" % (inner, json.dumps(key), _json_text(value[key], inner))
+                 for key in sorted(value)]
+        return "{\n" + ",\n".join(items) + "\n" + indent + "}"
+    if isinstance(value, list) and value and isinstance(value[0], list):
+        return "[\n" + ",\n".join(inner + json.dumps(item) for item in value) + "\n" + indent + "]"
+    return json.dumps(value)
+
+def check_outputs(update):
+    names = output_names()
+    failed = []
+    for script in SCRIPTS:
+        path = golden_path(script)
+        if update:
+            records = dict((name, capture(os.path.join(LEGACY_DIR, script), trace,
+                                          VIEWS.get((script, name))))
+                           for name, trace in TRACES)
+            views = sorted(name for name, _ in TRACES if (script, name) in VIEWS)
+            with open(path, "w") as f:
+                f.write(_json_text({"script": script, "ticks": TICKS, "start_tick": START_TICK,
+                                    "outputs": names, "view_traces": views,
+                                    "traces": records}) + "\n")
+            print("wrote " + os.path.relpath(path))
+            continue
+        with open(path) as f:
+            golden = json.load(f)
+        for name, trace in TRACES:
+            problems = compare(golden["traces"][name],
+                               capture(script, trace, VIEWS.get((script, name))), names)
+            reference = REFERENCES.get((script, name))
+            if reference is not None:
+                problems.extend(reference(script, trace))
+            print("%s %s / %s%s" % ("FAILED" if problems else "ok    ", script, name,
+                                    "".join("\n       " + p for p in problems)))
+            if problems:
+                failed.append("%s / %s" % (script, name))
+    return failed
+
+
+# --- performance --------------------------------------------------------------
+
+# fixed pure Python workload the tick times are measured in
+def reference():
+    x = 0.0
+    values = [0.0] * 16
+    for i in range(64):
+        values[i & 15] = math.sin(i * 0.01) * 1.0001
+        x += values[(i * 7) & 15]
+    return x
+
+# the reference is timed next to every run, so a slow spell of the machine
+# scales both
+def measure(script, trace):
+    tick_us = float("inf")
+    tick_units = float("inf")
+    for _ in range(TIME_REPEAT):
+        reference_ns = ns_per_op(reference, number=500, repeat=3)
+        report = Runtime(script, trace(), record=False).run(TICKS)
+        us = 1e6 * sum(report.tick_times) / len(report.tick_times)
+        tick_us = min(tick_us, us)
+        tick_units = min(tick_units, us * 1e3 / reference_ns)
+    report = Runtime(script, trace(), record=False).run(TICKS, trace_alloc=True)
+    ticks = float(len(report.alloc_bytes))
+    return {"tick_us": tick_us, "tick_units": tick_units,
+            "alloc_bytes": sum(report.alloc_bytes) / ticks,
+            "retained_bytes": sum(report.retained_bytes) / ticks}
+
+def check_perf(update):
+    runs = {}
+    for script in SCRIPTS:
+        for name, trace in TRACES:
+            runs["%s / %s" % (script, name)] = measure(script, trace)
+    if update:
+        with open(BASELINE, "w") as f:
+            json.dump({"runs": runs}, f, indent=1, sort_keys=True)
+        print("wrote " + os.path.relpath(BASELINE))
+        return []
+    with open(BASELINE) as f:
+        baseline = json.load(f)["runs"]
+    rows = []
+    failed = []
+    for key in sorted(runs):
+        run = runs[key]
+        base = baseline[key]
+        slow = run["tick_units"] > TIME_SLACK * base["tick_units"]
+        allocates = (run["alloc_bytes"] > base["alloc_bytes"] + ALLOC_SLACK or
+                     run["retained_bytes"] > base["retained_bytes"] + ALLOC_SLACK)
+        if slow or allocates:
+            failed.append(key)
+        rows.append((key, run["tick_us"], run["tick_units"] / base["tick_units"],
+                     run["alloc_bytes"], base["alloc_bytes"], run["retained_bytes"],
+                     "FAILED" if slow or allocates else "ok"))
+    print("")
+    print_table(["script / trace", "us/tick", "time vs baseline", "alloc B/tick", "baseline",
+                 "retained B/tick", ""], rows)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--update", action="store_true", help="rewrite the golden outputs")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="rewrite the performance baseline")
+    parser.add_argument("--skip-perf", action="store_true")
+    args = parser.parse_args()
+    failed = check_outputs(args.update)
+    if not args.skip_perf or args.update_baseline:
+        failed.extend(check_perf(args.update_baseline))
+    if failed:
+        print("")
+        print("FAILED: " + ", ".join(failed))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
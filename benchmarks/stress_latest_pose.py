@@ -0,0 +1,179 @@
+# LatestPose under a concurrent writer: torn reads and staleness.
+#
+# A producer thread publishes samples whose six fields all equal the sample
+# number. A read is torn when its fields disagree. Two runs per buffer:
+#   tearing    1 kHz producer, the reader runs flat out and every field
+#              write of the producer yields the thread (time.sleep(0)), so
+#              the reader regularly runs in the middle of a publish.
+#              CPython's GIL would otherwise hardly ever switch inside
+#              straight-line code.
+#              An unprotected list must tear here (or the run proves
+#              nothing); LatestPose must not.
+#   staleness  1 kHz producer, 90 Hz reader as in FreePIE. A read must never
+#              return a sample older than the newest one published
+#              completely before the read started. Reported: the age of
+#              the read sample (p99 / max) and by how much the newest
+#              sample at the end of the read is newer (max, ms).
+# Exits with status 1 if LatestPose returned a torn or an out-of-date sample,
+# or the unprotected list never tore.
+#
+#   python -m benchmarks.stress_latest_pose [--seconds 3]
+
+import argparse
+import sys
+import threading
+import time
+
+from alvr_freepie.latest import LatestPose
+from benchmarks._bench import print_table
+
+PRODUCER_RATE = 1000.0
+READER_RATE = 90.0
+
+
+class NaivePose(object):
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = [0.0] * 7
+
+    def publish(self, t, pose):
+        data = self.data
+        data[0] = t
+        data[1] = pose[0]
+        data[2] = pose[1]
+        data[3] = pose[2]
+        data[4] = pose[3]
+        data[5] = pose[4]
+        data[6] = pose[5]
+
+    def read_into(self, out, stamp):
+        data = self.data
+        stamp[0] = data[0]
+        out[0] = data[1]
+        out[1] = data[2]
+        out[2] = data[3]
+        out[3] = data[4]
+        out[4] = data[5]
+        out[5] = data[6]
+        return 1
+
+
+# sample list that hands the GIL to other threads on every write
+class YieldingList(list):
+
+    def __setitem__(self, index, value):
+        list.__setitem__(self, index, value)
+        time.sleep(0)
+
+
+def latest_pose(yielding):
+    buffer = LatestPose()
+    if yielding:
+        buffer._data = YieldingList(buffer._data)
+    return buffer
+
+def naive_pose(yielding):
+    buffer = NaivePose()
+    if yielding:
+        buffer.data = YieldingList(buffer.data)
+    return buffer
+
+# published: [number, time] of the last completely published sample
+def producer(buffer, stop, published):
+    pose = [0.0] * 6
+    k = 0
+    period = 1.0 / PRODUCER_RATE
+    next_t = time.perf_counter()
+    while not stop.is_set():
+        k += 1
+        value = float(k)
+        for i in (0, 1, 2, 3, 4, 5):
+            pose[i] = value
+        t = time.perf_counter()
+        buffer.publish(t, pose)
+        published[1] = t
+        published[0] = k
+        next_t += period
+        delay = next_t - time.perf_counter()
+        if delay > 0.0:
+            time.sleep(delay)
+
+# (reads, torn, out of date, age p99 ms, age max ms, max ms behind newest);
+# spin: the reader runs flat out instead of at READER_RATE
+def stress(buffer, seconds, spin):
+    stop = threading.Event()
+    published = [0, 0.0]
+    thread = threading.Thread(target=producer, args=(buffer, stop, published))
+    thread.start()
+    out = [0.0] * 6
+    stamp = [0.0, 0]
+    reads = 0
+    torn = 0
+    out_of_date = 0
+    behind = 0.0
+    ages = []
+    period = 1.0 / READER_RATE
+    end = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < end:
+            newest = published[0]
+            if buffer.read_into(out, stamp):
+                now = time.perf_counter()
+                reads += 1
+                if out.count(out[0]) != 6:
+                    torn += 1
+                elif out[0]:
+                    if out[0] < newest:
+                        out_of_date += 1
+                    behind = max(behind, published[1] - stamp[0])
+                    ages.append(now - stamp[0])
+            if not spin:
+                time.sleep(period)
+    finally:
+        stop.set()
+        thread.join()
+    ages.sort()
+    if ages:
+        p99 = ages[int(0.99 * (len(ages) - 1))] * 1e3
+        worst = ages[-1] * 1e3
+    else:
+        p99 = worst = 0.0
+    return reads, torn, out_of_date, p99, worst, behind * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    if hasattr(sys, "setswitchinterval"):
+        sys.setswitchinterval(1e-6)
+
+    rows = []
+    failed = []
+    for run, spin in (("tearing", True), ("staleness", False)):
+        for name, make in (("LatestPose", latest_pose), ("unprotected list", naive_pose)):
+            buffer = make(spin)
+            result = stress(buffer, args.seconds, spin)
+            reads, torn, out_of_date = result[:3]
+            retries = buffer.retries if name == "LatestPose" else "-"
+            rows.append((run, name, reads, torn, retries, out_of_date) + result[3:])
+            if name == "LatestPose":
+                if torn:
+                    failed.append("LatestPose returned %d torn samples (%s)" % (torn, run))
+                if out_of_date:
+                    failed.append("LatestPose returned %d out-of-date samples (%s)"
+                                  % (out_of_date, run))
+            elif spin and not torn:
+                failed.append("the unprotected list never tore, the tearing run proves nothing")
+    print_table(["run", "buffer", "reads", "torn", "retries", "out of date", "age p99 ms",
+                 "age max ms", "behind newest ms"], rows)
+    if failed:
+        print("")
+        for reason in failed:
+            print("FAILED: " + reason)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
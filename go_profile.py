@@ -0,0 +1,76 @@
+#           _ __      _______    ______             _____ _____ ______ 
+#     /\   | |\ \    / /  __ \  |  ____|           |  __ \_   _|  ____|
+#    /  \  | | \ \  / /| |__) | | |__ _ __ ___  ___| |__) || | | |__   
+#   / /\ \ | |  \ \/ / |  _  /  |  __| '__/ _ \/ _ \  ___/ | | |  __|  
+#  / ____ \| |___\  /  | | \ \  | |  | | |  __/  __/ |    _| |_| |____ 
+# /_/    \_\______\/   |_|  \_\ |_|  |_|  \___|\___|_|   |_____|______|
+#
+# Any controller layout, described by a profile (see profiles/ and
+# alvr_freepie/pipeline.py):
+#  - profiles/single_psmove.json         Oculus Go controller + PS Move
+#                                        (same as go_single_psmove.py)
+#  - profiles/gear_vr_single_psmove.ini  Gear VR controller + PS Move
+#  - profiles/dual_psmove_head.json      2 PS Moves + PS Move on the head
+#                                        (same as Go_Dual_PSMove_Plus_Head_6DOF.py)
+#
+# v1
+#  - initial script
+#
+
+from alvr_freepie.pipeline import load_profile, compile_profile
+from alvr_freepie.transport import TrackerReader
+from alvr_freepie.latch import LateLatch
+from alvr_freepie.clock import monotonic
+
+# profile file, absolute or relative to FreePIE's working directory
+PROFILE = "profiles/single_psmove.json"
+
+# set to a file name to record the tracker input of every tick
+# (replay with: python -m alvr_freepie.sim <script> --replay <file>)
+RECORD_SESSION = ""
+
+# read the PS Moves from this tracker transport file (see
+# alvr_freepie.transport) instead of freePieIO
+TRACKER_TRANSPORT = ""
+
+# publish the poses LATE_LATCH_MARGIN seconds before the next headset frame
+# (see alvr_freepie.latch): the tick before that point waits for it
+LATE_LATCH = False
+LATE_LATCH_MARGIN = 0.002
+
+# time the script stages and print p50/p99/max to the FreePIE console every
+# INSTRUMENT_REPORT seconds
+INSTRUMENT = False
+INSTRUMENT_REPORT = 5.0
+# show the head and controller outputs in the watch panel every n-th tick,
+# 0 = off
+WATCH_EVERY = 0
+
+if starting:
+    g_latch = None
+    if LATE_LATCH:
+        g_latch = LateLatch(LATE_LATCH_MARGIN)
+    
+    # PS Move input: freePieIO or the tracker transport
+    g_transport = None
+    g_io = freePieIO
+    if TRACKER_TRANSPORT:
+        g_transport = TrackerReader(TRACKER_TRANSPORT)
+        g_io = g_transport.freepie_io
+    
+    g_pipeline = compile_profile(load_profile(PROFILE), alvr, g_io, diagnostics,
+                                 RECORD_SESSION, INSTRUMENT, INSTRUMENT_REPORT, WATCH_EVERY,
+                                 g_transport.samples if g_transport else None)
+    
+    # add update function for PS Move controllers
+    g_io[0].update += g_pipeline.update
+
+if g_latch:
+    g_latch.wait(monotonic(), alvr.input_head_orientation)
+if g_transport:
+    g_transport.poll()
+g_pipeline.tick()
+if stopping:
+    g_pipeline.stop()
+if g_latch:
+    g_latch.probe(monotonic(), alvr.input_head_orientation)